@@ -2,5 +2,7 @@ from .lexer import Lexer
 from .parser import Parser
 from .uhigh import UHighCompiler
 from .build import build_project
+from .bytecode import assemble, load_bytecode
+from .incremental import IncrementalParser, TextEdit
 
 # ...existing code...
\ No newline at end of file
@@ -0,0 +1,212 @@
+import re
+from typing import List, Dict, Optional, Tuple
+from parser import ASTNode, VarDecl, ConstDecl, Assignment, Print, IfStatement, WhileStatement, FuncDecl, FuncCall, InlineAsm, Input
+from symbols import SymbolTable
+from layout import reachable
+from ir import WORD
+
+STRING_LITERAL = re.compile(r'"[^"]*"')
+VARIABLE_REGISTERS = 11  # R0..R10 hold a function's variables; R11..R14 are left for expression temporaries
+
+# Markers queued around nested blocks so the walk sees where each block scope begins and ends
+ENTER_BLOCK = 'enter'
+EXIT_BLOCK = 'exit'
+
+class ScopeInfo:
+    """Strings and declarations of one code generation unit."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.strings: Dict[str, int] = {}  # string -> offset in the unit's data
+        self.data_size = 0
+        self.variables: List[str] = []     # names declared in this scope, in order
+        self.constants: List[str] = []
+        self.frame_slots = 0               # Peak frame slots of a function's block-scoped locals
+        self.static_frame = False          # The frame can live at a fixed address: the function is never re-entered
+        self.calls: List[str] = []         # Functions called by name
+        self.inline_asm = False
+        self.initial_values: Dict[int, int] = {}  # Global cell offset -> constant a top-level declaration stores there
+
+    def add_string(self, literal: str):
+        text = literal[1:-1]  # Remove quotes
+        if text not in self.strings:
+            # Allocate memory based on string length (add 1 for null terminator)
+            self.strings[text] = self.data_size
+            self.data_size += len(text) + 1
+
+    def add_call(self, call: FuncCall):
+        self.calls.append(call.name)
+        for arg in call.args:
+            if is_string(arg):
+                self.add_string(arg)
+
+    def declare(self, name: str):
+        if name not in self.variables:
+            self.variables.append(name)
+
+class ProgramInfo:
+    """Tables shared by every unit: top-level variables and function signatures.
+
+    Top-level variables live in static data cells, one word each: `globals` maps
+    a name to its cell's offset in the program's globals area.
+    """
+
+    def __init__(self):
+        self.globals: Dict[str, int] = {}
+        self.const_variables: Dict[str, bool] = {}
+        self.functions: Dict[str, List[str]] = {}  # function name -> parameter names
+
+class SemanticInfo:
+    def __init__(self, program: ProgramInfo, scopes: List[ScopeInfo]):
+        self.program = program
+        self.scopes = scopes
+
+def is_string(value) -> bool:
+    return isinstance(value, str) and value.startswith('"')
+
+def collect_globals(units: List[Tuple[str, List[ASTNode]]], program: ProgramInfo):
+    """Give every top-level declaration a cell first, so function units know which names are global."""
+    for name, statements in units:
+        if name != 'global':
+            continue
+        pending = list(reversed(statements))
+        while pending:
+            node = pending.pop()
+            if isinstance(node, (VarDecl, ConstDecl)):
+                if node.name not in program.globals:
+                    program.globals[node.name] = WORD * len(program.globals)
+                if isinstance(node, ConstDecl):
+                    program.const_variables[node.name] = True
+            elif isinstance(node, IfStatement):
+                pending.extend(reversed(node.false_block or []))
+                pending.extend(reversed(node.true_block))
+            elif isinstance(node, WhileStatement):
+                pending.extend(reversed(node.body))
+
+def analyze(units: List[Tuple[str, List[ASTNode]]]) -> SemanticInfo:
+    """Walk every unit once, recording strings, declarations, frame sizes and function signatures.
+
+    Code generation reads these tables instead of rescanning blocks, so the cost
+    of analysis stays linear in the size of the program.
+    """
+    program = ProgramInfo()
+    collect_globals(units, program)
+    scopes = []
+    for name, statements in units:
+        scope = ScopeInfo(name)
+        scopes.append(scope)
+        top_level = name == 'global'
+        # Replays the declarations code generation will make, to size the function's frame
+        symbols = SymbolTable(VARIABLE_REGISTERS)
+        pending = list(reversed(statements))
+        while pending:
+            node = pending.pop()
+            if node is ENTER_BLOCK:
+                symbols.enter()
+            elif node is EXIT_BLOCK:
+                symbols.exit()
+            elif isinstance(node, Print):
+                for value in node.values:
+                    if is_string(value):
+                        scope.add_string(value)
+            elif isinstance(node, FuncCall):
+                scope.add_call(node)
+            elif isinstance(node, InlineAsm):
+                scope.inline_asm = True
+            elif isinstance(node, (VarDecl, ConstDecl)):
+                scope.declare(node.name)
+                if isinstance(node, ConstDecl):
+                    scope.constants.append(node.name)
+                if not top_level and node.name not in program.globals:
+                    symbols.declare(node.name)
+                if isinstance(node, VarDecl) and is_string(node.initial_value):
+                    scope.add_string(node.initial_value)
+                if isinstance(node, VarDecl) and isinstance(node.initial_value, FuncCall):
+                    scope.add_call(node.initial_value)
+            elif isinstance(node, Assignment):
+                if is_string(node.value):
+                    scope.add_string(node.value)
+                elif isinstance(node.value, FuncCall):
+                    scope.add_call(node.value)
+            elif isinstance(node, IfStatement):
+                for literal in STRING_LITERAL.findall(str(node.condition)):
+                    scope.add_string(literal)
+                for block in (node.false_block, node.true_block):
+                    if block:
+                        pending.extend([EXIT_BLOCK, *reversed(block), ENTER_BLOCK])
+            elif isinstance(node, WhileStatement):
+                pending.extend([EXIT_BLOCK, *reversed(node.body), ENTER_BLOCK])
+            elif isinstance(node, FuncDecl):
+                program.functions[node.name] = list(node.parameters)
+                for param in node.parameters:
+                    scope.declare(param)
+                    symbols.declare(param)
+                pending.extend(reversed(node.body))
+        scope.frame_slots = symbols.slots_used
+    mark_static_frames(scopes)
+    mark_initial_values(units, program, scopes)
+    return SemanticInfo(program, scopes)
+
+def constant_value(node: ASTNode) -> Optional[int]:
+    value = node.value if isinstance(node, ConstDecl) else getattr(node, 'initial_value', None)
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return int(value)
+    return None
+
+def mark_initial_values(units: List[Tuple[str, List[ASTNode]]], program: ProgramInfo, scopes: List[ScopeInfo]):
+    """Record the globals whose value at entry to main is known at compile time.
+
+    A global qualifies when an unconditional top-level declaration stores a
+    constant in it and nothing else that runs before main stores to it: no
+    other top-level statement, nor any function if top-level code makes calls.
+    """
+    stores = {'global': {}, 'functions': {}}  # Store counts by name, in top-level code and in function bodies
+    top_level_calls = False
+    for name, statements in units:
+        counts = stores['global' if name == 'global' else 'functions']
+        pending = list(statements)
+        while pending:
+            node = pending.pop()
+            if isinstance(node, (VarDecl, ConstDecl, Assignment, Input)):
+                counts[node.name] = counts.get(node.name, 0) + 1
+            if isinstance(node, FuncCall) or isinstance(getattr(node, 'value', None), FuncCall) \
+                    or isinstance(getattr(node, 'initial_value', None), FuncCall):
+                top_level_calls = top_level_calls or name == 'global'
+            elif isinstance(node, IfStatement):
+                pending.extend(node.true_block + (node.false_block or []))
+            elif isinstance(node, WhileStatement):
+                pending.extend(node.body)
+            elif isinstance(node, FuncDecl):
+                pending.extend(node.body)
+    written = stores['global']
+    if top_level_calls:
+        written = {name: count + stores['functions'].get(name, 0) for name, count in written.items()}
+    for (name, statements), scope in zip(units, scopes):
+        if name != 'global':
+            continue
+        for node in statements:
+            if isinstance(node, (VarDecl, ConstDecl)) and written[node.name] == 1 and constant_value(node) is not None:
+                scope.initial_values[program.globals[node.name]] = constant_value(node)
+
+def mark_static_frames(scopes: List[ScopeInfo]):
+    """Let a function keep its spilled locals at a fixed address when it can never be entered again while active.
+
+    That needs every function it may reach to be defined once in this program,
+    free of inline assembly (which can call anything) and not to lead back to it.
+    Called functions from other files, or recursion, keep the frame on the stack.
+    """
+    functions: Dict[str, ScopeInfo] = {}
+    defined_twice = set()
+    for scope in scopes:
+        if scope.name != 'global':
+            if scope.name in functions:
+                defined_twice.add(scope.name)
+            functions[scope.name] = scope
+    calls = {name: set(scope.calls) for name, scope in functions.items()}
+    for name, scope in functions.items():
+        if not scope.frame_slots or scope.inline_asm or name in defined_twice:
+            continue
+        reached = reachable(calls, name)
+        if name not in reached and all(callee in functions and callee not in defined_twice
+                                       and not functions[callee].inline_asm for callee in reached):
+            scope.static_frame = True
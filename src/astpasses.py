@@ -0,0 +1,100 @@
+"""Source-level rewrites applied to each code generation unit before analysis.
+
+Passes return new statement lists and never modify the nodes they are given:
+an editor may still hold the parsed program (see incremental.py). Nodes whose
+blocks change are copied.
+"""
+import copy
+from typing import Callable, List
+from parser import ASTNode, Print, IfStatement, WhileStatement, FuncDecl
+
+BLOCK_FIELDS = {
+    FuncDecl: ('body',),
+    WhileStatement: ('body',),
+    IfStatement: ('true_block', 'false_block'),
+}
+
+def map_blocks(statements: List[ASTNode], transform: Callable[[List[ASTNode]], List[ASTNode]]) -> List[ASTNode]:
+    """Apply transform to every statement list, innermost first, using an explicit stack."""
+    results = []  # Finished nodes and lists, consumed by the 'collect' and 'build' steps
+    work = [('list', statements)]
+    while work:
+        kind, item = work.pop()
+        if kind == 'list':
+            work.append(('collect', item))
+            work.extend(('node', node) for node in reversed(item))
+        elif kind == 'node':
+            fields = [field for field in BLOCK_FIELDS.get(type(item), ()) if isinstance(getattr(item, field), list)]
+            work.append(('build', (item, fields)))
+            work.extend(('list', getattr(item, field)) for field in reversed(fields))
+        elif kind == 'collect':
+            nodes = results[len(results) - len(item):]
+            del results[len(results) - len(item):]
+            new = transform(nodes)
+            same = len(new) == len(item) and all(a is b for a, b in zip(new, item))
+            results.append(item if same else new)
+        else:
+            node, fields = item
+            blocks = results[len(results) - len(fields):]
+            del results[len(results) - len(fields):]
+            if any(block is not getattr(node, field) for field, block in zip(fields, blocks)):
+                node = copy.copy(node)
+                for field, block in zip(fields, blocks):
+                    setattr(node, field, block)
+            results.append(node)
+    return results[0]
+
+def count_statements(statements: List[ASTNode]) -> int:
+    """Statements in a list and in every block nested in it."""
+    count = 0
+    pending = [statements]
+    while pending:
+        block = pending.pop()
+        count += len(block)
+        for node in block:
+            pending.extend(getattr(node, field) for field in BLOCK_FIELDS.get(type(node), ())
+                           if isinstance(getattr(node, field), list))
+    return count
+
+def constant_text(node: ASTNode):
+    """The raw string-literal text a print statement writes (without the newline), or None if it is not constant."""
+    if not isinstance(node, Print) or len(node.values) != 1:
+        return None
+    value = node.values[0]
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return str(int(value))
+    if isinstance(value, str) and value.startswith('"'):
+        text = value[1:-1]
+        # A NUL escape would end the pooled string early, and a trailing backslash would escape the separator
+        if '\\0' in text or (len(text) - len(text.rstrip('\\'))) % 2:
+            return None
+        return text
+    return None
+
+def merge_prints(statements: List[ASTNode]) -> List[ASTNode]:
+    result = []
+    run = []
+
+    def flush():
+        if len(run) > 1:
+            result.append(Print(['"' + '\\n'.join(constant_text(node) for node in run) + '"']))
+        else:
+            result.extend(run)
+        run.clear()
+
+    for statement in statements:
+        if constant_text(statement) is not None:
+            run.append(statement)
+        else:
+            flush()
+            result.append(statement)
+    flush()
+    return result
+
+def coalesce_prints(statements: List[ASTNode]) -> List[ASTNode]:
+    """Merge runs of adjacent prints of string and integer literals into one print of the joined text.
+
+    Each print writes its text and a newline, so the run's texts are joined with
+    `\\n` escapes and the last newline is left to the single remaining print.
+    """
+    return map_blocks(statements, merge_prints)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Run one MicroASM program over many input vectors in lock-step (needs NumPy).
+
+Every input vector is a lane. Registers are a (register, lane) int64 array and
+memory a (lane, byte) uint8 array, so one instruction is executed for a whole
+group of lanes with array operations. Each step runs the instruction at the
+lowest program counter among the running lanes. Lanes whose counter differs
+after a branch are masked out until the others reach the same counter again.
+
+Semantics follow src/vm.py with two differences: registers are 64-bit words
+that wrap instead of unbounded integers, and a lane that fails (division by
+zero, no input left, step budget) records its error and stops while the other
+lanes go on.
+
+    python3 src/batch.py program.masm inputs.txt
+"""
+import sys
+import argparse
+from typing import Iterable, List, Optional, Sequence, Union
+from masm import REGISTER_INDEX, parse_masm, parse_int, MasmProgram
+
+try:
+    import numpy as np
+except ImportError:  # Only the batch engine needs NumPy
+    np = None
+
+WORD = 8
+RUNNING, HALTED, FAILED = range(3)
+BINARY = {
+    'ADD': lambda a, b: a + b,
+    'SUB': lambda a, b: a - b,
+    'MUL': lambda a, b: a * b,
+    'AND': lambda a, b: a & b,
+    'OR': lambda a, b: a | b,
+    'XOR': lambda a, b: a ^ b,
+    'SHL': lambda a, b: a << b,
+    'SHR': lambda a, b: a >> b,
+}
+CONDITIONS = {
+    'JE': lambda flag: flag == 0,
+    'JNE': lambda flag: flag != 0,
+    'JL': lambda flag: flag < 0,
+    'JG': lambda flag: flag > 0,
+    'JLE': lambda flag: flag <= 0,
+    'JGE': lambda flag: flag >= 0,
+}
+
+class BatchMachine:
+    def __init__(self, program: Union[str, MasmProgram], lanes: Sequence[Iterable[int]],
+                 max_steps: int = 10_000_000, memory_size: int = 1 << 16):
+        if np is None:
+            raise RuntimeError("Batch execution requires NumPy (pip install numpy)")
+        self.program = parse_masm(program) if isinstance(program, str) else program
+        inputs = [list(vector) for vector in lanes]
+        count = len(inputs)
+        self.max_steps = max_steps
+        self.memory_size = memory_size
+        self.memory = np.zeros((count, memory_size), dtype=np.uint8)
+        self.registers = np.zeros((len(REGISTER_INDEX), count), dtype=np.int64)
+        self.registers[REGISTER_INDEX['RSP']] = memory_size
+        self.registers[REGISTER_INDEX['RBP']] = memory_size
+        self.heap = np.full(count, memory_size // 2, dtype=np.int64)
+        self.flag = np.zeros(count, dtype=np.int64)
+        self.pc = np.full(count, self.program.labels.get('main', 0), dtype=np.int64)
+        self.state = np.full(count, RUNNING, dtype=np.int8)
+        self.steps = np.zeros(count, dtype=np.int64)  # Instructions executed by each lane
+        self.exit_codes = np.zeros(count, dtype=np.int64)
+        self.issued = 0  # Lock-step instructions issued, however many lanes took part
+        self.inputs = np.zeros((count, max((len(v) for v in inputs), default=0)), dtype=np.int64)
+        for lane, vector in enumerate(inputs):
+            self.inputs[lane, :len(vector)] = vector
+        self.input_count = np.array([len(v) for v in inputs], dtype=np.int64)
+        self.input_pos = np.zeros(count, dtype=np.int64)
+        self.output: List[List[str]] = [[] for _ in range(count)]
+        self.errors: List[Optional[str]] = [None] * count
+        for addr, text in self.program.data:
+            raw = np.frombuffer(text.encode('utf-8') + b'\0', dtype=np.uint8)
+            self.memory[:, addr:addr + len(raw)] = raw
+
+    # Lane bookkeeping
+    def fail(self, lanes, message: str):
+        for lane in lanes.tolist():
+            self.errors[lane] = message
+        self.state[lanes] = FAILED
+
+    def keep(self, lanes, ok, message: str):
+        """Fail the lanes where `ok` is false and return the others."""
+        if ok.all():
+            return lanes
+        self.fail(lanes[~ok], message)
+        return lanes[ok]
+
+    # Operands
+    def value(self, arg: str, lanes):
+        name = arg[1:] if arg.startswith('$') else arg
+        if name in REGISTER_INDEX:
+            return self.registers[REGISTER_INDEX[name], lanes]
+        number = parse_int(name)
+        if number is None:
+            raise RuntimeError(f"Cannot read operand '{name}'")
+        return np.full(len(lanes), number, dtype=np.int64)
+
+    def register(self, arg: str) -> int:
+        if arg not in REGISTER_INDEX:
+            raise RuntimeError(f"Cannot write to operand '{arg}'")
+        return REGISTER_INDEX[arg]
+
+    def target(self, arg: str) -> int:
+        name = arg[1:] if arg.startswith('#') else arg
+        if name not in self.program.labels:
+            raise RuntimeError(f"Unknown label '{name}'")
+        return self.program.labels[name]
+
+    # Memory, one word or string per lane
+    def load_words(self, lanes, addrs):
+        columns = addrs[:, None] + np.arange(WORD)
+        return np.ascontiguousarray(self.memory[lanes[:, None], columns]).view('<i8')[:, 0]
+
+    def store_words(self, lanes, addrs, values):
+        raw = np.ascontiguousarray(values, dtype='<i8').view(np.uint8).reshape(-1, WORD)
+        self.memory[lanes[:, None], addrs[:, None] + np.arange(WORD)] = raw
+
+    def in_bounds(self, lanes, addrs):
+        return self.keep(lanes, (addrs >= 0) & (addrs + WORD <= self.memory_size), "Memory access out of range")
+
+    def load_string(self, lane: int, addr: int) -> str:
+        row = self.memory[lane]
+        end = addr + int(np.argmax(row[addr:] == 0))
+        return row[addr:end].tobytes().decode('utf-8', errors='replace')
+
+    def store_string(self, lane: int, addr: int, text: str):
+        raw = np.frombuffer(text.encode('utf-8') + b'\0', dtype=np.uint8)
+        self.memory[lane, addr:addr + len(raw)] = raw
+
+    def push(self, lanes, values):
+        rsp = REGISTER_INDEX['RSP']
+        addrs = self.registers[rsp, lanes] - WORD
+        ok = (addrs >= 0) & (addrs + WORD <= self.memory_size)
+        lanes, addrs, values = self.keep(lanes, ok, "Stack overflow"), addrs[ok], values[ok]
+        self.registers[rsp, lanes] = addrs
+        self.store_words(lanes, addrs, values)
+        return lanes
+
+    def pop(self, lanes):
+        rsp = REGISTER_INDEX['RSP']
+        addrs = self.registers[rsp, lanes]
+        ok = addrs + WORD <= self.memory_size
+        lanes, addrs = self.keep(lanes, ok, "Stack underflow"), addrs[ok]
+        self.registers[rsp, lanes] = addrs + WORD
+        return lanes, self.load_words(lanes, addrs)
+
+    # Externals and MNI, lane by lane where the work is string handling anyway
+    def external(self, name: str, lanes):
+        if name == 'printf':
+            for lane, addr in zip(lanes.tolist(), self.registers[REGISTER_INDEX['RBX'], lanes].tolist()):
+                self.output[lane].append(self.load_string(lane, addr) + '\n')
+        elif name == 'printint':
+            for lane, value in zip(lanes.tolist(), self.registers[REGISTER_INDEX['RBX'], lanes].tolist()):
+                self.output[lane].append(f"{value}\n")
+        elif name == 'readint':
+            lanes = self.keep(lanes, self.input_pos[lanes] < self.input_count[lanes], "readint: no input left")
+            self.registers[REGISTER_INDEX['RAX'], lanes] = self.inputs[lanes, self.input_pos[lanes]]
+            self.input_pos[lanes] += 1
+        else:
+            raise RuntimeError(f"Unknown external '{name}'")
+
+    def mni(self, args: List[str], lanes):
+        name = args[0]
+        if name == 'Memory.allocate':
+            size = self.value(args[2], lanes)
+            self.registers[self.register(args[1]), lanes] = self.heap[lanes]
+            self.heap[lanes] += size
+        elif name == 'StringOperations.format':
+            for lane in lanes.tolist():
+                single = np.array([lane])
+                text = self.load_string(lane, int(self.value(args[2], single)[0]))
+                for arg in args[3:]:
+                    number = int(self.value(arg, single)[0])
+                    value = self.load_string(lane, number) if arg.startswith('$') else str(number)
+                    for spec in ('%d', '%s', '{}'):
+                        if spec in text:
+                            text = text.replace(spec, value, 1)
+                            break
+                self.store_string(lane, int(self.value(args[1], single)[0]), text)
+        else:
+            raise RuntimeError(f"Unsupported MNI function '{name}'")
+
+    def execute(self, instr, pc: int, lanes):
+        """Execute one instruction for `lanes`, whose counters already point past it."""
+        op, args, regs = instr.op, instr.args, self.registers
+        if op == 'MOV':
+            regs[self.register(args[0]), lanes] = self.value(args[1], lanes)
+        elif op in BINARY:
+            dest = self.register(args[0])
+            regs[dest, lanes] = BINARY[op](regs[dest, lanes], self.value(args[1], lanes))
+        elif op == 'DIV':
+            dest = self.register(args[0])
+            divisor = self.value(args[1], lanes)
+            ok = divisor != 0
+            lanes, divisor = self.keep(lanes, ok, f"Division by zero on line {instr.line}"), divisor[ok]
+            dividend = regs[dest, lanes]
+            quotient = np.abs(dividend) // np.abs(divisor)  # Truncate toward zero like int(a / b)
+            regs[dest, lanes] = np.where((dividend < 0) != (divisor < 0), -quotient, quotient)
+        elif op in ('INC', 'DEC'):
+            regs[self.register(args[0]), lanes] += 1 if op == 'INC' else -1
+        elif op == 'NOT':
+            dest = self.register(args[0])
+            regs[dest, lanes] = ~regs[dest, lanes]
+        elif op == 'CMP':
+            left, right = self.value(args[0], lanes), self.value(args[1], lanes)
+            self.flag[lanes] = (left > right).astype(np.int64) - (left < right)  # Subtracting could overflow
+        elif op == 'JMP':
+            self.pc[lanes] = self.target(args[0])
+        elif op in CONDITIONS:
+            otherwise = self.target(args[1]) if len(args) > 1 else pc + 1
+            self.pc[lanes] = np.where(CONDITIONS[op](self.flag[lanes]), self.target(args[0]), otherwise)
+        elif op == 'CALL':
+            name = args[0].lstrip('#$')
+            if name in self.program.labels:
+                lanes = self.push(lanes, np.full(len(lanes), pc + 1, dtype=np.int64))
+                self.pc[lanes] = self.program.labels[name]
+            else:
+                self.external(name, lanes)
+        elif op == 'RET':
+            done = regs[REGISTER_INDEX['RSP'], lanes] >= self.memory_size
+            self.state[lanes[done]] = HALTED
+            lanes, addresses = self.pop(lanes[~done])
+            self.pc[lanes] = addresses
+        elif op == 'PUSH':
+            self.push(lanes, self.value(args[0], lanes))
+        elif op == 'POP':
+            dest = self.register(args[0])
+            lanes, values = self.pop(lanes)
+            regs[dest, lanes] = values
+        elif op == 'ENTER':
+            lanes = self.push(lanes, regs[REGISTER_INDEX['RBP'], lanes])
+            regs[REGISTER_INDEX['RBP'], lanes] = regs[REGISTER_INDEX['RSP'], lanes]
+            regs[REGISTER_INDEX['RSP'], lanes] -= self.value(args[0], lanes)
+        elif op == 'LEAVE':
+            regs[REGISTER_INDEX['RSP'], lanes] = regs[REGISTER_INDEX['RBP'], lanes]
+            lanes, values = self.pop(lanes)
+            regs[REGISTER_INDEX['RBP'], lanes] = values
+        elif op == 'MOVADDR':
+            dest = self.register(args[0])
+            addrs = self.value(args[1], lanes) + self.value(args[2], lanes)
+            ok = (addrs >= 0) & (addrs + WORD <= self.memory_size)
+            lanes, addrs = self.keep(lanes, ok, "Memory access out of range"), addrs[ok]
+            regs[dest, lanes] = self.load_words(lanes, addrs)
+        elif op == 'MOVTO':
+            addrs = self.value(args[0], lanes) + self.value(args[1], lanes)
+            values = self.value(args[2], lanes)
+            ok = (addrs >= 0) & (addrs + WORD <= self.memory_size)
+            lanes = self.keep(lanes, ok, "Memory access out of range")
+            self.store_words(lanes, addrs[ok], values[ok])
+        elif op in ('OUT', 'COUT'):
+            values = self.value(args[1], lanes).tolist()
+            for lane, value in zip(lanes.tolist(), values):
+                if op == 'COUT':
+                    self.output[lane].append(chr(value))
+                elif args[1].startswith('$'):
+                    self.output[lane].append(self.load_string(lane, value) + '\n')
+                else:
+                    self.output[lane].append(f"{value}\n")
+        elif op == 'MNI':
+            self.mni(args, lanes)
+        elif op == 'HLT':
+            self.state[lanes] = HALTED
+        elif op == 'EXIT':
+            self.exit_codes[lanes] = self.value(args[0], lanes)
+            self.state[lanes] = HALTED
+        else:
+            raise RuntimeError(f"Unsupported instruction '{op}' on line {instr.line}")
+
+    def run(self) -> 'BatchMachine':
+        instructions = self.program.instructions
+        while True:
+            running = np.flatnonzero(self.state == RUNNING)
+            if not running.size:
+                break
+            counters = self.pc[running]
+            finished = counters >= len(instructions)
+            if finished.any():  # Ran off the end of the program
+                self.state[running[finished]] = HALTED
+                running, counters = running[~finished], counters[~finished]
+                if not running.size:
+                    break
+            pc = int(counters.min())
+            lanes = running[counters == pc]
+            lanes = self.keep(lanes, self.steps[lanes] < self.max_steps, f"Step budget of {self.max_steps} exceeded")
+            if not lanes.size:
+                continue
+            self.steps[lanes] += 1
+            self.issued += 1
+            self.pc[lanes] = pc + 1
+            try:
+                self.execute(instructions[pc], pc, lanes)
+            except RuntimeError as e:
+                self.fail(lanes, str(e))
+        return self
+
+    @property
+    def stdouts(self) -> List[str]:
+        return [''.join(lines) for lines in self.output]
+
+def run_batch(source: str, lanes: Sequence[Iterable[int]], max_steps: int = 10_000_000) -> BatchMachine:
+    return BatchMachine(source, lanes, max_steps).run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a MicroASM program over many input vectors in lock-step")
+    parser.add_argument("source_file", help="Path to the .masm file")
+    parser.add_argument("inputs_file", help="One input vector per line, integers separated by spaces")
+    parser.add_argument("--max-steps", type=int, default=10_000_000, help="Per-lane instruction budget")
+    args = parser.parse_args()
+
+    with open(args.source_file, 'r', encoding='utf-8') as f:
+        source = f.read()
+    with open(args.inputs_file, 'r') as f:
+        lanes = [[int(word) for word in line.split()] for line in f if line.strip()]
+    try:
+        vm = run_batch(source, lanes, args.max_steps)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    for lane, stdout in enumerate(vm.stdouts):
+        print(f"--- lane {lane}: {vm.steps[lane]} steps" + (f", error: {vm.errors[lane]}" if vm.errors[lane] else ''))
+        sys.stdout.write(stdout)
+    print(f"{vm.issued} lock-step instructions for {len(lanes)} lanes", file=sys.stderr)
+    sys.exit(1 if any(vm.errors) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Code-quality benchmark for the compiler.
+
+Every program in the corpus (examples/*.uh and benchmarks/*.uh) is compiled and
+measured for static instruction count, data bytes and the number of instructions
+executed by the reference interpreter. A program may have a sibling `.input`
+file; each non-empty line is one input vector for #readint and the executed
+counts of all vectors are summed.
+
+    python3 src/benchmark.py run -o benchmarks/baseline.json
+    python3 src/benchmark.py compare --threshold 0.05
+    python3 src/benchmark.py engines --repeat 5
+
+`engines` times the reference interpreter against the threaded-code engine on
+the same compiled programs and inputs.
+"""
+import os
+import io
+import time
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import contextlib
+from typing import Dict, List
+from uhigh import UHighCompiler
+from masm import parse_masm
+from vm import VirtualMachine
+from threaded import ThreadedMachine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = ['examples/*.uh', 'benchmarks/*.uh']
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+METRICS = ['static_instructions', 'data_bytes', 'executed_instructions']
+MAX_STEPS = 5_000_000
+
+def corpus_files() -> List[str]:
+    files = []
+    for pattern in CORPUS:
+        files.extend(sorted(glob.glob(os.path.join(ROOT, pattern))))
+    return files
+
+def read_inputs(path: str) -> List[List[int]]:
+    input_file = os.path.splitext(path)[0] + '.input'
+    if not os.path.exists(input_file):
+        return [[]]
+    with open(input_file, 'r') as f:
+        vectors = [[int(word) for word in line.split()] for line in f if line.strip()]
+    return vectors or [[]]
+
+def compile_file(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):  # The lexer and parser print debugging output
+        output = UHighCompiler().compile(source, os.path.dirname(path))
+    return parse_masm(output)
+
+def measure(path: str) -> Dict:
+    """Compile and run one program, returning its metrics."""
+    program = compile_file(path)
+    executed = 0
+    outputs = []
+    for inputs in read_inputs(path):
+        vm = VirtualMachine(program, inputs, MAX_STEPS).run()
+        executed += vm.steps
+        outputs.append(vm.stdout)
+    return {
+        'static_instructions': len(program.instructions),
+        'data_bytes': sum(len(text.encode('utf-8')) + 1 for _, text in program.data),
+        'executed_instructions': executed,
+        'output_sha1': hashlib.sha1('\0'.join(outputs).encode('utf-8')).hexdigest(),
+    }
+
+def run_benchmarks(files: List[str] = None) -> Dict[str, Dict]:
+    """Measure every program, skipping (and reporting) those that fail to compile or run."""
+    results = {}
+    for path in files or corpus_files():
+        name = os.path.relpath(path, ROOT)
+        try:
+            results[name] = measure(path)
+        except Exception as e:
+            print(f"skipped {name}: {e}", file=sys.stderr)
+    return results
+
+def compare(baseline: Dict[str, Dict], current: Dict[str, Dict], threshold: float) -> List[str]:
+    """Return a description of every metric that regressed by more than `threshold` (a fraction)."""
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        if name not in current:
+            regressions.append(f"{name}: no longer compiles or runs")
+            continue
+        actual = current[name]
+        if actual['output_sha1'] != expected['output_sha1']:
+            regressions.append(f"{name}: program output changed")
+        for metric in METRICS:
+            limit = expected[metric] * (1 + threshold)
+            if actual[metric] > limit:
+                regressions.append(f"{name}: {metric} {expected[metric]} -> {actual[metric]}")
+    return regressions
+
+def time_engine(engine, program, vectors: List[List[int]], repeat: int) -> float:
+    """Best wall time over `repeat` runs of every input vector, including engine setup."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for inputs in vectors:
+            engine(program, inputs, MAX_STEPS).run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def compare_engines(files: List[str] = None, repeat: int = 5) -> Dict[str, Dict]:
+    """Time the reference interpreter and the threaded engine on every program."""
+    results = {}
+    for path in files or corpus_files():
+        name = os.path.relpath(path, ROOT)
+        try:
+            program = compile_file(path)
+            vectors = read_inputs(path)
+            for inputs in vectors:
+                expected = VirtualMachine(program, inputs, MAX_STEPS).run()
+                actual = ThreadedMachine(program, inputs, MAX_STEPS).run()
+                if (actual.stdout, actual.steps) != (expected.stdout, expected.steps):
+                    raise RuntimeError("engines disagree")
+        except Exception as e:
+            print(f"skipped {name}: {e}", file=sys.stderr)
+            continue
+        reference = time_engine(VirtualMachine, program, vectors, repeat)
+        threaded = time_engine(ThreadedMachine, program, vectors, repeat)
+        results[name] = {'reference_seconds': reference, 'threaded_seconds': threaded,
+                         'speedup': reference / threaded if threaded else float('inf')}
+    return results
+
+def format_engines(results: Dict[str, Dict]) -> str:
+    lines = [f"{'program':<28}{'reference (ms)':>16}{'threaded (ms)':>16}{'speedup':>10}"]
+    for name, timing in sorted(results.items()):
+        lines.append(f"{name:<28}{timing['reference_seconds'] * 1000:>16.2f}"
+                     f"{timing['threaded_seconds'] * 1000:>16.2f}{timing['speedup']:>9.1f}x")
+    return '\n'.join(lines)
+
+def format_table(results: Dict[str, Dict], baseline: Dict[str, Dict] = None) -> str:
+    lines = [f"{'program':<28}{'static':>10}{'data':>8}{'executed':>12}"]
+    for name, metrics in sorted(results.items()):
+        row = f"{name:<28}{metrics['static_instructions']:>10}{metrics['data_bytes']:>8}{metrics['executed_instructions']:>12}"
+        if baseline and name in baseline:
+            deltas = [metrics[m] - baseline[name][m] for m in METRICS]
+            row += '   (' + ' '.join(f"{d:+d}" for d in deltas) + ')'
+        lines.append(row)
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="μHigh code-quality benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Measure the corpus and write a JSON baseline")
+    run_parser.add_argument("-o", "--output", default=BASELINE, help="Baseline file to write")
+    run_parser.add_argument("files", nargs="*", help="Programs to measure (defaults to the corpus)")
+    compare_parser = commands.add_parser("compare", help="Fail if any metric regressed past the threshold")
+    compare_parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare against")
+    compare_parser.add_argument("--threshold", type=float, default=0.05, help="Allowed relative increase per metric (default 0.05)")
+    engines_parser = commands.add_parser("engines", help="Time the threaded engine against the reference interpreter")
+    engines_parser.add_argument("--repeat", type=int, default=5, help="Runs per program; the best time is reported")
+    engines_parser.add_argument("files", nargs="*", help="Programs to time (defaults to the corpus)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks([os.path.abspath(f) for f in args.files] or None)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(format_table(results))
+        print(f"Baseline written to {args.output}")
+        return
+    if args.command == "engines":
+        print(format_engines(compare_engines([os.path.abspath(f) for f in args.files] or None, args.repeat)))
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    results = run_benchmarks()
+    print(format_table(results, baseline))
+    regressions = compare(baseline, results, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) past {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,115 @@
 #!/usr/bin/env python3
 
-import sys
 import os
-from .uhigh import UHighCompiler
+import sys
+import hashlib
+import argparse
+from contextlib import nullcontext
+from typing import Optional
+from . import uhigh
+from .uhigh import UHighCompiler, CompileContext, HEADER, write_stats_report, add_pass_arguments, pass_manager
+from .linker import ObjectFile, LinkError, read_object, write_object, link_objects
+from .stats import CompileStats
+from .passes import PassManager
+
+OBJECT_DIR = 'build'  # Object files live under <project>/build, mirroring the sources
+
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def object_path(project_dir: str, source_path: str) -> str:
+    relative = os.path.relpath(source_path, project_dir)
+    return os.path.join(project_dir, OBJECT_DIR, os.path.splitext(relative)[0] + '.uo')
 
-def build_project(project_dir: str):
-    compiler = UHighCompiler()
-    output = []
+def load_current_object(project_dir: str, path: str, pipeline: str = '') -> Optional[ObjectFile]:
+    """The object at path, unless it is missing, unreadable, built by other passes or any file it was built from changed."""
+    if not os.path.exists(path):
+        return None
+    try:
+        obj = read_object(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if obj.pipeline != pipeline:
+        return None
+    for dependency, digest in obj.dependencies.items():
+        source = os.path.join(project_dir, dependency)
+        if not os.path.exists(source) or file_digest(source) != digest:
+            return None
+    return obj
 
-    for root, _, files in os.walk(project_dir):
-        for file in files:
-            if file.endswith(".uh"):
-                file_path = os.path.join(root, file)
+def build_project(project_dir: str, stats: CompileStats = None, force: bool = False, passes: PassManager = None) -> str:
+    """Compile each changed .uh file to an object, then link all objects into output.masm.
+
+    Passes default to the project's config.json, if it has one.
+    """
+    if passes is None:
+        config = os.path.join(project_dir, 'config.json')
+        passes = PassManager.from_config(config) if os.path.exists(config) else PassManager()
+    objects = []
+    compiled = reused = 0
+
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = sorted(d for d in dirs if d != OBJECT_DIR)
+        for file in sorted(files):
+            if not file.endswith(".uh"):
+                continue
+            file_path = os.path.join(root, file)
+            name = os.path.relpath(file_path, project_dir)
+            path = object_path(project_dir, file_path)
+            obj = None if force else load_current_object(project_dir, path, passes.signature())
+            if obj is None:
+                # A fresh compiler per file, so labels, variables and addresses never leak between files
+                compiler = UHighCompiler(stats=stats, passes=passes)
+                context = CompileContext(root, name)
                 with open(file_path, 'r') as f:
                     source = f.read()
-                compiled = compiler.compile(source, root)
-                output.append(compiled)
+                obj = compiler.compile_object(source, root, name, context)
+                obj.dependencies = {os.path.relpath(p, project_dir): file_digest(p)
+                                    for p in [file_path] + context.included_files}
+                obj.pipeline = passes.signature()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_object(path, obj)
+                compiled += 1
+            else:
+                reused += 1
+            objects.append(obj)
+
+    phase = stats.phase if stats else (lambda name: nullcontext())
+    if stats:
+        stats.count('files', len(objects))
+        stats.count('objects_compiled', compiled)
+        stats.count('objects_reused', reused)
+    with phase('link'):
+        result = link_objects(objects)
 
     output_file = os.path.join(project_dir, "output.masm")
-    with open(output_file, 'w') as f:
-        f.write('\n'.join(output))
+    with phase('write'):
+        with open(output_file, 'w') as f:
+            f.write('\n'.join(HEADER + result.lines))
 
-    print(f"Build complete. Output written to {output_file}")
+    print(f"Build complete: {compiled} compiled, {reused} up to date. Output written to {output_file}")
+    return output_file
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: build.py <project_directory>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="μHigh project builder")
+    parser.add_argument("project_dir", help="Directory containing .uh files")
+    parser.add_argument("--force", action="store_true", help="Recompile every file even if its object is up to date")
+    parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], help="Report per-phase peak memory and compiler counters")
+    parser.add_argument("--stats-output", help="Write the statistics report to this file instead of stdout")
+    add_pass_arguments(parser)
+    args = parser.parse_args()
 
-    project_dir = sys.argv[1]
-    build_project(project_dir)
+    stats = CompileStats() if args.stats else None
+    try:
+        build_project(args.project_dir, stats, args.force, pass_manager(args, args.project_dir))
+    except (LinkError, uhigh.LinkError) as e:  # uhigh checks a file's includes through its own import of the linker
+        for problem in e.problems:
+            print(f"Link error: {problem}", file=sys.stderr)
+        sys.exit(1)
+    if stats:
+        stats.stop()
+        write_stats_report(stats, args.stats, args.stats_output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Binary MicroASM bytecode: assembler from .masm text and a memory-mapped loader.
+
+Layout (little-endian):
+    header   HEADER struct, section offsets are absolute file offsets
+    code     packed instructions: opcode u8, argc u8, then argc operands of (kind u8, value i64)
+    data     image base i64, image size u32, count u32, count * (address i64, length u32), then the image
+    strings  count u32, count * (offset u32, length u32), then the UTF-8 blob
+    labels   count u32, count * (string index u32, code offset u32)
+    includes count u32, count * string index u32
+
+Label operands are resolved to byte offsets inside the code section. Jump or call
+targets that are not defined in the file (e.g. #printf from an include) are kept as
+EXTERN operands that point at the string table.
+
+The data section holds the program's static memory image, ready to be mapped at
+its base address: the compiler passes the image its linker planned (strings,
+constant globals, scratch buffer and static frames). Text assembled on its own
+gets an image of just its DB strings. The DB entries locate each string inside it.
+"""
+import mmap
+import os
+import struct
+import sys
+import argparse
+from typing import List, Dict, Tuple, Iterator
+from masm import REGISTERS, REGISTER_INDEX, parse_masm, parse_int, unquote
+
+MAGIC = b'UHBC'
+VERSION = 2
+HEADER = struct.Struct('<4sHH10I')
+IMAGE_HEAD = struct.Struct('<qII')
+OPERAND = struct.Struct('<Bq')
+INSTR_HEAD = struct.Struct('<BB')
+COUNT = struct.Struct('<I')
+DATA_ENTRY = struct.Struct('<qI')
+PAIR = struct.Struct('<II')
+
+OPCODES = [
+    'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'INC', 'DEC',
+    'JMP', 'CMP', 'JE', 'JNE', 'JL', 'JG', 'JLE', 'JGE',
+    'CALL', 'RET', 'PUSH', 'POP',
+    'OUT', 'IN', 'COUT', 'HLT', 'EXIT', 'ARGC', 'GETARG',
+    'AND', 'OR', 'XOR', 'NOT', 'SHL', 'SHR',
+    'MOVADDR', 'MOVTO', 'ENTER', 'LEAVE',
+    'COPY', 'FILL', 'CMP_MEM', 'MNI',
+]
+OPCODE_INDEX = {name: i for i, name in enumerate(OPCODES)}
+
+# Operand kinds
+REG, IMM, ADDR, LABEL, EXTERN, STR, NAME, REG_ADDR = range(1, 9)
+
+class StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def add(self, text: str) -> int:
+        if text not in self.index:
+            self.index[text] = len(self.strings)
+            self.strings.append(text)
+        return self.index[text]
+
+def encode_operand(arg: str, labels: Dict[str, int], strings: StringTable) -> Tuple[int, int]:
+    """Classify one textual operand. LABEL values hold the label *name* index until layout."""
+    if arg in REGISTER_INDEX:
+        return REG, REGISTER_INDEX[arg]
+    if arg.startswith('#'):
+        name = arg[1:]
+        if name in labels:
+            return LABEL, labels[name]
+        return EXTERN, strings.add(name)
+    if arg.startswith('"'):
+        return STR, strings.add(unquote(arg))
+    if arg.startswith('$') and parse_int(arg[1:]) is not None:
+        return ADDR, parse_int(arg[1:])
+    if arg.startswith('$') and arg[1:] in REGISTER_INDEX:
+        return REG_ADDR, REGISTER_INDEX[arg[1:]]
+    value = parse_int(arg)
+    if value is not None:
+        return IMM, value
+    return NAME, strings.add(arg)
+
+def strings_image(data: List[Tuple[int, str]]) -> Tuple[int, bytes]:
+    """Base address and bytes of the smallest image holding the DB strings, each NUL-terminated."""
+    if not data:
+        return 0, b''
+    base = min(addr for addr, _ in data)
+    image = bytearray()
+    for addr, text in data:
+        raw = text.encode('utf-8') + b'\0'
+        start = addr - base
+        image.extend(bytes(max(0, start + len(raw) - len(image))))
+        image[start:start + len(raw)] = raw
+    return base, bytes(image)
+
+def assemble(source: str, image: bytes = None, base: int = 0) -> bytes:
+    """Assemble MicroASM text into the binary bytecode format.
+
+    `image` is the static memory from address `base`, as planned by the linker; without
+    one the data section holds just the DB strings.
+    """
+    program = parse_masm(source)
+    if image is None:
+        base, image = strings_image(program.data)
+    strings = StringTable()
+
+    # First pass: encode operands and compute the byte offset of every instruction
+    encoded = []
+    offsets = []
+    offset = 0
+    for instr in program.instructions:
+        if instr.op not in OPCODE_INDEX:
+            raise ValueError(f"Unknown instruction '{instr.op}' on line {instr.line}")
+        operands = [encode_operand(arg, program.labels, strings) for arg in instr.args]
+        if len(operands) > 255:
+            raise ValueError(f"Too many operands on line {instr.line}")
+        encoded.append((OPCODE_INDEX[instr.op], operands))
+        offsets.append(offset)
+        offset += INSTR_HEAD.size + OPERAND.size * len(operands)
+    end_offset = offset
+
+    def code_offset(index: int) -> int:
+        return offsets[index] if index < len(offsets) else end_offset
+
+    # Second pass: emit code with label operands resolved to code offsets
+    code = bytearray()
+    for opcode, operands in encoded:
+        code += INSTR_HEAD.pack(opcode, len(operands))
+        for kind, value in operands:
+            if kind == LABEL:
+                value = code_offset(value)
+            code += OPERAND.pack(kind, value)
+
+    data = bytearray(IMAGE_HEAD.pack(base, len(image), len(program.data)))
+    for addr, text in program.data:
+        raw = text.encode('utf-8')
+        if addr < base or image[addr - base:addr - base + len(raw)] != raw:
+            raise ValueError(f"DB ${addr} is not in the static image")
+        data += DATA_ENTRY.pack(addr, len(raw))
+    data += image
+
+    label_entries = [(strings.add(name), code_offset(index)) for name, index in program.labels.items()]
+    include_entries = [strings.add(name) for name in program.includes]
+
+    strtab = bytearray(COUNT.pack(len(strings.strings)))
+    str_blob = bytearray()
+    for text in strings.strings:
+        raw = text.encode('utf-8')
+        strtab += PAIR.pack(len(str_blob), len(raw))
+        str_blob += raw
+    strtab += str_blob
+
+    labels = bytearray(COUNT.pack(len(label_entries)))
+    for entry in label_entries:
+        labels += PAIR.pack(*entry)
+    includes = bytearray(COUNT.pack(len(include_entries)))
+    for index in include_entries:
+        includes += COUNT.pack(index)
+
+    sections = [code, data, strtab, labels, includes]
+    fields = []
+    position = HEADER.size
+    for section in sections:
+        fields += [position, len(section)]
+        position += len(section)
+    return HEADER.pack(MAGIC, VERSION, 0, *fields) + b''.join(sections)
+
+class BytecodeImage:
+    """Read-only view over bytecode; nothing is copied until a value is decoded."""
+
+    def __init__(self, buffer, mapping: mmap.mmap = None):
+        self.buffer = memoryview(buffer)
+        self.mapping = mapping
+        magic, version, _flags, *fields = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a μHigh bytecode file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported bytecode version {version}")
+        sections = [self.buffer[fields[i]:fields[i] + fields[i + 1]] for i in range(0, len(fields), 2)]
+        self.code, self.data, self.strtab, self.label_section, self.include_section = sections
+        self.image_base, size, self.data_count = IMAGE_HEAD.unpack_from(self.data, 0)
+        start = IMAGE_HEAD.size + DATA_ENTRY.size * self.data_count
+        self.static_image = self.data[start:start + size]  # Memory from image_base, viewed in place
+        self.string_count = COUNT.unpack_from(self.strtab, 0)[0]
+        self.string_blob = COUNT.size + PAIR.size * self.string_count
+        self.labels: Dict[str, int] = {}
+        for i in range(COUNT.unpack_from(self.label_section, 0)[0]):
+            name, offset = PAIR.unpack_from(self.label_section, COUNT.size + i * PAIR.size)
+            self.labels[self.string(name)] = offset
+
+    def string(self, index: int) -> str:
+        if index >= self.string_count:
+            raise IndexError(f"String index {index} out of range")
+        offset, length = PAIR.unpack_from(self.strtab, COUNT.size + index * PAIR.size)
+        start = self.string_blob + offset
+        return bytes(self.strtab[start:start + length]).decode('utf-8')
+
+    @property
+    def includes(self) -> List[str]:
+        count = COUNT.unpack_from(self.include_section, 0)[0]
+        return [self.string(COUNT.unpack_from(self.include_section, COUNT.size * (i + 1))[0]) for i in range(count)]
+
+    def data_segments(self) -> Iterator[Tuple[int, memoryview]]:
+        """Yield (address, bytes view into the static image) for every DB entry."""
+        for i in range(self.data_count):
+            addr, length = DATA_ENTRY.unpack_from(self.data, IMAGE_HEAD.size + i * DATA_ENTRY.size)
+            yield addr, self.static_image[addr - self.image_base:addr - self.image_base + length]
+
+    def instructions(self) -> Iterator[Tuple[int, int, List[Tuple[int, int]]]]:
+        """Yield (code offset, opcode, [(kind, value), ...]) in program order."""
+        offset = 0
+        while offset < len(self.code):
+            opcode, argc = INSTR_HEAD.unpack_from(self.code, offset)
+            operands = [OPERAND.unpack_from(self.code, offset + INSTR_HEAD.size + i * OPERAND.size) for i in range(argc)]
+            yield offset, opcode, operands
+            offset += INSTR_HEAD.size + OPERAND.size * argc
+
+    def format_operand(self, kind: int, value: int, label_names: Dict[int, str]) -> str:
+        if kind == REG:
+            return REGISTERS[value]
+        if kind == IMM:
+            return str(value)
+        if kind == ADDR:
+            return f"${value}"
+        if kind == REG_ADDR:
+            return f"${REGISTERS[value]}"
+        if kind == LABEL:
+            return f"#{label_names.get(value, value)}"
+        if kind == EXTERN:
+            return f"#{self.string(value)}"
+        if kind == STR:
+            return '"' + self.string(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        return self.string(value)
+
+    def disassemble(self) -> str:
+        """Render the image back to MicroASM text."""
+        label_names = {offset: name for name, offset in self.labels.items()}
+        lines = [f'#include "{name}"' for name in self.includes]
+        for addr, raw in self.data_segments():
+            text = bytes(raw).decode('utf-8').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            lines.append(f'DB ${addr} "{text}"')
+        for offset, opcode, operands in self.instructions():
+            for name, label_offset in self.labels.items():
+                if label_offset == offset:
+                    lines.append(f"LBL {name}")
+            args = [self.format_operand(kind, value, label_names) for kind, value in operands]
+            lines.append(' '.join([OPCODES[opcode]] + args))
+        for name, label_offset in self.labels.items():
+            if label_offset == len(self.code):
+                lines.append(f"LBL {name}")
+        return '\n'.join(lines)
+
+    def close(self):
+        self.code = self.data = self.strtab = self.label_section = self.include_section = self.static_image = None
+        self.buffer.release()
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_bytecode(path: str) -> BytecodeImage:
+    """Memory-map a bytecode file for zero-copy access."""
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return BytecodeImage(mapping, mapping)
+
+def write_bytecode(source: str, path: str):
+    with open(path, 'wb') as f:
+        f.write(assemble(source))
+
+def main():
+    parser = argparse.ArgumentParser(description="MicroASM bytecode assembler")
+    parser.add_argument("source_file", help="Path to the .masm file")
+    parser.add_argument("-o", "--output", help="Output file (defaults to <source>.mbc)")
+    parser.add_argument("-d", "--disassemble", action="store_true", help="Print the contents of a bytecode file")
+    args = parser.parse_args()
+
+    if args.disassemble:
+        with load_bytecode(args.source_file) as image:
+            print(image.disassemble())
+        return
+
+    with open(args.source_file, 'r', encoding='utf-8') as f:
+        source = f.read()
+    output_file = args.output or os.path.splitext(args.source_file)[0] + '.mbc'
+    try:
+        write_bytecode(source, output_file)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Bytecode written to {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Ahead-of-time evaluation of functions that take no parameters and read no input.
+
+Such a function always prints the same lines and returns the same value, so
+its body is run here, under a step budget, and replaced by one print of the
+pooled output and a return of the result. Anything evaluation cannot
+reproduce exactly (input, inline assembly, globals, strings held in
+variables, formatted prints, uninitialised reads, division by zero, values
+past 64 bits) abandons the attempt and the function is compiled normally.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from parser import (ASTNode, VarDecl, ConstDecl, Assignment, Print, IfStatement, WhileStatement, FuncDecl, FuncCall,
+                    Return)
+from astpasses import constant_text
+
+STEP_BUDGET = 10000      # Statements and loop tests one function may run before evaluation gives up
+OUTPUT_BUDGET = 4096     # Bytes of pooled output, so a chatty loop does not turn into a huge string
+CONDITION = re.compile(r'^(.*?)\s*(==|!=|<=|>=|<|>)\s*(.*)$')
+COMPARE = {
+    '==': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b,
+}
+EXIT_BLOCK = 'exit'  # Work item that ends the innermost block scope
+
+class Unevaluable(Exception):
+    """The function does something that has to happen at run time."""
+
+class Frame:
+    def __init__(self, function: FuncDecl, args: List[int], target: Optional[str]):
+        self.variables: Dict[str, Optional[int]] = dict(zip(function.parameters, args))  # None: not initialised
+        self.scopes: List[List[str]] = [list(function.parameters)]
+        self.work: List = list(reversed(function.body))
+        self.target = target  # The caller's variable that receives the result
+
+class Evaluator:
+    def __init__(self, functions: Dict[str, FuncDecl], globals_: set, budget: int = STEP_BUDGET):
+        self.functions = functions
+        self.globals = globals_
+        self.budget = budget
+
+    def run(self, function: FuncDecl) -> Tuple[List[str], Optional[int]]:
+        """The lines the function prints (as string-literal text) and its result, or Unevaluable."""
+        output: List[str] = []
+        frames = [Frame(function, [], None)]
+        steps = 0
+        result = None
+        while frames:
+            frame = frames[-1]
+            if not frame.work:
+                value = None  # Falling off the end leaves the result register unknown
+            else:
+                item = frame.work.pop()
+                steps += 1
+                if steps > self.budget:
+                    raise Unevaluable("step budget exceeded")
+                if item is EXIT_BLOCK:
+                    for name in frame.scopes.pop():
+                        frame.variables.pop(name, None)
+                    continue
+                call = self.execute(item, frame, output)
+                if call is None:
+                    continue
+                if isinstance(call, FuncCall):
+                    frames.append(self.enter(call, frame, None))
+                    continue
+                if isinstance(call, tuple):
+                    frames.append(self.enter(call[1], frame, call[0]))
+                    continue
+                value = call.value  # A Return
+            frames.pop()
+            if frames:
+                if frame.target is not None:
+                    if value is None:
+                        raise Unevaluable("result of a call that returns nothing")
+                    frames[-1].variables[frame.target] = value
+            else:
+                result = value
+        return output, result
+
+    def enter(self, call: FuncCall, frame: Frame, target: Optional[str]) -> Frame:
+        callee = self.functions.get(call.name)
+        if callee is None or len(callee.parameters) != len(call.args):
+            raise Unevaluable(f"call to '{call.name}'")
+        return Frame(callee, [self.argument(arg, frame) for arg in call.args], target)
+
+    def execute(self, statement: ASTNode, frame: Frame, output: List[str]):
+        """Run one statement; returns a call to make (with the variable receiving its result) or a Return."""
+        if isinstance(statement, (VarDecl, ConstDecl)):
+            if statement.name not in frame.variables:
+                if statement.name in self.globals:
+                    raise Unevaluable("write to a global")
+                frame.variables[statement.name] = None
+                frame.scopes[-1].append(statement.name)
+            if isinstance(statement, ConstDecl):
+                frame.variables[statement.name] = self.checked(int(statement.value))
+            elif statement.initial_value is not None:
+                return self.assign(statement.name, statement.initial_value, frame)
+        elif isinstance(statement, Assignment):
+            if statement.name not in frame.variables:
+                raise Unevaluable(f"assignment to '{statement.name}'")
+            return self.assign(statement.name, statement.value, frame)
+        elif isinstance(statement, Print):
+            self.print(statement, frame, output)
+        elif isinstance(statement, IfStatement):
+            block = statement.true_block if self.condition(statement.condition, frame) else statement.false_block
+            if block:
+                self.enter_block(frame, block)
+        elif isinstance(statement, WhileStatement):
+            if self.loop_condition(statement.condition, frame):
+                frame.work.append(statement)
+                self.enter_block(frame, statement.body)
+        elif isinstance(statement, FuncCall):
+            return statement
+        elif isinstance(statement, Return):
+            value = statement.value
+            if value is not None:
+                value = int(value) if isinstance(value, str) and value.isdigit() else self.expression(value, frame)
+            return Return(value)
+        else:
+            raise Unevaluable(type(statement).__name__)
+        return None
+
+    def enter_block(self, frame: Frame, block: List[ASTNode]):
+        frame.scopes.append([])
+        frame.work.append(EXIT_BLOCK)
+        frame.work.extend(reversed(block))
+
+    def assign(self, name: str, value, frame: Frame):
+        if isinstance(value, FuncCall):
+            return (name, value)
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            frame.variables[name] = self.checked(int(value))
+        elif isinstance(value, str) and value.startswith('"'):
+            raise Unevaluable("string address in a variable")
+        else:
+            frame.variables[name] = self.expression(value, frame)
+        return None
+
+    def print(self, statement: Print, frame: Frame, output: List[str]):
+        if len(statement.values) != 1:
+            raise Unevaluable("formatted print")
+        value = statement.values[0]
+        text = constant_text(statement)
+        if text is None:
+            if isinstance(value, str) and value.startswith('"'):
+                raise Unevaluable("string that cannot be pooled")
+            if not isinstance(value, str) or value not in frame.variables:
+                raise Unevaluable("formatted print")
+            text = str(self.read(value, frame))
+        output.append(text)
+        if sum(len(line) + 1 for line in output) > OUTPUT_BUDGET:
+            raise Unevaluable("output budget exceeded")
+
+    def read(self, name: str, frame: Frame) -> int:
+        value = frame.variables.get(name)
+        if value is None:
+            raise Unevaluable(f"read of '{name}'")
+        return value
+
+    def checked(self, value: int) -> int:
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise Unevaluable("value wider than a register")
+        return value
+
+    def argument(self, arg, frame: Frame) -> int:
+        if isinstance(arg, int) or (isinstance(arg, str) and arg.lstrip('-').isdigit()):
+            return self.checked(int(arg))
+        if isinstance(arg, str) and arg.startswith('"'):
+            raise Unevaluable("string argument")
+        return self.expression(arg, frame)
+
+    def expression(self, expr, frame: Frame) -> int:
+        """Mirror UHighCompiler.compile_expression: split at the first operator found, trying + - * / in turn."""
+        if not isinstance(expr, str):
+            raise Unevaluable("expression")
+        expr = expr.strip()
+        if expr.isdigit():
+            return self.checked(int(expr))
+        if expr in frame.variables:
+            return self.read(expr, frame)
+        for op in '+-*/':
+            if op in expr:
+                left, right = [part.strip() for part in expr.split(op, 1)]
+                a, b = self.expression(left, frame), self.expression(right, frame)
+                if op == '/':
+                    if b == 0:
+                        raise Unevaluable("division by zero")
+                    return self.checked(int(a / b))
+                return self.checked(a + b if op == '+' else a - b if op == '-' else a * b)
+        raise Unevaluable(f"expression '{expr}'")
+
+    def condition(self, condition, frame: Frame) -> bool:
+        """Mirror compile_condition for if statements."""
+        if not isinstance(condition, str) or '"' in condition:
+            raise Unevaluable("condition")
+        match = CONDITION.match(condition)
+        if not match:
+            raise Unevaluable("condition")
+        left, op, right = (part.strip() for part in match.groups())
+        return COMPARE[op](self.expression(left, frame), self.expression(right, frame))
+
+    def loop_condition(self, condition, frame: Frame) -> bool:
+        """Mirror the while loop test, which compares the first and third words of the condition."""
+        if isinstance(condition, str) and any(op in condition for op in COMPARE):
+            parts = condition.split()
+            if len(parts) < 3 or parts[1] not in COMPARE:
+                raise Unevaluable("condition")
+            left, op, right = parts[0], parts[1], parts[2]
+            return COMPARE[op](self.operand(left, frame), self.operand(right, frame))
+        return self.operand(condition, frame) != 0
+
+    def operand(self, word, frame: Frame) -> int:
+        if isinstance(word, str) and word in frame.variables:
+            return self.read(word, frame)
+        if isinstance(word, int) or (isinstance(word, str) and word.lstrip('-').isdigit()):
+            return int(word)
+        raise Unevaluable(f"operand '{word}'")
+
+def replacement(function: FuncDecl, output: List[str], result: Optional[int]) -> FuncDecl:
+    body: List[ASTNode] = [Print(['"' + '\\n'.join(output) + '"'])] if output else []
+    if result is not None and function.name != 'main':
+        body.append(Return(str(result) if result >= 0 else f"0 - {-result}"))
+    return FuncDecl(function.name, function.parameters, body)
+
+def evaluate_functions(units: List[Tuple[str, List[ASTNode]]], budget: int = STEP_BUDGET) -> List[Tuple[str, List[ASTNode]]]:
+    """Replace each parameterless function that evaluates within the budget by its output and result."""
+    functions: Dict[str, FuncDecl] = {}
+    defined = set()
+    globals_ = set()
+    for name, statements in units:
+        if name != 'global':
+            if name in defined:
+                functions.pop(name, None)  # Defined twice: leave the error to the linker
+            else:
+                functions[name] = statements[0]
+            defined.add(name)
+            continue
+        pending = list(statements)
+        while pending:
+            node = pending.pop()
+            if isinstance(node, (VarDecl, ConstDecl)):
+                globals_.add(node.name)
+            elif isinstance(node, IfStatement):
+                pending.extend(node.true_block + (node.false_block or []))
+            elif isinstance(node, WhileStatement):
+                pending.extend(node.body)
+
+    evaluator = Evaluator(functions, globals_, budget)
+    result = []
+    for name, statements in units:
+        function = functions.get(name)
+        if function is not None and not function.parameters:
+            try:
+                statements = [replacement(function, *evaluator.run(function))]
+            except Unevaluable:
+                pass
+        result.append((name, statements))
+    return result
@@ -0,0 +1,178 @@
+"""Incremental lexing and parsing for editor integrations.
+
+The document is kept as a list of top-level statements, each with the offset of
+its first token, its tokens, its AST node and the names it declares. An edit is
+re-lexed from the start of the statement before the one it touches (so that
+one-token lookahead such as a following `else` is seen again) up to the first
+later statement that still begins a token in the new text. Statements outside
+that region keep their nodes, and so do re-parsed statements whose tokens did
+not change.
+"""
+from bisect import bisect_left
+from typing import List, Optional, Set, Tuple
+from lexer import Lexer, Token
+from parser import Parser, Program, ASTNode, FuncDecl
+
+Position = Tuple[int, int]  # 0-based (line, column)
+
+class TextEdit:
+    """Replace source[start:end] with text; offsets refer to the text before the edit."""
+
+    def __init__(self, start: int, end: int, text: str):
+        if not 0 <= start <= end:
+            raise ValueError(f"Invalid edit range {start}..{end}")
+        self.start = start
+        self.end = end
+        self.text = text
+
+    @classmethod
+    def from_range(cls, source: str, start: Position, end: Position, text: str) -> 'TextEdit':
+        """Build an edit from (line, column) positions, as editors send them."""
+        return cls(offset_of(source, start), offset_of(source, end), text)
+
+def offset_of(source: str, position: Position) -> int:
+    line, column = position
+    offset = 0
+    for _ in range(line):
+        offset = source.index('\n', offset) + 1
+    return offset + column
+
+class Segment:
+    """One top-level statement of the document."""
+
+    def __init__(self, start: int, tokens: Tuple[Token, ...], node: ASTNode, declared: Set[str]):
+        self.start = start
+        self.tokens = tokens
+        self.node = node
+        self.declared = declared  # Names this statement adds to the parser's declared_vars
+
+class EditResult:
+    def __init__(self, program: Program, changed_functions: List[str], removed_functions: List[str],
+                 relexed: Tuple[int, int], reparsed: int):
+        self.program = program
+        self.changed_functions = changed_functions  # New or modified top-level FuncDecls
+        self.removed_functions = removed_functions
+        self.relexed = relexed                      # Source range that was lexed again
+        self.reparsed = reparsed                    # Top-level statements that were parsed again
+
+class IncrementalParser:
+    def __init__(self, source: str = ''):
+        self.source = source
+        self.segments: Optional[List[Segment]] = None
+        self.program = Program([])
+        self.reparse()
+
+    def reparse(self) -> Program:
+        """Lex and parse the whole document."""
+        self.segments = None  # Stays unset if the document does not parse
+        self.segments = self.parse_region(0, len(self.source), len(self.source), set())
+        self.program = Program([segment.node for segment in self.segments])
+        return self.program
+
+    def apply_edits(self, edits: List[TextEdit]) -> EditResult:
+        """Apply edits in order, each against the text left by the previous one, then re-parse once.
+
+        Raises the lexer or parser error if the edited document is invalid; the
+        next call then parses the whole document again.
+        """
+        for edit in edits:
+            if edit.end > len(self.source):
+                raise ValueError(f"Edit range {edit.start}..{edit.end} is outside the document")
+        if self.segments is None:
+            for edit in edits:
+                self.source = self.source[:edit.start] + edit.text + self.source[edit.end:]
+            self.reparse()
+            changed = [segment.node.name for segment in self.segments if isinstance(segment.node, FuncDecl)]
+            return EditResult(self.program, changed, [], (0, len(self.source)), len(self.segments))
+
+        segments = self.segments
+        first, sync = len(segments), 0
+        for edit in edits:
+            starts = [segment.start for segment in segments]
+            containing = bisect_left(starts, edit.start) - 1  # Last statement starting before the edit
+            first = min(first, max(containing - 1, 0))
+            sync = max(sync, bisect_left(starts, edit.end), containing + 1)
+            delta = len(edit.text) - (edit.end - edit.start)
+            self.source = self.source[:edit.start] + edit.text + self.source[edit.end:]
+            for segment in segments[containing + 1:]:
+                # Statements that began inside the replaced text are re-parsed anyway
+                segment.start = segment.start + delta if segment.start >= edit.end else edit.start
+        first = min(first, sync)
+        restart = segments[first].start if first > 0 else 0
+
+        declared = set()
+        for segment in segments[:first]:
+            declared |= segment.declared
+        while True:
+            stop = segments[sync].start if sync < len(segments) else len(self.source)
+            end = segments[sync + 1].start if sync + 1 < len(segments) else len(self.source)
+            try:
+                region = self.parse_region(restart, stop, end, declared)
+            except (RuntimeError, IndexError):
+                if stop < len(self.source):
+                    region = None
+                else:
+                    self.segments = None
+                    raise
+            if region is not None and stop < len(self.source) and self.loses_declarations(region, first, sync, declared):
+                region = None  # A later statement may use a name that is no longer declared
+            if region is not None:
+                break
+            sync = min(len(segments), sync + max(1, sync - first))
+
+        unused = {}
+        for segment in segments[first:sync]:
+            unused.setdefault(segment.tokens, []).append(segment)
+        changed = []
+        for i, segment in enumerate(region):
+            matches = unused.get(segment.tokens)
+            if matches:
+                reused = matches.pop(0)
+                reused.start = segment.start
+                region[i] = reused
+            elif isinstance(segment.node, FuncDecl):
+                changed.append(segment.node.name)
+        names = {segment.node.name for segment in region if isinstance(segment.node, FuncDecl)}
+        removed = [segment.node.name for group in unused.values() for segment in group
+                   if isinstance(segment.node, FuncDecl) and segment.node.name not in names]
+        segments[first:sync] = region
+        self.program = Program([segment.node for segment in segments])
+        return EditResult(self.program, changed, removed, (restart, stop), len(region))
+
+    def loses_declarations(self, region: List[Segment], first: int, sync: int, declared: Set[str]) -> bool:
+        before, after = set(declared), set(declared)
+        for segment in self.segments[first:sync]:
+            before |= segment.declared
+        for segment in region:
+            after |= segment.declared
+        lost = before - after
+        if not lost:
+            return False
+        return any(token[0] == 'IDENT' and token[1] in lost
+                   for segment in self.segments[sync:] for token in segment.tokens)
+
+    def parse_region(self, start: int, stop: int, end: int, declared: Set[str]) -> Optional[List[Segment]]:
+        """Parse the top-level statements in source[start:stop].
+
+        source[stop:end] is lexed too, as lookahead. Returns None when the
+        statement at `stop` no longer starts on a token boundary or a statement
+        runs past `stop`.
+        """
+        lexer = Lexer(self.source[start:end])
+        tokens = lexer.tokenize()
+        offsets = [start + offset for offset in lexer.offsets]
+        boundary = bisect_left(offsets, stop)
+        if stop < len(self.source) and (boundary == len(offsets) or offsets[boundary] != stop):
+            return None
+        parser = Parser(tokens)
+        parser.declared_vars = set(declared)
+        segments = []
+        while parser.current < boundary:
+            first = parser.current
+            before = set(parser.declared_vars)
+            node = parser.statement()
+            if parser.current > boundary:
+                return None
+            segments.append(Segment(offsets[first], tuple(tokens[first:parser.current]), node,
+                                    parser.declared_vars - before))
+        return segments
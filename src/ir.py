@@ -0,0 +1,652 @@
+"""Linear three-address IR with basic blocks and an explicit control-flow graph.
+
+Each code generation unit becomes an IRFunction: a list of blocks in layout
+order, each with an optional label, its instructions and the block it falls
+through to. Arithmetic is three-address (`ADD d a b` is d = a + b); everything
+else keeps its MicroASM operands. Passes rewrite the blocks and emit() lays them
+out as MicroASM lines again, adding or dropping jumps to match the layout.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from masm import REGISTERS, REGISTER_INDEX, split_line, parse_int
+from linker import label_marker
+
+BINARY_OPS = {'ADD', 'SUB', 'MUL', 'DIV', 'AND', 'OR', 'XOR', 'SHL', 'SHR'}
+COMMUTATIVE = {'ADD', 'MUL', 'AND', 'OR', 'XOR'}
+CONDITIONAL_JUMPS = {'JE', 'JNE', 'JL', 'JG', 'JLE', 'JGE'}
+INVERTED = {'JE': 'JNE', 'JNE': 'JE', 'JL': 'JGE', 'JGE': 'JL', 'JG': 'JLE', 'JLE': 'JG'}
+TERMINATORS = {'JMP', 'RET', 'HLT', 'EXIT'} | CONDITIONAL_JUMPS
+SCRATCH = 'R15'  # Never handed out by the register allocator
+ALL_REGISTERS = frozenset(REGISTERS)
+REMOVABLE = {'MOV', 'MOVADDR', 'INC', 'DEC', 'NOT'} | BINARY_OPS  # Only write registers; dropped when the result is dead
+NO_REGISTER_DEFS = {'CMP', 'JMP', 'OUT', 'COUT', 'MOVTO', 'HLT', 'EXIT', 'COPY', 'FILL', 'CMP_MEM'}
+PURE_MNI = {'StringOperations.format', 'StringOperations.cmp'}  # Write memory or flags, not registers
+EXTERNAL_CALLS = {  # stdio routines: (registers read, registers written)
+    'printf': ({'RAX', 'RBX'}, set()),
+    'printint': ({'RAX', 'RBX'}, set()),
+    'readint': (set(), {'RAX'}),
+}
+ARGUMENT_REGISTERS = ['RDI', 'RSI', 'RDX', 'RCX']  # The first arguments of a call; later ones are pushed
+CALLER_SAVED = frozenset(f"R{i}" for i in range(15))  # Pushed around a call by save_live_registers when still needed
+WORD = 8
+INDENT = '    '
+
+def is_internal(label: str) -> bool:
+    """Compiler-generated labels carry relocation markers and cannot be named from outside the unit."""
+    return '{{L' in label
+
+class Instr:
+    def __init__(self, op: str, args: List[str], text: str = None):
+        self.op = op      # Upper-case opcode; ';' is a comment and '#' a directive line kept verbatim
+        self.args = args  # Binary ops are [dest, left, right]
+        self.text = text
+
+    def targets(self) -> List[str]:
+        """Labels this instruction jumps to."""
+        if self.op == 'JMP' or self.op in CONDITIONAL_JUMPS:
+            return [arg[1:] if arg.startswith('#') else arg for arg in self.args]
+        return []
+
+    def __repr__(self):
+        return f"Instr({self.op!r}, {self.args!r})"
+
+class Block:
+    def __init__(self, label: str = None):
+        self.label = label
+        self.instrs: List[Instr] = []
+        self.next: Optional['Block'] = None  # Fall-through successor; None after JMP/RET/HLT or at the unit's end
+
+    def terminator(self) -> Optional[Instr]:
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+    def ends_unconditionally(self) -> bool:
+        term = self.terminator()
+        return term is not None and (term.op not in CONDITIONAL_JUMPS or len(term.args) > 1)
+
+    def is_empty(self) -> bool:
+        return all(instr.op == ';' for instr in self.instrs)
+
+    def __repr__(self):
+        return f"Block({self.label!r}, {len(self.instrs)} instrs)"
+
+class IRFunction:
+    def __init__(self, name: str, label_count: int = 0):
+        self.name = name
+        self.blocks: List[Block] = []  # Layout order; blocks[0] is the entry
+        self.label_count = label_count  # Unit-local label ids in use, continued by new_label()
+        self.temporaries: Optional[Set[str]] = None  # Registers known to be dead when control leaves the unit
+        self.globals: Set[str] = set()  # Registers of program-wide variables, which a call may change
+        self.locals: Set[str] = set()   # Registers of the function's own variables, dead once it returns
+        self.calls: Optional[Tuple[Set[str], Set[str]]] = None  # Effects of calls to program functions; see call_effects()
+
+    def new_label(self) -> str:
+        label = f"L{label_marker(self.label_count)}"
+        self.label_count += 1
+        return label
+
+    def label_of(self, block: Block) -> str:
+        if block.label is None:
+            block.label = self.new_label()
+        return block.label
+
+    def block_map(self) -> Dict[str, Block]:
+        return {block.label: block for block in self.blocks if block.label is not None}
+
+    def tail(self) -> Optional[Block]:
+        """The block that runs off the end of the unit, which must stay last."""
+        last = self.blocks[-1] if self.blocks else None
+        if last is not None and last.next is None and not last.ends_unconditionally():
+            return last
+        return None
+
+    def successors(self, block: Block, blocks: Dict[str, Block] = None) -> List[Block]:
+        blocks = self.block_map() if blocks is None else blocks
+        result = []
+        term = block.terminator()
+        if term is not None:
+            result.extend(blocks[label] for label in term.targets() if label in blocks)
+        if block.next is not None:
+            result.append(block.next)
+        return result
+
+    def predecessors(self) -> Dict[int, List[Block]]:
+        """Map id(block) to the blocks that may transfer control to it."""
+        blocks = self.block_map()
+        preds: Dict[int, List[Block]] = {id(block): [] for block in self.blocks}
+        for block in self.blocks:
+            for succ in self.successors(block, blocks):
+                if block not in preds[id(succ)]:
+                    preds[id(succ)].append(block)
+        return preds
+
+def build_function(name: str, lines: List[str], label_count: int = 0) -> IRFunction:
+    """Split a unit's generated MicroASM lines into basic blocks."""
+    fn = IRFunction(name, label_count)
+    block = Block()
+    fn.blocks.append(block)
+
+    def start_block(label: str = None, falls_through: bool = True) -> Block:
+        new = Block(label)
+        if falls_through:
+            block.next = new
+        fn.blocks.append(new)
+        return new
+
+    for line in lines:
+        text = line.strip()
+        if not text:
+            continue
+        if text.startswith(';') or text.startswith('//'):
+            block.instrs.append(Instr(';', [], text))
+            continue
+        if text.startswith('#'):
+            block.instrs.append(Instr('#', [], text))
+            continue
+        words = split_line(text)
+        if not words:
+            continue
+        op, args = words[0].upper(), words[1:]
+        if op == 'LBL':
+            label = args[0].lstrip('#')
+            if block.label is None and not block.instrs:
+                block.label = label  # Label an empty block opened after a terminator
+            else:
+                block = start_block(label, not block.ends_unconditionally())
+            continue
+        if op in BINARY_OPS and len(args) == 2:
+            dest, source = args
+            previous = block.instrs[-1] if block.instrs else None
+            if previous is not None and previous.op == 'MOV' and previous.args[0] == dest and source != dest:
+                block.instrs[-1] = Instr(op, [dest, previous.args[1], source])  # MOV d a; ADD d b -> d = a + b
+            else:
+                block.instrs.append(Instr(op, [dest, dest, source]))
+            continue
+        block.instrs.append(Instr(op, args))
+        if op in TERMINATORS:
+            block = start_block(None, not block.ends_unconditionally())
+
+    if len(fn.blocks) > 1 and block.label is None and not block.instrs and fn.blocks[-2].ends_unconditionally():
+        fn.blocks.pop()  # Nothing runs after the final jump or return
+    return fn
+
+def lower(instr: Instr) -> List[str]:
+    """MicroASM lines for one IR instruction."""
+    if instr.op in (';', '#'):
+        return [instr.text]
+    if instr.op in BINARY_OPS:
+        dest, left, right = instr.args
+        if left == dest:
+            return [f"{instr.op} {dest} {right}"]
+        if right == dest and instr.op in COMMUTATIVE:
+            return [f"{instr.op} {dest} {left}"]
+        if right == dest:
+            return [f"MOV {SCRATCH} {left}", f"{instr.op} {SCRATCH} {right}", f"MOV {dest} {SCRATCH}"]
+        return [f"MOV {dest} {left}", f"{instr.op} {dest} {right}"]
+    return [' '.join([instr.op] + instr.args)]
+
+def thread_jumps(fn: IRFunction):
+    """Retarget jumps and fall-throughs that land on empty blocks or on blocks holding only a JMP."""
+    blocks = fn.block_map()
+
+    def forward(block: Block) -> Optional[Block]:
+        if block.is_empty():
+            return block.next
+        real = [instr for instr in block.instrs if instr.op != ';']
+        if len(real) == 1 and real[0].op == 'JMP' and len(real[0].args) == 1:
+            return blocks.get(real[0].targets()[0])
+        return None
+
+    resolved: Dict[int, Block] = {}
+
+    def resolve(block: Block) -> Block:
+        path = []
+        seen = set()
+        while id(block) not in seen and id(block) not in resolved:
+            seen.add(id(block))
+            path.append(block)
+            target = forward(block)
+            if target is None:
+                break
+            block = target
+        final = resolved.get(id(block), block)
+        for visited in path:
+            resolved[id(visited)] = final
+        return final
+
+    for block in fn.blocks:
+        term = block.terminator()
+        if term is not None and term.targets():
+            for i, label in enumerate(term.targets()):
+                if label in blocks and is_internal(label):
+                    target = resolve(blocks[label])
+                    term.args[i] = f"#{fn.label_of(target)}"
+                    blocks[target.label] = target
+        if block.next is not None:
+            block.next = resolve(block.next)
+        if term is not None and term.op in CONDITIONAL_JUMPS and block.next is not None:
+            if all(blocks.get(label) is block.next for label in term.targets()):
+                block.instrs.pop()  # Both ways lead to the same block
+
+def remove_unreachable_blocks(fn: IRFunction):
+    """Drop blocks that no path from the entry or from an externally visible label reaches."""
+    if not fn.blocks:
+        return
+    blocks = fn.block_map()
+    roots = [fn.blocks[0]]
+    roots.extend(block for block in fn.blocks if block.label is not None and not is_internal(block.label))
+    for block in fn.blocks:
+        for instr in block.instrs:
+            if not instr.targets():
+                # Labels named by calls or other operands are entry points too
+                roots.extend(blocks[arg[1:]] for arg in instr.args if arg.startswith('#') and arg[1:] in blocks)
+    reachable = set()
+    pending = roots
+    while pending:
+        block = pending.pop()
+        if id(block) in reachable:
+            continue
+        reachable.add(id(block))
+        pending.extend(fn.successors(block, blocks))
+    # Data directives are loaded wherever they appear, so move them to the entry block
+    data = [instr for block in fn.blocks if id(block) not in reachable for instr in block.instrs if instr.op == 'DB']
+    if data:
+        entry = fn.blocks[0]
+        position = len(entry.instrs) - (1 if entry.terminator() else 0)
+        entry.instrs[position:position] = data
+    fn.blocks = [block for block in fn.blocks if id(block) in reachable]
+
+def order_blocks(fn: IRFunction):
+    """Lay blocks out in chains that follow fall-through edges, then jump targets, so fewer jumps are needed."""
+    if len(fn.blocks) < 2:
+        return
+    tail = fn.tail()
+    blocks = fn.block_map()
+    fall_preds: Dict[int, List[Block]] = {}
+    for block in fn.blocks:
+        if block.next is not None:
+            fall_preds.setdefault(id(block.next), []).append(block)
+    placed = set()
+    if tail is not None:
+        placed.add(id(tail))
+    layout = []
+    for seed in fn.blocks:
+        block = seed
+        while block is not None and id(block) not in placed:
+            placed.add(id(block))
+            layout.append(block)
+            successor = block.next if block.next is not None and id(block.next) not in placed else None
+            term = block.terminator()
+            if successor is None and term is not None and len(term.targets()) == 1:
+                target = blocks.get(term.targets()[0])
+                # Only pull the target up if no other unplaced block wants to fall into it
+                if target is not None and id(target) not in placed and all(
+                        pred is block or id(pred) in placed for pred in fall_preds.get(id(target), [])):
+                    successor = target
+            block = successor
+    if tail is not None:
+        layout.append(tail)
+    fn.blocks = layout
+
+def registers_in(arg: str) -> List[str]:
+    if arg in REGISTER_INDEX:
+        return [arg]
+    if arg.startswith('$') and arg[1:] in REGISTER_INDEX:
+        return [arg[1:]]
+    return []
+
+def call_effects(globals_: Set[str], reads_all: bool = False) -> Tuple[Set[str], Set[str]]:
+    """Registers a call to a program function reads and writes under the calling convention.
+
+    The callee reads its arguments, the stack and the globals (or anything, for
+    code with inline assembly). It may write every register except the caller-saved
+    ones, which save_live_registers keeps when they are live across the call.
+    """
+    uses = ALL_REGISTERS if reads_all else set(ARGUMENT_REGISTERS) | {'RSP', 'RBP'} | set(globals_)
+    return set(uses), set(ALL_REGISTERS - (CALLER_SAVED - set(globals_)))
+
+def effects(instr: Instr, calls: Tuple[Set[str], Set[str]] = None) -> Tuple[Set[str], Set[str]]:
+    """Registers an instruction reads and writes; unknown instructions are assumed to touch every register they name.
+
+    Calls to program functions have the given `calls` effects, or read and write
+    every register.
+    """
+    op, args = instr.op, instr.args
+    if op in (';', '#', 'DB'):
+        return set(), set()
+    named = {reg for arg in args for reg in registers_in(arg)}
+    if op in ('MOV', 'MOVADDR') or op in BINARY_OPS:
+        return {reg for arg in args[1:] for reg in registers_in(arg)}, set(registers_in(args[0]))
+    if op in ('INC', 'DEC', 'NOT'):
+        return named, named
+    if op == 'PUSH':
+        return named | {'RSP'}, {'RSP'}
+    if op == 'POP':
+        return {'RSP'}, named | {'RSP'}
+    if op in ('ENTER', 'LEAVE'):
+        return named | {'RSP', 'RBP'}, {'RSP', 'RBP'}
+    if op == 'RET':
+        return {'RSP', 'RAX'}, {'RSP'}
+    if op == 'CALL':
+        name = args[0].lstrip('#')
+        if name in EXTERNAL_CALLS:
+            return EXTERNAL_CALLS[name]
+        return (ALL_REGISTERS, ALL_REGISTERS) if calls is None else calls
+    if op == 'MNI':
+        if args and args[0] == 'Memory.allocate':
+            return named, set(registers_in(args[1])) if len(args) > 1 else set()
+        return named, set() if args and args[0] in PURE_MNI else named
+    if op in NO_REGISTER_DEFS or op in CONDITIONAL_JUMPS:
+        return named, set()
+    return named, named
+
+class ValueTable:
+    """Value numbers shared by every block of a function: expressions and constants map to numbers."""
+
+    def __init__(self, temporaries: Set[str] = None):
+        self.temporaries = temporaries or set()  # Holders of last resort, so results land in variables
+        self.count = 0
+        self.expressions: Dict[tuple, int] = {}
+        self.literals: Dict[int, str] = {}  # value number -> literal operand text
+
+    def new(self) -> int:
+        self.count += 1
+        return self.count
+
+    def literal(self, text: str) -> int:
+        number = parse_int(text)
+        key = ('const', number) if number is not None else ('literal', text)
+        if key not in self.expressions:
+            value = self.new()
+            self.expressions[key] = value
+            self.literals[value] = str(number) if number is not None else text
+        return self.expressions[key]
+
+    def number_block(self, block: Block, state: Dict[str, int]) -> Dict[str, int]:
+        """Rewrite one block given the value held by each register on entry; returns the state on exit."""
+        holders: Dict[int, List[str]] = {}
+        for reg, value in state.items():
+            holders.setdefault(value, []).append(reg)
+
+        def value_of(arg: str) -> int:
+            if arg in REGISTER_INDEX:
+                if arg not in state:
+                    assign(arg, self.new())  # Unknown on entry: name the value the register holds now
+                return state[arg]
+            return self.literal(arg)
+
+        def holder(value: int) -> Optional[str]:
+            regs = holders.get(value)
+            if not regs:
+                return None
+            return next((reg for reg in regs if reg not in self.temporaries), regs[0])
+
+        def operand(value: int, arg: str, allow_literal: bool = True) -> str:
+            if allow_literal and value in self.literals:
+                return self.literals[value]
+            return holder(value) or arg
+
+        def assign(reg: str, value: int):
+            old = state.get(reg)
+            if old is not None:
+                holders[old].remove(reg)
+            state[reg] = value
+            holders.setdefault(value, []).append(reg)
+
+        result = []
+        for instr in block.instrs:
+            op, args = instr.op, instr.args
+            if op in BINARY_OPS and args[0] in REGISTER_INDEX:
+                dest, left, right = args
+                left_value, right_value = value_of(left), value_of(right)
+                folded = fold(op, self.literals.get(left_value), self.literals.get(right_value))
+                if folded is not None:
+                    instr = Instr('MOV', [dest, folded])
+                    op, args = 'MOV', instr.args
+                else:
+                    if op in COMMUTATIVE and right_value < left_value:
+                        left_value, right_value = right_value, left_value
+                    key = (op, left_value, right_value)
+                    value = self.expressions.get(key)
+                    if value is not None and holder(value):
+                        instr = Instr('MOV', [dest, holder(value)])  # Already computed: reuse it
+                        op, args = 'MOV', instr.args
+                    else:
+                        instr.args = [dest, operand(value_of(left), left), operand(value_of(right), right)]
+                        if value is None:
+                            value = self.expressions[key] = self.new()
+                        assign(dest, value)
+                        result.append(instr)
+                        continue
+            if op == 'MOV' and args[0] in REGISTER_INDEX and not args[1].startswith('$'):
+                dest = args[0]
+                value = value_of(args[1])
+                if state.get(dest) == value:
+                    continue  # The register already holds this value
+                instr.args = [dest, operand(value, args[1])]
+                assign(dest, value)
+                result.append(instr)
+                continue
+            if op == 'CMP' and len(args) == 2:
+                instr.args = [operand(value_of(args[0]), args[0], False), operand(value_of(args[1]), args[1])]
+            elif op == 'PUSH' and args[0] in REGISTER_INDEX:
+                instr.args = [operand(value_of(args[0]), args[0])]
+            _, defs = effects(instr)
+            if defs is ALL_REGISTERS:
+                state.clear()
+                holders.clear()
+            else:
+                for reg in defs:
+                    assign(reg, self.new())
+            result.append(instr)
+        block.instrs = result
+        return state
+
+def fold(op: str, left: Optional[str], right: Optional[str]) -> Optional[str]:
+    """Constant result of an operation on two integer literals, if it can be computed at compile time."""
+    a, b = parse_int(left) if left else None, parse_int(right) if right else None
+    if a is None or b is None:
+        return None
+    if op == 'DIV':
+        return str(int(a / b)) if b != 0 else None
+    if op in ('SHL', 'SHR') and b < 0:
+        return None
+    operations = {'ADD': a + b, 'SUB': a - b, 'MUL': a * b, 'AND': a & b, 'OR': a | b, 'XOR': a ^ b}
+    if op in operations:
+        return str(operations[op])
+    return str(a << b if op == 'SHL' else a >> b)
+
+def reverse_postorder(fn: IRFunction, blocks: Dict[str, Block]) -> List[Block]:
+    order = []
+    visited = set()
+    for root in fn.blocks:
+        if id(root) in visited:
+            continue
+        visited.add(id(root))
+        stack = [(root, iter(fn.successors(root, blocks)))]
+        while stack:
+            block, successors = stack[-1]
+            for succ in successors:
+                if id(succ) not in visited:
+                    visited.add(id(succ))
+                    stack.append((succ, iter(fn.successors(succ, blocks))))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+    order.reverse()
+    return order
+
+def number_values(fn: IRFunction):
+    """Local value numbering, carried along the CFG so values computed in dominating blocks are reused.
+
+    Blocks are visited in reverse postorder. A block starts with the register
+    values its already-visited predecessors agree on; loop headers, whose back
+    edges have not been visited yet, and externally visible labels start empty.
+    """
+    if not fn.blocks:
+        return
+    blocks = fn.block_map()
+    preds = fn.predecessors()
+    table = ValueTable(fn.temporaries)
+    exit_states: Dict[int, Dict[str, int]] = {}
+    for block in reverse_postorder(fn, blocks):
+        incoming = preds[id(block)]
+        state: Dict[str, int] = {}
+        if incoming and block is not fn.blocks[0] and (block.label is None or is_internal(block.label)) \
+                and all(id(pred) in exit_states for pred in incoming):
+            first = exit_states[id(incoming[0])]
+            state = {reg: value for reg, value in first.items()
+                     if all(exit_states[id(pred)].get(reg) == value for pred in incoming[1:])}
+        exit_states[id(block)] = table.number_block(block, state)
+
+def liveness(fn: IRFunction, blocks: Dict[str, Block]) -> Dict[int, int]:
+    """Registers live at the end of each block, as masks. Every register except the
+    function's temporaries and locals is assumed live where control leaves the unit."""
+    everything = (1 << len(REGISTERS)) - 1
+    at_exit = everything & ~mask(fn.locals)
+    if fn.temporaries is not None:
+        at_exit &= ~mask(fn.temporaries)
+
+    def leaves_unit(block: Block) -> bool:
+        term = block.terminator()
+        if term is not None and (term.op in ('RET', 'HLT', 'EXIT') or any(label not in blocks for label in term.targets())):
+            return True
+        return block.next is None and not block.ends_unconditionally()
+
+    summaries = {}
+    for block in fn.blocks:
+        uses = defs = 0
+        for instr in reversed(block.instrs):
+            instr_uses, instr_defs = (mask(regs) for regs in effects(instr, fn.calls))
+            uses = (uses & ~instr_defs) | instr_uses
+            defs |= instr_defs
+        summaries[id(block)] = (uses, defs)
+    preds = fn.predecessors()
+    live_in = {id(block): 0 for block in fn.blocks}
+    live_out = {}
+    pending = list(fn.blocks)
+    queued = {id(block) for block in pending}
+    while pending:
+        block = pending.pop()
+        queued.discard(id(block))
+        out = at_exit if leaves_unit(block) else 0
+        for succ in fn.successors(block, blocks):
+            out |= live_in[id(succ)]
+        live_out[id(block)] = out
+        uses, defs = summaries[id(block)]
+        new_in = uses | (out & ~defs)
+        if new_in != live_in[id(block)]:
+            live_in[id(block)] = new_in
+            for pred in preds[id(block)]:
+                if id(pred) not in queued:
+                    queued.add(id(pred))
+                    pending.append(pred)
+    return live_out
+
+def eliminate_dead_code(fn: IRFunction):
+    """Remove register writes nobody reads, and compute results straight into the register a copy moves them to."""
+    blocks = fn.block_map()
+    changed = True
+    while changed:
+        changed = False
+        live_out = liveness(fn, blocks)
+        for block in fn.blocks:
+            live = live_out[id(block)]
+            instrs = block.instrs
+            kept = []
+            for i in range(len(instrs) - 1, -1, -1):
+                instr = instrs[i]
+                instr_uses, instr_defs = effects(instr, fn.calls)
+                defs_mask = mask(instr_defs)
+                if instr.op in REMOVABLE and instr_defs and not live & defs_mask or (
+                        instr.op == 'MOV' and instr.args[0] == instr.args[1]):
+                    changed = True
+                    continue
+                if instr.op == 'MOV' and i > 0 and instr.args[0] in REGISTER_INDEX and instr.args[1] in REGISTER_INDEX \
+                        and not live & mask([instr.args[1]]):
+                    # `t = a + b; d = t` with t dead afterwards: compute into d directly
+                    previous = instrs[i - 1]
+                    if (previous.op == 'MOV' or previous.op in BINARY_OPS) and previous.args[0] == instr.args[1]:
+                        previous.args[0] = instr.args[0]
+                        changed = True
+                        continue
+                live = (live & ~defs_mask) | mask(instr_uses)
+                kept.append(instr)
+            kept.reverse()
+            block.instrs = kept
+
+def save_live_registers(fn: IRFunction):
+    """Push the registers live across each call to a function of the program and pop them after it.
+
+    The callee may overwrite every register except RSP, RBP and the program's
+    globals, so the caller keeps what it still needs. RAX returns the result and
+    the argument registers are not preserved. Saves go before the call's
+    stack arguments (counted from the `ADD RSP` that drops them after the call);
+    code generation only writes temporaries and argument registers in between.
+    """
+    if fn.calls is None:
+        return  # Calls are assumed to read and write everything, so nothing is live across one
+    blocks = fn.block_map()
+    live_out = liveness(fn, blocks)
+    saved = mask(CALLER_SAVED - fn.globals)
+    for block in fn.blocks:
+        live = live_out[id(block)]
+        after = [0] * len(block.instrs)  # Registers live after each instruction
+        for i in range(len(block.instrs) - 1, -1, -1):
+            after[i] = live
+            uses, defs = effects(block.instrs[i], fn.calls)
+            live = (live & ~mask(defs)) | mask(uses)
+        calls = [i for i, instr in enumerate(block.instrs)
+                 if instr.op == 'CALL' and instr.args[0].lstrip('#') not in EXTERNAL_CALLS]
+        for i in reversed(calls):
+            instrs = block.instrs
+            cleanup = i + 1 < len(instrs) and instrs[i + 1].op == 'ADD' and instrs[i + 1].args[:2] == ['RSP', 'RSP']
+            end = i + 2 if cleanup else i + 1
+            keep = [reg for reg in REGISTERS if after[end - 1] & saved & mask([reg])]
+            if not keep:
+                continue
+            start = i
+            pushes = (parse_int(instrs[i + 1].args[2]) or 0) // WORD if cleanup else 0
+            while pushes and start > 0:
+                start -= 1
+                if instrs[start].op == 'PUSH':
+                    pushes -= 1
+            block.instrs = instrs[:start] + [Instr('PUSH', [reg]) for reg in keep] + instrs[start:end] \
+                + [Instr('POP', [reg]) for reg in reversed(keep)] + instrs[end:]
+
+def mask(registers) -> int:
+    result = 0
+    for reg in registers:
+        result |= 1 << REGISTER_INDEX[reg]
+    return result
+
+def emit(fn: IRFunction) -> List[str]:
+    """Lay the blocks out as MicroASM lines, dropping jumps to the next block and adding them where a fall-through was moved."""
+    for i, block in enumerate(fn.blocks):
+        following = fn.blocks[i + 1] if i + 1 < len(fn.blocks) else None
+        term = block.terminator()
+        if term is not None and term.op == 'JMP' and len(term.args) == 1 and following is not None \
+                and term.targets()[0] == following.label:
+            block.instrs.pop()
+            block.next = following
+        elif term is not None and term.op in CONDITIONAL_JUMPS and len(term.args) == 1 and following is not None \
+                and term.targets()[0] == following.label and block.next is not None and block.next is not following:
+            term.op = INVERTED[term.op]  # Jump to the fall-through block instead and fall into the target
+            term.args = [f"#{fn.label_of(block.next)}"]
+            block.next = following
+        if block.next is not None and block.next is not following:
+            block.instrs.append(Instr('JMP', [f"#{fn.label_of(block.next)}"]))
+            block.next = None
+
+    referenced = set()
+    for block in fn.blocks:
+        for instr in block.instrs:
+            referenced.update(arg[1:] for arg in instr.args if arg.startswith('#'))
+    lines = []
+    for i, block in enumerate(fn.blocks):
+        if block.label is not None and (i == 0 or block.label in referenced or not is_internal(block.label)):
+            lines.append(f"LBL {block.label}")
+        for instr in block.instrs:
+            lines.extend(INDENT + line for line in lower(instr))
+    return lines
@@ -0,0 +1,99 @@
+"""Compile-time plan of the program's static memory image.
+
+Every byte the program addresses outside the stack is placed here: the pooled
+strings of each unit, the globals area, the shared scratch buffer formatted
+prints write into, and the frames of functions whose locals can live at fixed
+addresses. Regions that are live for the whole run are packed in order. The
+others are overlaid: each goes at the lowest aligned offset where it overlaps
+no region it may be live at the same time as, so disjoint lifetimes share bytes.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+KINDS = ('strings', 'globals', 'scratch', 'frame')
+
+def align_up(value: int, align: int) -> int:
+    return -(-value // align) * align
+
+class Region:
+    """A block of the image; `conflicts` None means live for the whole run."""
+
+    def __init__(self, name: str, kind: str, size: int, align: int = 1, conflicts: Optional[Set[str]] = None,
+                 words: Dict[int, int] = None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown region kind '{kind}'")
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.align = align
+        self.conflicts = conflicts  # Names of overlaid regions that may be live at the same time as this one
+        self.words = words or {}    # Offset in the region -> initial 8-byte value; other bytes start as zero
+        self.offset = 0             # Set by plan_layout, relative to the image base
+
+    def overlaps(self, offset: int, other: 'Region') -> bool:
+        return offset < other.offset + other.size and other.offset < offset + self.size
+
+class MemoryLayout:
+    """Where each region starts; the image covers [base, end)."""
+
+    def __init__(self, base: int, regions: List[Region]):
+        self.base = base
+        self.regions = regions
+        self.size = max((r.offset + r.size for r in regions if r.size), default=0)
+
+    @property
+    def end(self) -> int:
+        return self.base + self.size
+
+    def address(self, region: Region) -> int:
+        return self.base + region.offset
+
+    def initial_words(self) -> Dict[int, int]:
+        """Address -> value of every word with a value planned at compile time."""
+        return {self.address(region) + offset: value for region in self.regions for offset, value in region.words.items()}
+
+    def requested(self, kind: str = None) -> int:
+        """Bytes asked for by the regions (of one kind), before overlaying."""
+        return sum(r.size for r in self.regions if kind in (None, r.kind))
+
+    def report(self) -> str:
+        lines = [f"Static image: {self.size} bytes at {self.base}..{self.end}"]
+        for region in sorted(self.regions, key=lambda r: (r.offset, r.kind)):
+            if region.size:
+                lines.append(f"  {self.address(region):>8}  {region.size:>6}  {region.kind:<8} {region.name}")
+        totals = ', '.join(f"{kind} {self.requested(kind)}" for kind in KINDS)
+        lines.append(f"Requested: {totals}; {self.requested() - self.size} bytes shared by overlaid regions")
+        return '\n'.join(lines)
+
+def plan_layout(regions: Iterable[Region], base: int) -> MemoryLayout:
+    """Pack the permanent regions in order, then overlay the rest above them, largest first.
+
+    Alignment applies to addresses, so offsets depend on `base`.
+    """
+    regions = list(regions)
+    offset = 0
+    for region in regions:
+        if region.conflicts is None and region.size:
+            region.offset = offset = align_up(base + offset, region.align) - base
+            offset += region.size
+    overlay_start = offset
+    placed: List[Region] = []
+    overlaid = [r for r in regions if r.conflicts is not None and r.size]
+    for region in sorted(overlaid, key=lambda r: -r.size):  # Stable, so ties keep their order
+        clashing = [other for other in placed if other.name in region.conflicts or region.name in other.conflicts]
+        # The lowest fit starts at the overlay area or right after a region it must avoid
+        candidates = sorted({align_up(base + start, region.align) - base for start in
+                             [overlay_start] + [other.offset + other.size for other in clashing]})
+        region.offset = next(start for start in candidates if not any(region.overlaps(start, other) for other in clashing))
+        placed.append(region)
+    return MemoryLayout(base, regions)
+
+def reachable(calls: Dict[str, Set[str]], start: str) -> Set[str]:
+    """Functions a call to `start` may enter, directly or through other calls."""
+    seen: Set[str] = set()
+    pending = list(calls.get(start, ()))
+    while pending:
+        name = pending.pop()
+        if name not in seen:
+            seen.add(name)
+            pending.extend(calls.get(name, ()))
+    return seen
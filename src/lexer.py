@@ -7,6 +7,7 @@ class Lexer:
     def __init__(self, source: str):
         self.source = source
         self.tokens: List[Token] = []
+        self.offsets: List[int] = []  # Source offset of each token's first character
         self.current = 0
 
     def tokenize(self) -> List[Token]:
@@ -29,8 +30,8 @@ class Lexer:
             ('LBRACE',   r'\{'),
             ('RBRACE',   r'\}'),
             ('COMMA',    r','),
+            ('COMMENT',  r'//.*|;.*'),  # Match comments (before OP so '//' is not two divisions)
             ('OP',       r'[+\-*/]'),
-            ('COMMENT',  r'//.*|;.*'),  # Match comments
             ('NEWLINE',  r'\n'),
             ('SKIP',     r'[ \t]+'),
             ('MISMATCH', r'.'),      # Should match any other character
@@ -57,11 +58,13 @@ class Lexer:
                 
                 # Add the ASM token
                 self.tokens.append((kind, value))
+                self.offsets.append(mo.start())
                 
                 # If we find '{' immediately after 'asm', capture the entire block
                 if next_pos < len(self.source) and self.source[next_pos] == '{':
                     # Manually add the LBRACE token
                     self.tokens.append(('LBRACE', '{'))
+                    self.offsets.append(next_pos)
                     
                     # Start after the '{'
                     pos = next_pos + 1
@@ -92,9 +95,11 @@ class Lexer:
                     # Add the assembly content as a single token
                     if asm_text:
                         self.tokens.append(('ASM_CONTENT', asm_text))
+                        self.offsets.append(next_pos + 1)
                     
                     # Add the closing brace
                     self.tokens.append(('RBRACE', '}'))
+                    self.offsets.append(pos)
                     
                     # Update position and get next token
                     self.current = pos + 1
@@ -109,6 +114,7 @@ class Lexer:
                 
             if not (kind == 'SKIP' or kind == 'NEWLINE' or kind == 'COMMENT'):
                 self.tokens.append((kind, value))
+                self.offsets.append(mo.start())
                 
             self.current = mo.end()
             mo = get_token(self.source, self.current)
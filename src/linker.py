@@ -0,0 +1,252 @@
+import re
+import json
+from typing import Dict, List, Set
+from masm import split_line, unquote
+from layout import Region, MemoryLayout, plan_layout, reachable
+
+OBJECT_FORMAT = 'uhigh-object'
+OBJECT_VERSION = 3
+RUNTIME_SYMBOLS = {'printf', 'printint', 'readint'}  # Provided by the stdio include
+BRANCHES = {'CALL', 'JMP', 'JE', 'JNE', 'JL', 'JG', 'JLE', 'JGE'}
+
+# Relocation markers written by a relocatable compile: {{L<n>}} for a unit-local
+# label id, {{D<n>}} for a unit-local data address, {{G<n>}} for a byte offset
+# in the globals area shared by the units of one source file, {{S<n>}} for a
+# byte offset in the program's scratch buffer and {{F<n>}} for a byte offset in
+# the unit's static frame.
+RELOC_PATTERN = re.compile(r'\{\{([LDGSF])(\d+)\}\}')
+GLOBAL_PATTERN = re.compile(r'\{\{G(\d+)\}\}')
+WORD = 8
+INIT_LABEL = '__init_globals'  # Routine running the top-level statements, called first thing by main
+
+def label_marker(label_id: int) -> str:
+    return f"{{{{L{label_id}}}}}"
+
+def data_marker(addr: int) -> str:
+    return f"{{{{D{addr}}}}}"
+
+def global_marker(offset: int) -> str:
+    return f"{{{{G{offset}}}}}"
+
+def scratch_marker(offset: int) -> str:
+    return f"{{{{S{offset}}}}}"
+
+def frame_marker(offset: int) -> str:
+    return f"{{{{F{offset}}}}}"
+
+class CodeUnit:
+    """Code generated for one function (or run of top-level statements) with local label and data namespaces."""
+
+    def __init__(self, name: str, lines: List[str], label_count: int, data_size: int,
+                 scratch_size: int = 0, frame_size: int = 0, initial_values: Dict[int, int] = None):
+        self.name = name
+        self.lines = lines
+        self.label_count = label_count
+        self.data_size = data_size
+        self.scratch_size = scratch_size  # Bytes of the shared scratch buffer the unit uses
+        self.frame_size = frame_size      # Bytes of the unit's static frame
+        self.initial_values = initial_values or {}  # Globals-area offset -> constant the cell holds at entry to main
+
+def relocate(line: str, label_base: int, data_base: int, globals_base: int = 0, scratch_base: int = 0,
+             frame_base: int = 0) -> str:
+    def replace(match):
+        base = {'L': label_base, 'D': data_base, 'G': globals_base, 'S': scratch_base, 'F': frame_base}[match.group(1)]
+        return str(base + int(match.group(2)))
+    return RELOC_PATTERN.sub(replace, line)
+
+def globals_size(units: List[CodeUnit]) -> int:
+    """Bytes of the globals area the units' {{G<n>}} markers refer to."""
+    offsets = [int(offset) for unit in units for line in unit.lines for offset in GLOBAL_PATTERN.findall(line)]
+    return max(offsets) + WORD if offsets else 0
+
+def shift_globals(units: List[CodeUnit], offset: int) -> List[CodeUnit]:
+    """Move the units' globals to `offset` in a larger globals area, so files linked together keep separate cells."""
+    if not offset:
+        return units
+    shift = lambda line: GLOBAL_PATTERN.sub(lambda match: global_marker(int(match.group(1)) + offset), line)
+    return [CodeUnit(unit.name, [shift(line) for line in unit.lines], unit.label_count, unit.data_size, unit.scratch_size,
+                     unit.frame_size, {cell + offset: value for cell, value in unit.initial_values.items()}) for unit in units]
+
+def call_graph(units: List[CodeUnit]) -> Dict[str, Set[str]]:
+    """Functions each function unit calls or jumps to by name."""
+    names = {unit.name for unit in units if unit.name != 'global'}
+    calls: Dict[str, Set[str]] = {name: set() for name in names}
+    for unit in units:
+        if unit.name == 'global':
+            continue
+        for line in unit.lines:
+            words = split_line(line)
+            if len(words) == 2 and words[0].upper() in BRANCHES and words[1][1:] in names:
+                calls[unit.name].add(words[1][1:])
+    return calls
+
+def plan_regions(units: List[CodeUnit]) -> List[Region]:
+    """The image's regions, in unit order: strings, the globals area, the scratch buffer, then the static frames.
+
+    Formatted prints use the scratch buffer only until printf returns, so one
+    buffer serves the whole program. Two static frames may share bytes unless
+    one function can reach the other, when both can be active at once.
+    """
+    regions = [Region(unit.name, 'strings', unit.data_size) for unit in units]
+    initial_values = {cell: value for unit in units for cell, value in unit.initial_values.items()}
+    regions.append(Region('globals', 'globals', globals_size(units), WORD, words=initial_values))
+    regions.append(Region('scratch', 'scratch', max((unit.scratch_size for unit in units), default=0), WORD))
+    calls = call_graph(units)
+    reached = {unit.name: reachable(calls, unit.name) for unit in units if unit.frame_size}
+    for unit in units:
+        if unit.frame_size:
+            conflicts = {name for name, callees in reached.items() if name in reached[unit.name] or unit.name in callees}
+            regions.append(Region(unit.name, 'frame', unit.frame_size, WORD, conflicts))
+    return regions
+
+class LinkResult:
+    def __init__(self, lines: List[str], label_end: int, layout: MemoryLayout):
+        self.lines = lines
+        self.label_end = label_end
+        self.layout = layout
+        self.data_end = layout.end
+
+    def image(self) -> bytes:
+        """The static memory image from its base address: strings and constant globals in place, every other byte zero."""
+        image = bytearray(self.layout.size)
+        for line in self.lines:
+            words = split_line(line)
+            if words and words[0].upper() == 'DB':
+                start = int(words[1].lstrip('$')) - self.layout.base
+                raw = unquote(words[2]).encode('utf-8') + b'\0'
+                image[start:start + len(raw)] = raw
+        for addr, value in self.layout.initial_words().items():
+            start = addr - self.layout.base
+            image[start:start + WORD] = value.to_bytes(WORD, 'little', signed=True)
+        return bytes(image)
+
+def link(units: List[CodeUnit], label_base: int = 0, data_base: int = 100) -> LinkResult:
+    """Plan the static image, then lay the units out in order, renumbering labels and relocating addresses.
+
+    The image's DB lines come first, as one block in address order, and the code follows.
+    When the program has a main, its top-level statements move into a routine main calls.
+    """
+    regions = plan_regions(units)
+    layout = plan_layout(regions, data_base)
+    strings, (globals_area, scratch), frames = regions[:len(units)], regions[len(units):len(units) + 2], regions[len(units) + 2:]
+    frame_bases = {region.name: layout.address(region) for region in frames}
+    data, code, init = [], [], []
+    has_main = any(unit.name == 'main' for unit in units)
+    for unit, region in zip(units, strings):
+        bases = (label_base, layout.address(region), layout.address(globals_area), layout.address(scratch),
+                 frame_bases.get(unit.name, 0))
+        target = init if unit.name == 'global' and has_main else code
+        for line in unit.lines:
+            words = split_line(line)
+            if words and words[0].upper() == 'DB':
+                data.append(relocate(line.strip(), *bases))
+            else:
+                target.append(relocate(line, *bases))
+        label_base += unit.label_count
+    data.sort(key=lambda line: int(split_line(line)[1].lstrip('$')))
+    if any(split_line(line) for line in init):
+        call_init(code, init)
+    header = [f";; Static data: {layout.size} bytes at {layout.base}..{layout.end}"] if layout.size else []
+    return LinkResult(header + data + ([""] if data else []) + code, label_base, layout)
+
+def call_init(code: List[str], init: List[str]):
+    """Run the top-level statements, in program order, as a routine main calls before its own code.
+
+    Execution starts at main, so code laid out ahead of it would never run.
+    """
+    entry = next((i for i, line in enumerate(code) if split_line(line) == ['LBL', 'main']), None)
+    if entry is None:
+        code[:0] = init
+        return
+    code.insert(entry + 1, f"    CALL #{INIT_LABEL}")
+    code.extend([f"LBL {INIT_LABEL}", *init, "    RET"])
+
+class LinkError(Exception):
+    """Duplicate or undefined symbols; `problems` lists each one."""
+
+    def __init__(self, problems: List[str]):
+        super().__init__('\n'.join(problems))
+        self.problems = problems
+
+class ObjectFile:
+    """The relocatable code of one source file and the symbols it defines and uses."""
+
+    def __init__(self, name: str, units: List[CodeUnit], exports: List[str], imports: List[str],
+                 dependencies: Dict[str, str] = None, pipeline: str = ''):
+        self.name = name
+        self.units = units
+        self.exports = exports  # Labels other objects may jump to or call: functions and inline asm labels
+        self.imports = imports  # Symbols this object calls but does not define
+        self.dependencies = dependencies or {}  # Source and included files -> content digest
+        self.pipeline = pipeline  # Optimization passes the object was compiled with
+
+    @classmethod
+    def from_units(cls, name: str, units: List[CodeUnit]) -> 'ObjectFile':
+        exports, referenced = [], []
+        for unit in units:
+            for line in unit.lines:
+                words = split_line(line)
+                if len(words) < 2 or RELOC_PATTERN.search(words[1]):
+                    continue  # Unit-local labels are relocated, not linked by name
+                op = words[0].upper()
+                if op == 'LBL':
+                    exports.append(words[1])
+                elif op in BRANCHES:
+                    referenced.extend(word[1:] for word in words[1:] if word.startswith('#') and not RELOC_PATTERN.search(word))
+        defined = set(exports)
+        imports = sorted({symbol for symbol in referenced if symbol not in defined and symbol not in RUNTIME_SYMBOLS})
+        return cls(name, units, exports, imports)
+
+    def to_dict(self) -> Dict:
+        return {
+            'format': OBJECT_FORMAT,
+            'version': OBJECT_VERSION,
+            'name': self.name,
+            'exports': self.exports,
+            'imports': self.imports,
+            'dependencies': self.dependencies,
+            'pipeline': self.pipeline,
+            'units': [{'name': unit.name, 'label_count': unit.label_count, 'data_size': unit.data_size,
+                       'scratch_size': unit.scratch_size, 'frame_size': unit.frame_size,
+                       'initial_values': unit.initial_values, 'lines': unit.lines}
+                      for unit in self.units],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ObjectFile':
+        if data.get('format') != OBJECT_FORMAT or data.get('version') != OBJECT_VERSION:
+            raise ValueError("Not a μHigh object file of a supported version")
+        units = [CodeUnit(unit['name'], unit['lines'], unit['label_count'], unit['data_size'], unit['scratch_size'],
+                          unit['frame_size'], {int(cell): value for cell, value in unit['initial_values'].items()})
+                 for unit in data['units']]
+        return cls(data['name'], units, data['exports'], data['imports'], data['dependencies'], data.get('pipeline', ''))
+
+def write_object(path: str, obj: ObjectFile):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj.to_dict(), f, ensure_ascii=False)
+
+def read_object(path: str) -> ObjectFile:
+    with open(path, 'r', encoding='utf-8') as f:
+        return ObjectFile.from_dict(json.load(f))
+
+def link_objects(objects: List[ObjectFile], label_base: int = 0, data_base: int = 100) -> LinkResult:
+    """Check that every symbol is defined exactly once, then link the objects' units in order."""
+    problems = []
+    defined: Dict[str, str] = {}
+    for obj in objects:
+        for symbol in obj.exports:
+            if symbol in defined:
+                problems.append(f"duplicate symbol '{symbol}' in {defined[symbol]} and {obj.name}")
+            else:
+                defined[symbol] = obj.name
+    for obj in objects:
+        for symbol in obj.imports:
+            if symbol not in defined:
+                problems.append(f"undefined symbol '{symbol}' referenced in {obj.name}")
+    if problems:
+        raise LinkError(problems)
+    units, offset = [], 0
+    for obj in objects:
+        units.extend(shift_globals(obj.units, offset))
+        offset += globals_size(obj.units)
+    return link(units, label_base, data_base)
@@ -0,0 +1,107 @@
+from typing import List, Dict, Tuple, Optional
+
+# Register names in the order used by tools that need a numeric register id
+REGISTERS = ['RAX', 'RBX', 'RCX', 'RDX', 'RSI', 'RDI', 'RBP', 'RSP', 'RIP'] + [f"R{i}" for i in range(16)]
+REGISTER_INDEX = {name: i for i, name in enumerate(REGISTERS)}
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"'}
+
+class Instruction:
+    def __init__(self, op: str, args: List[str], line: int = 0):
+        self.op = op
+        self.args = args
+        self.line = line
+
+    def __repr__(self):
+        return f"Instruction({self.op!r}, {self.args!r})"
+
+class MasmProgram:
+    def __init__(self):
+        self.instructions: List[Instruction] = []
+        self.labels: Dict[str, int] = {}           # label name -> instruction index
+        self.data: List[Tuple[int, str]] = []      # (address, decoded string) from DB
+        self.includes: List[str] = []
+
+def split_line(line: str) -> List[str]:
+    """Split a MicroASM line into words, keeping quoted strings intact and dropping comments."""
+    if '"' not in line and ';' not in line and '//' not in line:
+        return line.split()  # Most instructions: nothing to scan character by character
+    words = []
+    current = ''
+    in_string = False
+    i = 0
+    while i < len(line):
+        ch = line[i]
+        if in_string:
+            current += ch
+            if ch == '\\' and i + 1 < len(line):
+                current += line[i + 1]
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            current += ch
+            in_string = True
+        elif ch == ';' or line.startswith('//', i):
+            break
+        elif ch.isspace():
+            if current:
+                words.append(current)
+                current = ''
+        else:
+            current += ch
+        i += 1
+    if in_string:
+        raise ValueError(f"Unterminated string in line: {line.strip()}")
+    if current:
+        words.append(current)
+    return words
+
+def unquote(text: str) -> str:
+    """Strip the quotes from a string literal and process escape sequences."""
+    body = text[1:-1]
+    result = ''
+    i = 0
+    while i < len(body):
+        if body[i] == '\\' and i + 1 < len(body):
+            result += ESCAPES.get(body[i + 1], body[i + 1])
+            i += 2
+        else:
+            result += body[i]
+            i += 1
+    return result
+
+def parse_int(text: str) -> Optional[int]:
+    try:
+        return int(text, 0)
+    except ValueError:
+        return None
+
+def parse_masm(source: str) -> MasmProgram:
+    """Parse MicroASM text into instructions, labels, DB data and includes."""
+    program = MasmProgram()
+    for line_num, line in enumerate(source.split('\n'), 1):
+        stripped = line.strip()
+        if stripped.startswith('#include'):
+            words = split_line(stripped)
+            program.includes.append(unquote(words[1]) if len(words) > 1 else '')
+            continue
+        words = split_line(stripped)
+        if not words:
+            continue
+        op = words[0].upper()
+        args = words[1:]
+        if op == 'LBL':
+            if len(args) != 1:
+                raise ValueError(f"LBL expects one name on line {line_num}")
+            name = args[0].lstrip('#')
+            if name in program.labels:
+                raise ValueError(f"Duplicate label '{name}' on line {line_num}")
+            program.labels[name] = len(program.instructions)
+        elif op == 'DB':
+            if len(args) != 2 or not args[0].startswith('$') or not args[1].startswith('"'):
+                raise ValueError(f"DB expects an address and a string on line {line_num}")
+            program.data.append((int(args[0][1:]), unquote(args[1])))
+        else:
+            program.instructions.append(Instruction(op, args, line_num))
+    return program
@@ -1,4 +1,4 @@
-from typing import List, Union, Tuple
+from typing import List, Union, Tuple, Callable, Optional
 from lexer import Lexer, Token
 
 class ASTNode:
@@ -57,6 +57,14 @@ class InlineAsm(ASTNode):
     def __init__(self, code: str):
         self.code = code
 
+class Input(ASTNode):
+    def __init__(self, name: str):
+        self.name = name
+
+class Return(ASTNode):
+    def __init__(self, value: Union[str, int] = None):
+        self.value = value
+
 class Parser:
     def __init__(self, tokens: List[Token], debug: bool = False):
         self.tokens = tokens
@@ -65,51 +73,54 @@ class Parser:
         self.declared_vars = set()  # Track declared variables
 
     def parse(self) -> Program:
-        statements = []
-        while self.current < len(self.tokens):
-            statements.append(self.statement())
+        statements = self.statements(nested=False)
         for stmt in statements:
             if isinstance(stmt, InlineAsm):
                 print(f"Inline ASM detected: {stmt.code}")
         # Print the final AST for debugging
         if self.debug:
             print("\nFinal AST:")
-        def print_ast(node, level=0):
+            self.print_ast(statements)
+        return Program(statements)
+
+    def print_ast(self, root):
+        """Print a node tree using an explicit stack so deep nesting cannot overflow."""
+        pending = [(root, 0)]
+        while pending:
+            node, level = pending.pop()
             indent = "  " * level
+            if isinstance(node, str) and level < 0:
+                print(node)  # Deferred line queued by a parent node
+                continue
             if isinstance(node, list):
-                for item in node:
-                    print_ast(item, level)
-                return
+                pending.extend((item, level) for item in reversed(node))
+                continue
 
             if isinstance(node, (str, int)):
-                if self.debug:
-                    print(f"{indent}{node}")
-                return
+                print(f"{indent}{node}")
+                continue
 
             node_type = node.__class__.__name__
             attrs = {}
-
+            actions = []
             for k, v in node.__dict__.items():
                 if isinstance(v, list):
-                    if self.debug:
-                        print(f"{indent}{node_type}.{k}:")
-                    for item in v:
-                        print_ast(item, level + 1)
+                    actions.append((f"{indent}{node_type}.{k}:", -1))
+                    actions.extend((item, level + 1) for item in v)
                 elif isinstance(v, ASTNode):
-                    if self.debug:
-                        print(f"{indent}{node_type}.{k}:")
-                    print_ast(v, level + 1)
+                    actions.append((f"{indent}{node_type}.{k}:", -1))
+                    actions.append((v, level + 1))
                 else:
-                    attrs[k] = v             
-
-            if attrs and self.debug:
-                print(f"{indent}{node_type}: {attrs}")
-
-        for stmt in statements:
-            print_ast(stmt)
-        return Program(statements)
+                    attrs[k] = v
+            if attrs:
+                actions.append((f"{indent}{node_type}: {attrs}", -1))
+            pending.extend(reversed(actions))
 
     def statement(self) -> ASTNode:
+        """Parse one statement; compound statements are parsed without recursion."""
+        return self.statements(nested=False, limit=1)[0]
+
+    def simple_statement(self) -> ASTNode:
         token = self.tokens[self.current]
         if token[0] == 'IDENT' and token[1] == 'include':
             return self.include_stmt()
@@ -119,12 +130,10 @@ class Parser:
             return self.const_decl()
         elif token[0] == 'PRINT':  # Handle the PRINT token directly
             return self.print_stmt()
-        elif token[0] == 'IDENT' and token[1] == 'if':
-            return self.if_stmt()
-        elif token[0] == 'IDENT' and token[1] == 'while':
-            return self.while_stmt()
-        elif token[0] == 'IDENT' and token[1] == 'func':
-            return self.func_decl()
+        elif token[0] == 'IDENT' and token[1] == 'input':
+            return self.input_stmt()
+        elif token[0] == 'IDENT' and token[1] == 'return':
+            return self.return_stmt()
         elif token[0] == 'ASM':  # <-- Changed from IDENT to ASM
             return self.inline_asm_stmt()
         elif token[0] == 'IDENT':
@@ -132,6 +141,46 @@ class Parser:
         else:
             raise RuntimeError(f'Unexpected token: {token}')
 
+    def statements(self, nested: bool, limit: int = None) -> List[ASTNode]:
+        """Parse a statement list with an explicit stack of open blocks instead of recursion.
+
+        Each open block is a (statements, on_close) pair; on_close builds the finished
+        node from the block's statements, or returns None when it opened another block
+        (an `else` arm). With nested=True the list ends at the matching '}'.
+        """
+        root: List[ASTNode] = []
+        stack = [(root, None)]
+        while True:
+            statements, on_close = stack[-1]
+            if len(stack) == 1 and limit is not None and len(root) >= limit:
+                return root
+            if self.current >= len(self.tokens):
+                if len(stack) == 1 and not nested:
+                    return root
+                raise RuntimeError('Unexpected end of file while parsing block')
+            token = self.tokens[self.current]
+            # Skip any leftover NEWLINE tokens (shouldn't happen with fixed lexer)
+            if token[0] == 'NEWLINE':
+                self.current += 1
+                continue
+            if token[0] == 'RBRACE' and (len(stack) > 1 or nested):
+                self.consume('RBRACE')
+                stack.pop()
+                if not stack:
+                    return root
+                node = on_close(statements)
+                if node is not None:
+                    stack[-1][0].append(node)
+                continue
+            if token[0] == 'IDENT' and token[1] == 'if':
+                stack.append(([], self.if_stmt(stack)))
+            elif token[0] == 'IDENT' and token[1] == 'while':
+                stack.append(([], self.while_stmt()))
+            elif token[0] == 'IDENT' and token[1] == 'func':
+                stack.append(([], self.func_decl()))
+            else:
+                statements.append(self.simple_statement())
+
     def include_stmt(self) -> Include:
         self.consume('IDENT', 'include')
         filename = self.consume('STRING')
@@ -143,19 +192,42 @@ class Parser:
         self.declared_vars.add(name)
         if self.match('ASSIGN'):
             self.consume('ASSIGN')
-            initial_value = self.expression()
+            initial_value = self.value()
             return VarDecl(name, initial_value)
         return VarDecl(name)
 
     def const_decl(self) -> ConstDecl:
         self.consume('IDENT', 'const')
         name = self.consume('IDENT')
-        self.consume('ASSIGN')
+        self.declared_vars.add(name)
+        if self.match('ASSIGN'):  # Both `const N = 1` and `const N 1` are accepted
+            self.consume('ASSIGN')
         value = int(self.consume('NUMBER'))
         return ConstDecl(name, value)
 
+    def input_stmt(self) -> Input:
+        self.consume('IDENT', 'input')
+        name = self.consume('IDENT')
+        if name not in self.declared_vars:
+            raise RuntimeError(f"Variable '{name}' used before declaration.")
+        return Input(name)
+
+    def return_stmt(self) -> Return:
+        self.consume('IDENT', 'return')
+        # The value is optional: stop at '}' or at the start of the next statement
+        if self.current < len(self.tokens):
+            token = self.tokens[self.current]
+            if token[0] in ('NUMBER', 'STRING'):
+                return Return(self.expression())
+            if (token[0] == 'IDENT' and token[1] in self.declared_vars
+                    and not (self.current + 1 < len(self.tokens) and self.tokens[self.current + 1][0] in ('ASSIGN', 'LPAREN'))):
+                return Return(self.expression())
+        return Return()
+
     def print_stmt(self) -> Print:
         self.consume('PRINT')
+        if not self.match('LPAREN'):  # `print x` without parentheses
+            return Print([self.expression()])
         self.consume('LPAREN')
         args = [self.expression()]
         while self.current < len(self.tokens) and self.tokens[self.current][0] == 'COMMA':
@@ -164,26 +236,30 @@ class Parser:
         self.consume('RPAREN')
         return Print(args)
 
-    def if_stmt(self) -> IfStatement:
+    def if_stmt(self, stack: List) -> Callable[[List[ASTNode]], Optional[IfStatement]]:
+        """Parse an if header; the returned callback closes the true block."""
         self.consume('IDENT', 'if')
         condition = self.expression()
         self.consume('LBRACE')
-        true_block = self.block()
-        false_block = []
-        if self.match('IDENT', 'else'):
-            self.consume('IDENT', 'else')
-            self.consume('LBRACE')
-            false_block = self.block()
-        return IfStatement(condition, true_block, false_block)
-
-    def while_stmt(self) -> WhileStatement:
+
+        def close_true_block(true_block):
+            if self.match('IDENT', 'else'):
+                self.consume('IDENT', 'else')
+                self.consume('LBRACE')
+                stack.append(([], lambda false_block: IfStatement(condition, true_block, false_block)))
+                return None
+            return IfStatement(condition, true_block, [])
+        return close_true_block
+
+    def while_stmt(self) -> Callable[[List[ASTNode]], WhileStatement]:
+        """Parse a while header; the returned callback closes the body."""
         self.consume('IDENT', 'while')
         condition = self.expression()
         self.consume('LBRACE')
-        body = self.block()
-        return WhileStatement(condition, body)
+        return lambda body: WhileStatement(condition, body)
 
-    def func_decl(self) -> FuncDecl:
+    def func_decl(self) -> Callable[[List[ASTNode]], FuncDecl]:
+        """Parse a function header; the returned callback closes the body."""
         self.consume('IDENT', 'func')
         name = self.consume('IDENT')
         self.consume('LPAREN')
@@ -195,8 +271,8 @@ class Parser:
                 parameters.append(self.consume('IDENT'))
         self.consume('RPAREN')
         self.consume('LBRACE')
-        body = self.block()
-        return FuncDecl(name, parameters, body)
+        self.declared_vars.update(parameters)
+        return lambda body: FuncDecl(name, parameters, body)
 
     def inline_asm_stmt(self) -> InlineAsm:
         # Print current token for debugging
@@ -228,35 +304,33 @@ class Parser:
             if name not in self.declared_vars:
                 raise RuntimeError(f"Variable '{name}' used before declaration.")
             self.consume('ASSIGN')
-            value = self.expression()
+            value = self.value()
             return Assignment(name, value)
         elif self.match('LPAREN'):
-            self.consume('LPAREN')
-            args = []
-            if not self.match('RPAREN'):
-                args.append(self.expression())
-                while self.match('COMMA'):
-                    self.consume('COMMA')
-                    args.append(self.expression())
-            self.consume('RPAREN')
-            return FuncCall(name, args)
+            return self.call_args(name)
         else:
             raise RuntimeError(f'Unexpected token after identifier: {self.tokens[self.current]}')
 
+    def call_args(self, name: str) -> FuncCall:
+        self.consume('LPAREN')
+        args = []
+        if not self.match('RPAREN'):
+            args.append(self.expression())
+            while self.match('COMMA'):
+                self.consume('COMMA')
+                args.append(self.expression())
+        self.consume('RPAREN')
+        return FuncCall(name, args)
+
+    def value(self) -> Union[str, int, FuncCall]:
+        """The right-hand side of a declaration or assignment: a call, whose result is RAX, or an expression."""
+        if self.match('IDENT') and self.current + 1 < len(self.tokens) and self.tokens[self.current + 1][0] == 'LPAREN':
+            return self.call_args(self.consume('IDENT'))
+        return self.expression()
+
     def block(self) -> List[ASTNode]:
-        statements = []
-        while not self.match('RBRACE'):
-            # Skip any leftover NEWLINE tokens (shouldn't happen with fixed lexer)
-            if self.current < len(self.tokens) and self.tokens[self.current][0] == 'NEWLINE':
-                self.current += 1
-                continue
-                
-            if self.current >= len(self.tokens):
-                raise RuntimeError('Unexpected end of file while parsing block')
-                
-            statements.append(self.statement())
-        self.consume('RBRACE')
-        return statements
+        """Parse the statements of a block whose '{' has been consumed, up to its '}'."""
+        return self.statements(nested=True)
 
     def expression(self) -> Union[str, int]:
         # Support binary expressions: left op right
@@ -0,0 +1,121 @@
+"""The compiler's optimization pipeline: AST, IR and MicroASM passes selected by -O level or by name."""
+import json
+import time
+from typing import Callable, Iterable, List
+from astpasses import coalesce_prints, count_statements
+from evaluator import evaluate_functions
+from ir import thread_jumps, remove_unreachable_blocks, number_values, eliminate_dead_code, save_live_registers, order_blocks
+from peephole import tail_calls, count_instructions
+
+STAGES = ('ast', 'ir', 'masm')  # The program's (name, statements) units, a unit's IR function, its emitted lines
+LEVELS = range(4)
+DEFAULT_LEVEL = 2
+
+class Pass:
+    """A rewrite at one stage; `level` is the lowest -O level that runs it, and level 0 passes always run."""
+
+    def __init__(self, name: str, stage: str, run: Callable, level: int):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown pass stage '{stage}'")
+        self.name = name
+        self.stage = stage
+        self.run = run  # Returns the rewritten statements or lines; IR passes change the function in place
+        self.level = level
+
+class EachUnit:
+    """An AST pass that rewrites every unit's statements on their own (a class, so pipelines pickle)."""
+
+    def __init__(self, rewrite: Callable):
+        self.rewrite = rewrite
+
+    def __call__(self, units):
+        return [(name, self.rewrite(statements)) for name, statements in units]
+
+# Registration order is run order within a stage
+PASSES: List[Pass] = [
+    Pass('evaluate-functions', 'ast', evaluate_functions, 3),
+    Pass('coalesce-prints', 'ast', EachUnit(coalesce_prints), 1),
+    Pass('thread-jumps', 'ir', thread_jumps, 1),
+    Pass('remove-unreachable', 'ir', remove_unreachable_blocks, 1),
+    Pass('number-values', 'ir', number_values, 2),
+    Pass('eliminate-dead-code', 'ir', eliminate_dead_code, 2),
+    Pass('save-live-registers', 'ir', save_live_registers, 0),  # Required by the calling convention
+    Pass('order-blocks', 'ir', order_blocks, 1),
+    Pass('tail-calls', 'masm', tail_calls, 2),
+]
+
+def size(stage: str, target) -> int:
+    """Statements of the program's units, or instructions of an IR function or of emitted lines."""
+    if stage == 'ast':
+        return sum(count_statements(statements) for _, statements in target)
+    if stage == 'ir':
+        return sum(len(block.instrs) for block in target.blocks)
+    return count_instructions(target)
+
+class PassManager:
+    """Runs the registered passes that the -O level enables, plus or minus passes named in `enable`/`disable`."""
+
+    def __init__(self, level: int = DEFAULT_LEVEL, enable: Iterable[str] = (), disable: Iterable[str] = (),
+                 passes: List[Pass] = None):
+        if level not in LEVELS:
+            raise ValueError(f"Optimization level must be 0 to {LEVELS[-1]}, got {level}")
+        self.passes = list(PASSES if passes is None else passes)
+        self.level = level
+        self.enable = set(enable)
+        self.disable = set(disable)
+        self.check_names(self.enable | self.disable)
+        required = [p.name for p in self.passes if p.level == 0 and p.name in self.disable]
+        if required:
+            raise ValueError(f"Pass '{required[0]}' is required and cannot be disabled")
+
+    @classmethod
+    def from_config(cls, path: str, level: int = None, enable: Iterable[str] = (), disable: Iterable[str] = ()) -> 'PassManager':
+        """Read the "optimization" section of a config file; arguments given here take precedence."""
+        with open(path, 'r', encoding='utf-8') as f:
+            section = json.load(f).get('optimization', {})
+        enable, disable = set(enable), set(disable)
+        return cls(section.get('level', DEFAULT_LEVEL) if level is None else level,
+                   (set(section.get('enable', [])) - disable) | enable,
+                   (set(section.get('disable', [])) - enable) | disable)
+
+    def check_names(self, names: Iterable[str]):
+        known = {p.name for p in self.passes}
+        unknown = sorted(set(names) - known)
+        if unknown:
+            raise ValueError(f"Unknown pass '{unknown[0]}'; known passes: {', '.join(p.name for p in self.passes)}")
+
+    def register(self, new_pass: Pass, after: str = None):
+        """Add a pass at the end of the pipeline, or right after the pass named `after`."""
+        if after is None:
+            self.passes.append(new_pass)
+            return
+        self.check_names([after])
+        index = next(i for i, p in enumerate(self.passes) if p.name == after)
+        self.passes.insert(index + 1, new_pass)
+
+    def enabled(self, p: Pass) -> bool:
+        if p.level == 0 or p.name in self.enable:
+            return True
+        return p.name not in self.disable and p.level <= self.level
+
+    def pipeline(self, stage: str = None) -> List[Pass]:
+        return [p for p in self.passes if self.enabled(p) and stage in (None, p.stage)]
+
+    def signature(self) -> str:
+        """Names of the enabled passes, so cached output can be checked against the pipeline that built it."""
+        return ','.join(p.name for p in self.pipeline())
+
+    def run(self, stage: str, target, stats=None):
+        """Run the stage's enabled passes over the program's units (AST) or one unit; with stats, record each pass's time and size change."""
+        for p in self.pipeline(stage):
+            if stats is None:
+                result = p.run(target)
+                target = target if result is None else result
+                continue
+            before = size(stage, target)
+            start = time.perf_counter()
+            result = p.run(target)
+            seconds = time.perf_counter() - start
+            target = target if result is None else result
+            stats.record_pass(p.name, stage, seconds, before, size(stage, target))
+        return target
@@ -0,0 +1,37 @@
+"""Rewrites of the MicroASM text of one code generation unit, after the IR has been laid out again."""
+from typing import List
+from masm import split_line
+from linker import RUNTIME_SYMBOLS
+
+def count_instructions(lines: List[str]) -> int:
+    """Instructions among MicroASM lines, leaving out labels, data, directives and comments."""
+    count = 0
+    for line in lines:
+        words = split_line(line)
+        if words and words[0].upper() not in ('LBL', 'DB') and not words[0].startswith('#'):
+            count += 1
+    return count
+
+def tail_calls(lines: List[str]) -> List[str]:
+    """Turn a call to a program function that is directly followed by RET into a jump.
+
+    The callee then returns straight to our caller. A frame, saved registers or
+    stack arguments all put an instruction between the two, so they are never affected.
+    """
+    result = []
+    pending = None  # Index in result of a CALL that may become a JMP
+    for line in lines:
+        words = split_line(line)
+        if not words:
+            result.append(line)
+            continue
+        op = words[0].upper()
+        if op == 'RET' and pending is not None:
+            result[pending] = result[pending].replace('CALL', 'JMP', 1)
+            pending = None
+            continue
+        pending = None
+        if op == 'CALL' and len(words) == 2 and words[1].startswith('#') and words[1][1:] not in RUNTIME_SYMBOLS:
+            pending = len(result)
+        result.append(line)
+    return result
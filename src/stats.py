@@ -0,0 +1,149 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List
+
+PHASES = ['lex', 'parse', 'analysis', 'codegen', 'link', 'write']
+
+class PhaseStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_bytes = 0       # Highest traced memory seen while the phase was running
+        self.allocated_bytes = 0  # Net traced memory still held when the phase ended
+        self.calls = 0
+
+    def observe(self, peak: int):
+        self.peak_bytes = max(self.peak_bytes, peak)
+
+class PassStats:
+    def __init__(self, name: str, stage: str):
+        self.name = name
+        self.stage = stage
+        self.seconds = 0.0
+        self.calls = 0
+        self.before = 0  # Statements (AST passes) or instructions, summed over the units the pass ran on
+        self.after = 0
+
+class CompileStats:
+    """Peak memory per compiler phase (via tracemalloc) plus size counters.
+
+    Phases may be entered repeatedly (once per unit or include) and are accumulated.
+    A phase entered inside another one is included in the outer phase's figures.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, PhaseStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.node_counts: Dict[str, int] = {}
+        self.passes: Dict[str, PassStats] = {}
+        self.stack: List[PhaseStats] = []
+        self.started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def phase(self, name: str):
+        self.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1].observe(peak)
+        tracemalloc.reset_peak()
+        record = self.phases.setdefault(name, PhaseStats(name))
+        self.stack.append(record)
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end_current, end_peak = tracemalloc.get_traced_memory()
+            record.seconds += time.perf_counter() - start_time
+            record.allocated_bytes += end_current - current
+            record.calls += 1
+            record.observe(end_peak)
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1].observe(end_peak)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_pass(self, name: str, stage: str, seconds: float, before: int, after: int):
+        record = self.passes.setdefault(name, PassStats(name, stage))
+        record.seconds += seconds
+        record.calls += 1
+        record.before += before
+        record.after += after
+
+    def count_nodes(self, root):
+        """Count AST nodes by class name, walking lists and child nodes without recursion."""
+        pending = [root]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+            elif hasattr(node, '__dict__'):
+                name = node.__class__.__name__
+                self.node_counts[name] = self.node_counts.get(name, 0) + 1
+                pending.extend(v for v in node.__dict__.values() if isinstance(v, list) or hasattr(v, '__dict__'))
+
+    def to_dict(self) -> Dict:
+        ordered = [name for name in PHASES if name in self.phases] + [name for name in self.phases if name not in PHASES]
+        return {
+            'phases': {
+                name: {
+                    'seconds': round(self.phases[name].seconds, 6),
+                    'peak_bytes': self.phases[name].peak_bytes,
+                    'allocated_bytes': self.phases[name].allocated_bytes,
+                    'calls': self.phases[name].calls,
+                } for name in ordered
+            },
+            'peak_bytes': max((p.peak_bytes for p in self.phases.values()), default=0),
+            'passes': {
+                name: {
+                    'stage': p.stage,
+                    'seconds': round(p.seconds, 6),
+                    'calls': p.calls,
+                    'before': p.before,
+                    'after': p.after,
+                } for name, p in self.passes.items()
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'ast_nodes': dict(sorted(self.node_counts.items())),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def format_text(self) -> str:
+        data = self.to_dict()
+        lines = ["Compiler statistics", "", f"{'phase':<10}{'time (ms)':>12}{'peak (KiB)':>14}{'held (KiB)':>14}"]
+        for name, phase in data['phases'].items():
+            lines.append(f"{name:<10}{phase['seconds'] * 1000:>12.2f}{phase['peak_bytes'] / 1024:>14.1f}{phase['allocated_bytes'] / 1024:>14.1f}")
+        lines.append(f"{'overall':<10}{'':>12}{data['peak_bytes'] / 1024:>14.1f}")
+        lines.append("")
+        if data['passes']:
+            lines.append(f"{'pass':<22}{'stage':<7}{'time (ms)':>12}{'before':>9}{'after':>9}{'delta':>8}")
+            for name, p in data['passes'].items():
+                lines.append(f"{name:<22}{p['stage']:<7}{p['seconds'] * 1000:>12.2f}{p['before']:>9}{p['after']:>9}"
+                             f"{p['after'] - p['before']:>+8}")
+            lines.append("")
+        for name, value in data['counters'].items():
+            lines.append(f"{name + ':':<22}{value}")
+        if data['ast_nodes']:
+            lines.append("")
+            lines.append("AST nodes:")
+            for name, value in data['ast_nodes'].items():
+                lines.append(f"  {name + ':':<20}{value}")
+        return '\n'.join(lines)
+
+    def report(self, fmt: str = 'text') -> str:
+        return self.to_json() if fmt == 'json' else self.format_text()
@@ -0,0 +1,47 @@
+import heapq
+from typing import Dict, List
+
+class SymbolTable:
+    """Homes of one function's variables, declared in nested block scopes.
+
+    A new variable takes the lowest free register below the budget, then the
+    lowest free frame slot. Both go back to the pool when the block that
+    declared the variable ends, so `registers_used` and `slots_used` (the peaks)
+    stay bounded by the deepest nesting rather than the size of the function.
+    """
+
+    def __init__(self, register_budget: int):
+        self.registers: Dict[str, int] = {}  # Visible variables held in registers: name -> register index
+        self.slots: Dict[str, int] = {}      # Visible variables held in the frame: name -> slot index
+        self.scopes: List[List[str]] = [[]]
+        self.free_registers = list(range(register_budget))
+        self.free_slots: List[int] = []
+        self.registers_used = 0
+        self.slots_used = 0
+
+    def __contains__(self, name) -> bool:
+        return name in self.registers or name in self.slots
+
+    def declare(self, name: str):
+        """Give a variable a home in the innermost scope; declaring a visible name again keeps its home."""
+        if name in self:
+            return
+        if self.free_registers:
+            index = heapq.heappop(self.free_registers)
+            self.registers[name] = index
+            self.registers_used = max(self.registers_used, index + 1)
+        else:
+            index = heapq.heappop(self.free_slots) if self.free_slots else self.slots_used
+            self.slots[name] = index
+            self.slots_used = max(self.slots_used, index + 1)
+        self.scopes[-1].append(name)
+
+    def enter(self):
+        self.scopes.append([])
+
+    def exit(self):
+        for name in self.scopes.pop():
+            if name in self.registers:
+                heapq.heappush(self.free_registers, self.registers.pop(name))
+            else:
+                heapq.heappush(self.free_slots, self.slots.pop(name))
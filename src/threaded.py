@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Threaded-code MicroASM engine.
+
+Before running, every basic block of the program is translated into one Python
+function whose body is the block's instructions as straight-line code, with
+operands already decoded into register lookups or constants. The run loop only
+dispatches from block to block: each block function returns the instruction
+index to continue at.
+
+Common sequences are fused into superinstructions while translating:
+
+    MOV RAX 1; MOV RBX <addr>; CALL #printf    print the string at a constant address
+    MOV RBX <operand>; CALL #printint           print a value without going through RBX
+    CMP a b; Jcc                                branch on a direct comparison of a and b
+
+A fused compare only stores the comparison flag when a later block may still
+read it (the flag is not kept once the program halts). Executed instruction
+counts match the reference interpreter; the step budget is checked before each
+block rather than before each instruction.
+"""
+import sys
+import argparse
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from masm import REGISTER_INDEX, parse_int, MasmProgram
+from vm import VirtualMachine
+
+HALT = -1
+COMPARISONS = {'JE': '==', 'JNE': '!=', 'JL': '<', 'JG': '>', 'JLE': '<=', 'JGE': '>='}
+FLAG_TESTS = {'JE': 'vm.flag == 0', 'JNE': 'vm.flag != 0', 'JL': 'vm.flag < 0',
+              'JG': 'vm.flag > 0', 'JLE': 'vm.flag <= 0', 'JGE': 'vm.flag >= 0'}
+BINARY = {'ADD': '+', 'SUB': '-', 'MUL': '*', 'AND': '&', 'OR': '|', 'XOR': '^', 'SHL': '<<', 'SHR': '>>'}
+ENDS_BLOCK = {'JMP', 'RET', 'HLT', 'EXIT'} | set(COMPARISONS)
+STOPS = {'RET', 'HLT', 'EXIT'}  # The successors of these blocks are not known statically
+
+_translations = weakref.WeakKeyDictionary()  # MasmProgram -> ThreadedCode, shared by every run
+
+class TranslationError(RuntimeError):
+    """An instruction that would fail when executed; translated into code that raises."""
+
+class ThreadedCode:
+    """A translated program: one code object defining block_<index> for every leader."""
+
+    def __init__(self, code, sizes: List[int], fused: int):
+        self.code = code
+        self.sizes = sizes  # Instructions in the block starting at each index, 0 elsewhere
+        self.fused = fused  # Superinstructions emitted
+
+class Translator:
+    def __init__(self, program: MasmProgram):
+        self.program = program
+        self.fused = 0
+
+    # Block structure
+    def is_local_call(self, instr) -> bool:
+        return instr.op == 'CALL' and instr.args[0].lstrip('#$') in self.program.labels
+
+    def ends_block(self, instr) -> bool:
+        return instr.op in ENDS_BLOCK or self.is_local_call(instr)
+
+    def leaders(self) -> List[int]:
+        instructions = self.program.instructions
+        starts = {0} | {index for index in self.program.labels.values() if index < len(instructions)}
+        for index, instr in enumerate(instructions):
+            if self.ends_block(instr) and index + 1 < len(instructions):
+                starts.add(index + 1)
+        return sorted(starts)
+
+    def successors(self, start: int, end: int) -> Optional[List[int]]:
+        """Instruction indexes control may continue at after block [start, end), or None if unknown."""
+        last = self.program.instructions[end - 1]
+        if last.op in STOPS or self.is_local_call(last):
+            return None
+        targets = []
+        if last.op == 'JMP' or last.op in COMPARISONS:
+            targets = [self.program.labels[arg.lstrip('#')] for arg in last.args[:2]
+                       if arg.lstrip('#') in self.program.labels]
+        if last.op != 'JMP' and not (last.op in COMPARISONS and len(last.args) > 1):
+            targets.append(end)
+        return targets
+
+    def flag_live_out(self, spans: List[Tuple[int, int]]) -> Dict[int, bool]:
+        """Whether the comparison flag may be read after each block, by backward fixpoint."""
+        instructions = self.program.instructions
+        reads, writes = {}, {}
+        for start, end in spans:
+            reads[start] = writes[start] = False
+            for instr in instructions[start:end]:
+                if instr.op in COMPARISONS and not writes[start]:
+                    reads[start] = True
+                if instr.op == 'CMP':
+                    writes[start] = True
+        successors = {start: self.successors(start, end) for start, end in spans}
+        live_in = {start: reads[start] for start, _ in spans}
+        live_out = {start: False for start, _ in spans}
+        changed = True
+        while changed:
+            changed = False
+            for start, end in reversed(spans):
+                following = successors[start]
+                last = instructions[end - 1]
+                if following is None:
+                    out = last.op == 'RET' or self.is_local_call(last)  # HLT and EXIT end the program
+                else:
+                    out = any(live_in.get(index, True) for index in following if index < len(instructions))
+                flows = reads[start] or (out and not writes[start])
+                if out != live_out[start] or flows != live_in[start]:
+                    live_out[start], live_in[start] = out, flows
+                    changed = True
+        return live_out
+
+    # Translation
+    def translate(self) -> ThreadedCode:
+        instructions = self.program.instructions
+        starts = self.leaders()
+        spans = [(start, stop) for start, stop in zip(starts, starts[1:] + [len(instructions)])]
+        live = self.flag_live_out(spans)
+        source = []
+        sizes = [0] * len(instructions)
+        for start, end in spans:
+            source.extend(self.block_source(start, end, live[start]))
+            sizes[start] = end - start
+        return ThreadedCode(compile('\n'.join(source), '<threaded>', 'exec'), sizes, self.fused)
+
+    def entry(self, index: int, blocks: List) -> Tuple[str, int]:
+        """Source and size of a block starting at an index that is not a leader, e.g. a computed return address."""
+        end = index + 1
+        while end < len(self.program.instructions) and blocks[end] is None \
+                and not self.ends_block(self.program.instructions[end - 1]):
+            end += 1
+        return '\n'.join(self.block_source(index, end, True)), end - index
+
+    def block_source(self, start: int, end: int, flag_live: bool) -> List[str]:
+        lines = [f"def block_{start}(vm=vm, r=r, out=out, load_string=load_string):"]
+        instructions = self.program.instructions
+        index = start
+        while index < end:
+            try:
+                consumed, code = self.superinstruction(index, end, flag_live)
+                if consumed:
+                    self.fused += 1
+                else:
+                    consumed, code = 1, self.instruction(instructions[index], index + 1)
+            except TranslationError as e:
+                consumed, code = 1, [f"raise TranslationError({str(e)!r})"]
+            lines.extend('    ' + line for line in code)
+            index += consumed
+        last = instructions[end - 1]
+        if not self.ends_block(last) or last.op in COMPARISONS and len(last.args) == 1:
+            lines.append(f"    return {end}")
+        return lines
+
+    def superinstruction(self, index: int, end: int, flag_live: bool) -> Tuple[int, List[str]]:
+        """Return (instructions consumed, code) for a fused sequence starting at index, or (0, None)."""
+        window = self.program.instructions[index:end]
+        ops = [instr.op for instr in window[:3]]
+        if ops[:3] == ['MOV', 'MOV', 'CALL'] and window[0].args == ['RAX', '1'] and window[1].args[0] == 'RBX' \
+                and self.external_name(window[2]) == 'printf' and parse_int(window[1].args[1]) is not None:
+            address = parse_int(window[1].args[1])
+            return 3, ["r['RAX'] = 1", f"r['RBX'] = {address}", f"out(load_string({address}) + '\\n')"]
+        if ops[:2] == ['MOV', 'CALL'] and window[0].args[0] == 'RBX' and self.external_name(window[1]) == 'printint':
+            value = self.operand(window[0].args[1])
+            return 2, [f"r['RBX'] = {value}", f"out(f\"{{{value}}}\\n\")"]
+        if len(ops) > 1 and ops[0] == 'CMP' and ops[1] in COMPARISONS and index + 2 == end:
+            left, right = (self.operand(arg) for arg in window[0].args[:2])
+            jump = window[1]
+            taken = self.target(jump.args[0])
+            fallthrough = self.target(jump.args[1]) if len(jump.args) > 1 else index + 2
+            if flag_live:
+                code = [f"a = {left}", f"b = {right}", "vm.flag = (a > b) - (a < b)",
+                        f"if a {COMPARISONS[jump.op]} b:", f"    return {taken}"]
+            else:
+                code = [f"if {left} {COMPARISONS[jump.op]} {right}:", f"    return {taken}"]
+            return 2, code + [f"return {fallthrough}"]
+        return 0, None
+
+    def external_name(self, instr) -> Optional[str]:
+        if instr.op != 'CALL' or self.is_local_call(instr):
+            return None
+        return instr.args[0].lstrip('#$')
+
+    def operand(self, arg: str) -> str:
+        name = arg[1:] if arg.startswith('$') else arg
+        if name in REGISTER_INDEX:
+            return f"r[{name!r}]"
+        number = parse_int(name)
+        if number is None:
+            raise TranslationError(f"Cannot read operand '{name}'")
+        return str(number)
+
+    def destination(self, arg: str) -> str:
+        if arg not in REGISTER_INDEX:
+            raise TranslationError(f"Cannot write to operand '{arg}'")
+        return f"r[{arg!r}]"
+
+    def target(self, arg: str) -> int:
+        name = arg[1:] if arg.startswith('#') else arg
+        if name not in self.program.labels:
+            raise TranslationError(f"Unknown label '{name}'")
+        return self.program.labels[name]
+
+    def instruction(self, instr, following: int) -> List[str]:
+        """Straight-line Python for one instruction; `following` is the index of the next one."""
+        op, args = instr.op, instr.args
+        if op == 'MOV':
+            return [f"{self.destination(args[0])} = {self.operand(args[1])}"]
+        if op in BINARY:
+            dest = self.destination(args[0])
+            return [f"{dest} = {dest} {BINARY[op]} {self.operand(args[1])}"]
+        if op == 'DIV':
+            dest = self.destination(args[0])
+            return [f"d = {self.operand(args[1])}",
+                    "if d == 0:", f"    raise RuntimeError('Division by zero on line {instr.line}')",
+                    f"{dest} = int({dest} / d)"]
+        if op in ('INC', 'DEC'):
+            dest = self.destination(args[0])
+            return [f"{dest} = {dest} {'+' if op == 'INC' else '-'} 1"]
+        if op == 'NOT':
+            dest = self.destination(args[0])
+            return [f"{dest} = ~{dest}"]
+        if op == 'CMP':
+            return [f"a = {self.operand(args[0])}", f"b = {self.operand(args[1])}", "vm.flag = (a > b) - (a < b)"]
+        if op == 'JMP':
+            return [f"return {self.target(args[0])}"]
+        if op in COMPARISONS:
+            code = [f"if {FLAG_TESTS[op]}:", f"    return {self.target(args[0])}"]
+            if len(args) > 1:
+                code.append(f"return {self.target(args[1])}")
+            return code
+        if op == 'CALL':
+            name = args[0].lstrip('#$')
+            if name in self.program.labels:
+                return [f"vm.push({following})", f"return {self.program.labels[name]}"]
+            if name == 'printf':
+                return ["out(load_string(r['RBX']) + '\\n')"]
+            if name == 'printint':
+                return ["out(f\"{r['RBX']}\\n\")"]
+            return [f"vm.external({name!r})"]
+        if op == 'RET':
+            return ["if r['RSP'] >= len(vm.memory):", "    vm.halted = True", f"    return {HALT}", "return vm.pop()"]
+        if op == 'PUSH':
+            return [f"vm.push({self.operand(args[0])})"]
+        if op == 'POP':
+            return [f"{self.destination(args[0])} = vm.pop()"]
+        if op == 'ENTER':
+            return ["vm.push(r['RBP'])", "r['RBP'] = r['RSP']", f"r['RSP'] = r['RSP'] - {self.operand(args[0])}"]
+        if op == 'LEAVE':
+            return ["r['RSP'] = r['RBP']", "r['RBP'] = vm.pop()"]
+        if op == 'MOVADDR':
+            return [f"{self.destination(args[0])} = vm.load_word({self.operand(args[1])} + {self.operand(args[2])})"]
+        if op == 'MOVTO':
+            return [f"vm.store_word({self.operand(args[0])} + {self.operand(args[1])}, {self.operand(args[2])})"]
+        if op == 'OUT':
+            value = self.operand(args[1])
+            text = f"load_string({value})" if args[1].startswith('$') else f"str({value})"
+            return [f"out({text} + '\\n')"]
+        if op == 'COUT':
+            return [f"out(chr({self.operand(args[1])}))"]
+        if op == 'MNI':
+            return [f"vm.mni({list(args)!r})"]
+        if op == 'HLT':
+            return ["vm.halted = True", f"return {HALT}"]
+        if op == 'EXIT':
+            return [f"vm.exit_code = {self.operand(args[0])}", "vm.halted = True", f"return {HALT}"]
+        raise TranslationError(f"Unsupported instruction '{op}' on line {instr.line}")
+
+def translate(program: MasmProgram) -> ThreadedCode:
+    """Translate a program once; later machines for the same program reuse the code."""
+    if program not in _translations:
+        _translations[program] = Translator(program).translate()
+    return _translations[program]
+
+class ThreadedMachine(VirtualMachine):
+    def __init__(self, program: Union[str, MasmProgram], inputs: Iterable[int] = (),
+                 max_steps: int = 10_000_000, memory_size: int = 1 << 20):
+        super().__init__(program, inputs, max_steps, memory_size)
+        translated = translate(self.program)
+        namespace = self.bind(translated.code)
+        self.sizes = list(translated.sizes)
+        self.blocks: List[Optional[callable]] = [namespace.get(f'block_{index}') if size else None
+                                                 for index, size in enumerate(self.sizes)]
+        self.fused = translated.fused
+
+    def bind(self, code) -> Dict:
+        """Define the block functions with this machine's state as default arguments."""
+        namespace = {'vm': self, 'r': self.registers, 'out': self.output.append,
+                     'load_string': self.load_string, 'TranslationError': TranslationError}
+        exec(code, namespace)
+        return namespace
+
+    def entry(self, index: int):
+        source, size = Translator(self.program).entry(index, self.blocks)
+        self.blocks[index] = self.bind(compile(source, '<threaded>', 'exec'))[f'block_{index}']
+        self.sizes[index] = size
+        return self.blocks[index]
+
+    def run(self) -> 'ThreadedMachine':
+        blocks, sizes = self.blocks, self.sizes
+        count = len(blocks)
+        pc = self.program.labels.get('main', 0)
+        steps, limit = self.steps, self.max_steps
+        try:
+            while 0 <= pc < count and not self.halted:
+                if steps >= limit:
+                    raise RuntimeError(f"Step budget of {self.max_steps} exceeded")
+                block = blocks[pc] or self.entry(pc)
+                steps += sizes[pc]
+                pc = block()
+        finally:
+            self.steps = steps
+        return self
+
+def run_threaded(source: str, inputs: Iterable[int] = (), max_steps: int = 10_000_000) -> ThreadedMachine:
+    return ThreadedMachine(source, inputs, max_steps).run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded-code MicroASM engine")
+    parser.add_argument("source_file", help="Path to the .masm file")
+    parser.add_argument("inputs", nargs="*", type=int, help="Integers returned by #readint, in order")
+    parser.add_argument("--max-steps", type=int, default=10_000_000, help="Abort after about this many instructions")
+    parser.add_argument("--count", action="store_true", help="Report the number of executed instructions")
+    args = parser.parse_args()
+
+    with open(args.source_file, 'r', encoding='utf-8') as f:
+        source = f.read()
+    try:
+        vm = run_threaded(source, args.inputs, args.max_steps)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(vm.stdout)
+    if args.count:
+        print(f"Executed {vm.steps} instructions", file=sys.stderr)
+    sys.exit(vm.exit_code)
+
+if __name__ == "__main__":
+    main()
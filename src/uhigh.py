@@ -4,13 +4,53 @@ import sys
 import os
 from typing import List, Dict, Union
 from lexer import Lexer
-from parser import Parser, Program, VarDecl, ConstDecl, Assignment, Print, IfStatement, WhileStatement, FuncDecl, FuncCall, Include, ASTNode, InlineAsm
+from parser import Parser, Program, VarDecl, ConstDecl, Assignment, Print, IfStatement, WhileStatement, FuncDecl, FuncCall, Include, ASTNode, InlineAsm, Input, Return
+from bytecode import assemble
+from analysis import analyze, VARIABLE_REGISTERS
+from linker import CodeUnit, ObjectFile, LinkError, LinkResult, label_marker, data_marker, global_marker, scratch_marker, frame_marker, link
+from ir import build_function, emit, call_effects, ARGUMENT_REGISTERS, WORD
+from passes import PassManager, LEVELS, DEFAULT_LEVEL
+from stats import CompileStats
+from symbols import SymbolTable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 import argparse
 from argparse import ArgumentParser
 
+HEADER = [";;;;;; Generated by μHigh Compiler", '#include "stdio.print"', ""]
+FORMAT_BUFFER = 256  # Bytes of the scratch buffer a formatted print writes its text into
+
+class CompileContext:
+    """State of one compile call, so a UHighCompiler can be reused and shared between threads."""
+
+    def __init__(self, base_dir: str = '.', name: str = '<source>'):
+        self.base_dir = base_dir  # Includes are resolved relative to this directory
+        self.name = name  # The source file's name in link errors
+        self.included_files: List[str] = []  # Paths read by include statements, for rebuild checks
+        self.label_counter = 0
+        self.next_mem_addr = 100  # Start at memory address 100
+        self.linked: LinkResult = None  # The last link: its layout and static image
+
 class UHighCompiler:
-    def __init__(self):
-        self.variables: Dict[str, int] = {}
+    """Compiles μHigh source; compile(), compile_object() and compile_many() keep their state in a CompileContext.
+
+    The instance holds only configuration. The code generation state below is
+    used by the per-unit instances compile_unit() creates.
+    """
+
+    def __init__(self, jobs: int = 1, stats: CompileStats = None, passes: PassManager = None):
+        self.jobs = jobs  # Worker processes used for per-function code generation
+        self.stats = stats  # Phase memory and size counters, collected when set
+        self.passes = passes or PassManager()  # Optimizations to run, at the default -O level unless given
+        self.registers_allocated = 0
+        self.relocatable = False  # Emit relocation markers instead of final labels/addresses
+        self.symbols = SymbolTable(VARIABLE_REGISTERS)  # The current function's block-scoped variables
+        self.variables: Dict[str, int] = self.symbols.registers
+        self.slots: Dict[str, int] = self.symbols.slots  # Variables kept in the current function's frame: name -> slot index
+        self.frame_slots = 0  # Size of the current function's frame, in words
+        self.static_frame = False  # The frame lives in the static image instead of on the stack
+        self.scratch_size = 0  # Bytes of the shared scratch buffer this unit uses
+        self.globals: Dict[str, int] = {}  # Top-level variables: name -> offset of their static cell
         self.label_counter: int = 0
         self.current_reg: int = 0
         self.string_counter: int = 0
@@ -24,11 +64,11 @@ class UHighCompiler:
         self.loop_stack = []  # For nested loops
         self.block_stack = []  # Track all blocks (if/while)
         self.current_block_end = None
-        self.header_added = False  # Track if header is added
         self.current_function = None  # Track current function scope
         self.function_strings = {}    # Store strings per function: {function_name: {string: addr}}
-        self.string_lengths = {}   # Track string lengths for memory allocation
+        self.functions: Dict[str, List[str]] = {}  # Known function signatures: {name: parameters}
         self.indent_level = 0  # Track the current indentation level
+        self.inline_asm = False  # Set once inline assembly is emitted; it may use any register
 
     def increase_indent(self):
         """Increase the indentation level."""
@@ -40,178 +80,336 @@ class UHighCompiler:
             self.indent_level -= 1
 
     def add_line(self, line: str):
-        """Add a line to the output with proper indentation."""
-        indent = '    ' * self.indent_level  # Use 4 spaces per indent level
-        self.output.append(f"{indent}{line}")
+        """Add a line to the output, indented inside a function.
+
+        The IR lays the unit out again, so nesting depth is not spelled out in
+        leading spaces, which would make deep nesting quadratic to compile.
+        """
+        self.output.append(f"    {line}" if self.indent_level else line)
+
+    def phase(self, name: str):
+        """Measure a compiler phase when statistics are enabled."""
+        return self.stats.phase(name) if self.stats else nullcontext()
+
+    def count(self, name: str, amount: int = 1):
+        if self.stats:
+            self.stats.count(name, amount)
 
     def get_next_reg(self) -> str:
+        # Temporaries cycle through the registers above the variables so they never clobber one
+        first = min(max(self.variables.values(), default=-1) + 1, 14)
+        if self.current_reg < first:
+            self.current_reg = first
         reg = f"R{self.current_reg}"
+        self.registers_allocated += 1
         self.current_reg += 1
         if self.current_reg > 14:  # Keep space for R15 as temp
-            self.current_reg = 0
+            self.current_reg = first
         return reg
 
-    def get_next_label(self) -> str:
-        label = f"L{self.label_counter}"
+    def next_label_id(self) -> str:
+        label_id = self.label_counter
         self.label_counter += 1
-        return label
+        return label_marker(label_id) if self.relocatable else str(label_id)
 
-    def get_string_address(self, string: str) -> int:
-        # Create function strings dict if it doesn't exist
-        if self.current_function not in self.function_strings:
-            self.function_strings[self.current_function] = {}
+    def get_next_label(self) -> str:
+        return f"L{self.next_label_id()}"
 
-        # Check if string exists in current function scope
-        func_strings = self.function_strings[self.current_function]
-        if string not in func_strings:
-            # Allocate memory based on string length (add 1 for null terminator)
-            func_strings[string] = self.next_mem_addr
-            self.string_lengths[string] = len(string) + 1
-            self.next_mem_addr += len(string) + 1
-        return func_strings[string]
-
-    def collect_strings(self, program: Program):
-        """Pre-process to collect all strings in the program"""
-        def process_node(node):
-            if isinstance(node, Print):
-                for value in node.values:
-                    if isinstance(value, str) and value.startswith('"'):
-                        self.get_string_address(value[1:-1])
-            elif isinstance(node, VarDecl) and isinstance(node.initial_value, str) and node.initial_value.startswith('"'):
-                self.get_string_address(node.initial_value[1:-1])
-            elif isinstance(node, Assignment) and isinstance(node.value, str) and node.value.startswith('"'):
-                self.get_string_address(node.value[1:-1])
-            elif isinstance(node, IfStatement):
-                for stmt in node.true_block:
-                    process_node(stmt)
-                if node.false_block:
-                    for stmt in node.false_block:
-                        process_node(stmt)
-            elif isinstance(node, WhileStatement):
-                for stmt in node.body:
-                    process_node(stmt)
-            elif isinstance(node, FuncDecl):
-                for stmt in node.body:
-                    process_node(stmt)
-
-        for statement in program.statements:
-            process_node(statement)
-
-    def compile(self, source: str, base_dir: str = '.') -> str:
-        self.base_dir = base_dir
-        self.current_function = 'global'  # Default scope for top-level code
-        
-        lexer = Lexer(source)
-        tokens = lexer.tokenize()
-        parser = Parser(tokens)
-        program = parser.parse()
-        
-        # Reset compiler state
-        self.output = []
-        self.header_added = False
-        self.function_strings = {}
-        
-        # Add header
-        if not self.header_added:
-            self.add_line(";;;;;; Generated by μHigh Compiler")
-            self.add_line('#include "stdio.print"')
-            self.add_line("")
-            self.header_added = True
-
-        # Compile the program
-        self.compile_program(program)
-        
-        return '\n'.join(self.output)
-
-    def compile_program(self, program: Program):
-        if not self.header_added:
-            self.add_line("// Generated by μHigh Compiler")
-            self.add_line('#include "stdio.print"')
-            self.add_line("")
-            self.header_added = True
- 
-        # Collect all strings in the program first
-        self.collect_strings(program)
-
-        # Process includes first
-        includes = []
-        statements = []
-        for statement in program.statements:
-            if isinstance(statement, Include):
-                includes.append(statement)
-            else:
-                statements.append(statement)
-
-        # Handle includes
-        for include in includes:
-            include_path = os.path.join(self.base_dir, include.filename[1:-1])  # Remove quotes
-            with open(include_path, 'r') as f:
-                included_source = f.read()
-            lexer = Lexer(included_source)
-            parser = Parser(lexer.tokenize())
-            included_program = parser.parse()
-            self.compile_program(included_program)
-
-        # Process remaining statements
-        for statement in statements:
-            if isinstance(statement, FuncDecl) and statement.name == "main":
-                self.add_line(f"LBL {statement.name}")
-                self.increase_indent()
+    def data_ref(self, addr: int) -> Union[int, str]:
+        return data_marker(addr) if self.relocatable else addr
 
-                # Output string definitions for the main function
-                if "global" in self.function_strings:
-                    for string, addr in self.function_strings["global"].items():
-                        self.add_line(f'    ;; Length: {self.string_lengths[string]} bytes')
-                        self.add_line(f'    DB ${addr} "{string}"')
-                    if self.function_strings["global"]:
-                        self.add_line("")  # Empty line after string definitions
+    def global_ref(self, offset: int) -> Union[int, str]:
+        return global_marker(offset) if self.relocatable else offset
 
-                # Compile the main function body
-                for stmt in statement.body:
-                    self.compile_statement(stmt)
+    def scratch_ref(self, size: int) -> Union[int, str]:
+        """The shared scratch buffer, which every use may overwrite: formatted text lives only until it is printed."""
+        self.scratch_size = max(self.scratch_size, size)
+        return scratch_marker(0) if self.relocatable else 0
 
-                # Add HLT at the end of main
-                self.add_line("HLT")
+    def get_string_address(self, string: str) -> Union[int, str]:
+        """Address of a string the analysis recorded for the current unit; codegen never allocates data."""
+        func_strings = self.function_strings.get(self.current_function, {})
+        if string not in func_strings:
+            raise ValueError(f'String "{string}" in {self.current_function or "top-level code"} was not recorded by analysis')
+        return self.data_ref(func_strings[string])
+
+    def emit_string_definitions(self, scope: str):
+        """Output DB definitions for the strings collected in a scope"""
+        if scope in self.function_strings:
+            for string, addr in self.function_strings[scope].items():
+                self.add_line(f'    DB ${self.data_ref(addr)} "{string}"')
+
+    def compile(self, source: str, base_dir: str = '.', context: CompileContext = None) -> str:
+        """Compile a program to MicroASM text; pass a context to read back the files it included."""
+        context = context or CompileContext(base_dir)
+        program = self.parse_source(source)
+        return '\n'.join(HEADER + self.compile_program(program, context))
+
+    def compile_object(self, source: str, base_dir: str = '.', name: str = '<source>',
+                       context: CompileContext = None) -> ObjectFile:
+        """Compile one file to a relocatable object; link_objects() combines objects into a program."""
+        context = context or CompileContext(base_dir, name)
+        program = self.parse_source(source)
+        return ObjectFile.from_units(name, self.generate_units(program, context))
+
+    def compile_many(self, sources: List[str], base_dir: str = '.', threads: int = None) -> List[str]:
+        """Compile independent programs on a thread pool; the outputs are in source order and match compile().
+
+        Statistics are not thread-safe, so a compiler with stats compiles one source at a time.
+        """
+        if self.stats is not None or threads == 1 or len(sources) < 2:
+            return [self.compile(source, base_dir) for source in sources]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(lambda source: self.compile(source, base_dir), sources))
+
+    def parse_source(self, source: str) -> Program:
+        lexer = Lexer(source)
+        with self.phase('lex'):
+            tokens = lexer.tokenize()
+        self.count('tokens', len(tokens))
+        parser = Parser(tokens)
+        with self.phase('parse'):
+            program = parser.parse()
+        if self.stats:
+            self.stats.count_nodes(program)
+        return program
+
+    def compile_program(self, program: Program, context: CompileContext) -> List[str]:
+        code_units = self.generate_units(program, context)
+        with self.phase('link'):
+            # Link: renumber labels and lay out data addresses in program order
+            result = link(code_units, context.label_counter, context.next_mem_addr)
+        self.count('labels', result.label_end - context.label_counter)
+        self.count('data_bytes', result.data_end - context.next_mem_addr)
+        self.count('frame_bytes', result.layout.requested('frame'))
+        self.count('scratch_bytes', result.layout.requested('scratch'))
+        self.count('units', len(code_units))
+        context.label_counter = result.label_end
+        context.next_mem_addr = result.data_end
+        context.linked = result
+        return result.lines
+
+    def generate_units(self, program: Program, context: CompileContext) -> List[CodeUnit]:
+        """Generate relocatable code for every function and run of top-level statements."""
+        # Split the program into independent units: one per function, one per run of top-level statements
+        units = []
+        self.split_units(program, units, context)
+        units = self.passes.run('ast', units, self.stats)
+
+        # One analysis pass records strings, declarations and signatures for every unit
+        with self.phase('analysis'):
+            info = analyze(units)
+        jobs = [(name, statements, scope, info.program, self.passes) for (name, statements), scope in zip(units, info.scopes)]
+        self.count('global_cells', len(info.program.globals))
+
+        with self.phase('codegen'):
+            # tracemalloc only sees this process, so statistics runs generate units in-process
+            if self.jobs > 1 and len(jobs) > 1 and self.stats is None:
+                # pickle recurses per nesting level, so ship units as flat node tables
+                packed = [(name, FlatStatements(statements), *rest) for name, statements, *rest in jobs]
+                with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                    return list(pool.map(compile_unit, packed, chunksize=max(1, len(jobs) // (self.jobs * 4))))
+            return [compile_unit(job, self.stats) for job in jobs]
+
+    def split_units(self, program: Program, units: List, context: CompileContext = None):
+        """Expand includes and group statements into (scope name, statements) code generation units
+
+        Raises LinkError if the file and its includes define a function more than once.
+        """
+        context = context or CompileContext()
+        problems = []
+        defined: Dict[str, str] = {}  # Function name -> file defining it
+        # Each frame is a program, the file it came from and the index of its next include; a
+        # program's own statements are emitted once all of its includes have been expanded.
+        frames = [(program, context.name, [s for s in program.statements if isinstance(s, Include)], 0)]
+        while frames:
+            current, source, includes, index = frames.pop()
+            if index < len(includes):
+                frames.append((current, source, includes, index + 1))
+                included_program = self.load_include(includes[index], context)
+                frames.append((included_program, includes[index].filename[1:-1],
+                               [s for s in included_program.statements if isinstance(s, Include)], 0))
+                continue
+
+            for statement in current.statements:
+                if isinstance(statement, Include):
+                    continue
+                if isinstance(statement, FuncDecl):
+                    if statement.name in defined:
+                        problems.append(f"duplicate symbol '{statement.name}' in {defined[statement.name]} and {source}")
+                    defined.setdefault(statement.name, source)
+                    units.append((statement.name, [statement]))
+                elif units and units[-1][0] == 'global':
+                    units[-1][1].append(statement)
+                else:
+                    units.append(('global', [statement]))
+        if problems:
+            raise LinkError(problems)
+
+    def load_include(self, include: Include, context: CompileContext) -> Program:
+        include_path = os.path.join(context.base_dir, include.filename[1:-1])  # Remove quotes
+        with open(include_path, 'r') as f:
+            included_source = f.read()
+        context.included_files.append(include_path)
+        return self.parse_source(included_source)
+
+    def enter_function(self, statement: FuncDecl, frame_slots: int, static_frame: bool = False):
+        """Start the function's symbol table with its parameters; locals are declared as code generation reaches them."""
+        self.symbols = SymbolTable(VARIABLE_REGISTERS)
+        self.variables = self.symbols.registers
+        self.slots = self.symbols.slots
+        self.frame_slots = frame_slots  # Sized by analysis, which replays the same declarations
+        self.static_frame = static_frame
+        for name in statement.parameters:
+            self.symbols.declare(name)  # A parameter shadows a global of the same name
+
+    def enter_block(self):
+        self.symbols.enter()
+
+    def exit_block(self):
+        self.symbols.exit()
+
+    @property
+    def stack_frame(self) -> bool:
+        return bool(self.frame_slots) and not self.static_frame
+
+    def emit_prologue(self, statement: FuncDecl):
+        """Enter a frame for spilled locals and move the arguments to the parameters' homes."""
+        if self.stack_frame:
+            self.add_line(f"  ENTER {WORD * self.frame_slots}")
+        for i, param in enumerate(statement.parameters):
+            if i < len(ARGUMENT_REGISTERS):
+                self.store_variable(param, ARGUMENT_REGISTERS[i])
+                continue
+            # Stack arguments sit above the return address, and above the saved RBP inside a frame
+            base, offset = ('RBP', 2 * WORD) if self.stack_frame else ('RSP', WORD)
+            reg = f"R{self.variables[param]}" if param in self.variables else self.get_next_reg()
+            self.add_line(f"  MOVADDR {reg} {base} {offset + WORD * (i - len(ARGUMENT_REGISTERS))}")
+            if param in self.slots:
+                self.store_variable(param, reg)
+
+    def emit_return(self):
+        if self.current_function == 'main':
+            self.add_line("  HLT")
+            return
+        if self.stack_frame:
+            self.add_line("  LEAVE")
+        self.add_line("  RET")
+
+    def is_variable(self, name) -> bool:
+        return isinstance(name, str) and (name in self.symbols or name in self.globals)
+
+    def slot_address(self, name: str) -> str:
+        """Base and offset operands of a spilled local: in the static frame, or below RBP."""
+        if self.static_frame:
+            return f"0 {frame_marker(WORD * self.slots[name])}"
+        return f"RBP {-WORD * (self.slots[name] + 1)}"
+
+    def load_variable(self, name: str, reg: str = None) -> str:
+        """Operand holding a variable: its register, or `reg` (a new temporary by default) loaded from its slot or cell."""
+        if name in self.variables:
+            return f"R{self.variables[name]}"
+        reg = reg or self.get_next_reg()
+        if name in self.slots:
+            self.add_line(f"  MOVADDR {reg} {self.slot_address(name)}")
+        else:
+            self.add_line(f"  MOVADDR {reg} 0 {self.global_ref(self.globals[name])}")
+        return reg
 
-                self.decrease_indent()
-                self.decrease_indent()
-            else:
-                self.compile_statement(statement)
+    def store_variable(self, name: str, value: str):
+        if name in self.slots:
+            self.add_line(f"  MOVTO {self.slot_address(name)} {value}")
+        elif name in self.variables:
+            if value != f"R{self.variables[name]}":
+                self.add_line(f"  MOV R{self.variables[name]} {value}")
+        elif name in self.globals:
+            self.add_line(f"  MOVTO 0 {self.global_ref(self.globals[name])} {value}")
+        else:
+            raise ValueError(f"Variable '{name}' is not declared in this scope")
+
+    def assign_variable(self, name: str, value):
+        """Store a literal, string address, call result or expression in a variable."""
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            self.store_variable(name, str(value))
+        elif isinstance(value, FuncCall):
+            self.emit_call(value)
+            self.store_variable(name, 'RAX')
+        elif isinstance(value, str) and value.startswith('"'):
+            self.store_variable(name, f"${self.get_string_address(value[1:-1])}")
+        else:
+            self.store_variable(name, self.compile_expression(value))
+
+    def emit_call(self, statement: FuncCall):
+        """Pass the first arguments in ARGUMENT_REGISTERS and push the rest, last first; the result is in RAX."""
+        parameters = self.functions.get(statement.name)
+        if parameters is not None and len(parameters) != len(statement.args):
+            raise ValueError(f"Function '{statement.name}' expects {len(parameters)} arguments, got {len(statement.args)}")
+        stacked = statement.args[len(ARGUMENT_REGISTERS):]
+        for arg in reversed(stacked):
+            self.add_line(f"  PUSH {self.argument(arg)}")
+        for reg, arg in zip(ARGUMENT_REGISTERS, statement.args):
+            self.add_line(f"  MOV {reg} {self.argument(arg)}")
+        self.add_line(f"  CALL #{statement.name}")
+        if stacked:
+            self.add_line(f"  ADD RSP {WORD * len(stacked)}")
+
+    def argument(self, arg) -> str:
+        if isinstance(arg, int) or (isinstance(arg, str) and arg.lstrip('-').isdigit()):
+            return str(arg)
+        if isinstance(arg, str) and arg.startswith('"'):
+            return str(self.get_string_address(arg[1:-1]))
+        if self.is_variable(arg):
+            return self.load_variable(arg)
+        return self.compile_expression(arg)
+
+    def compile_main(self, statement: FuncDecl):
+        self.current_function = statement.name
+        self.add_line(f"LBL {statement.name}")
+        self.increase_indent()
+
+        # Output string definitions for the main function
+        self.emit_string_definitions(self.current_function)
+        self.emit_prologue(statement)
+
+        # Compile the main function body
+        for stmt in statement.body:
+            self.compile_statement(stmt)
+
+        # Add HLT at the end of main
+        self.add_line("HLT")
+
+        self.decrease_indent()
 
     def compile_statement(self, statement: ASTNode):
-        if isinstance(statement, VarDecl):
-            self.variables[statement.name] = len(self.variables)
-            if statement.initial_value is not None:
-                dest_reg = f"R{self.variables[statement.name]}"
-                if isinstance(statement.initial_value, int):
-                    self.add_line(f"  MOV {dest_reg} {statement.initial_value}")
-                elif isinstance(statement.initial_value, str) and statement.initial_value.startswith('"'):
-                    addr = self.get_string_address(statement.initial_value[1:-1])
-                    self.add_line(f"  MOV {dest_reg} ${addr}")
-                else:
-                    result_reg = self.compile_expression(statement.initial_value)
-                    if result_reg != dest_reg:
-                        self.add_line(f"  MOV {dest_reg} {result_reg}")
-        elif isinstance(statement, ConstDecl):
-            self.variables[statement.name] = len(self.variables)
-            self.const_variables[statement.name] = True
-            self.add_line(f"  MOV R{self.variables[statement.name]} {statement.value}")
-        elif isinstance(statement, Assignment):
-            dest_reg = f"R{self.variables[statement.name]}"
-            if isinstance(statement.value, int):
-                self.add_line(f"  MOV {dest_reg} {statement.value}")
-            elif isinstance(statement.value, str) and statement.value.startswith('"'):
-                addr = self.get_string_address(statement.value[1:-1])
-                self.add_line(f"  MOV {dest_reg} ${addr}")
+        """Compile a statement and everything nested in it using an explicit work stack.
+
+        Work items are either statements or callables that emit the code following
+        a nested block (closing labels, jumps, indentation).
+        """
+        work = [statement]
+        while work:
+            item = work.pop()
+            if callable(item):
+                item()
             else:
-                result_reg = self.compile_expression(statement.value)
-                if result_reg != dest_reg:  # Only generate MOV if registers are different
-                    self.add_line(f"  MOV {dest_reg} {result_reg}")
+                self.emit_statement(item, work)
+
+    def emit_statement(self, statement: ASTNode, work: List):
+        if isinstance(statement, (VarDecl, ConstDecl)):
+            if not self.is_variable(statement.name):
+                self.symbols.declare(statement.name)
+            if isinstance(statement, ConstDecl):
+                self.const_variables[statement.name] = True
+                self.store_variable(statement.name, str(statement.value))
+            elif statement.initial_value is not None:
+                self.assign_variable(statement.name, statement.initial_value)
+        elif isinstance(statement, Assignment):
+            self.assign_variable(statement.name, statement.value)
         elif isinstance(statement, Print):
             # Check if the first value is a variable or constant
             if len(statement.values) == 1:
                 value = statement.values[0]
-                if isinstance(value, int):
+                if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
                     # Directly print the integer
                     reg = self.get_next_reg()
                     self.add_line(f"  MOV {reg} {value}")
@@ -226,35 +424,19 @@ class UHighCompiler:
                     self.add_line(f"  MOV RAX 1")
                     self.add_line(f"  MOV RBX {addr}")
                     self.add_line(f"  CALL #printf")
-                elif isinstance(value, str) and value in self.const_variables:
-                    # Directly print the constant variable
-                    reg = f"R{self.variables[value]}"
+                elif self.is_variable(value):
+                    # Variables and constants hold integers: print them with printint
+                    reg = self.load_variable(value, 'RBX')
                     self.add_line(f"  MOV RAX 1")
-                    self.add_line(f"  MOV RBX {reg}")
-                    self.add_line(f"  CALL #printint")
-                
-                
-                
-                elif isinstance(value, str) and value in self.variables:
-                    # Check if the variable is an integer or string
-                    if isinstance(self.variables[value], int):
-                        # Use printint for integer variables
-                        reg = f"R{self.variables[value]}"
-                        self.add_line(f"  MOV RAX 1")
-                        self.add_line(f"  MOV RBX {reg}")
-                        self.add_line(f"  CALL #printint")
-                    else:
-                        # Use printf for string variables
-                        reg = f"R{self.variables[value]}"
-                        self.add_line(f"  MOV RAX 1")
+                    if reg != 'RBX':
                         self.add_line(f"  MOV RBX {reg}")
-                        self.add_line(f"  CALL #printf")
+                    self.add_line(f"  CALL #printint")
                 else:
                     # Fallback to formatted string handling
                     fmt = value
                     fmt_addr = self.get_string_address(fmt[1:-1]) if isinstance(fmt, str) and fmt.startswith('"') else fmt
                     formatted_addr = self.get_next_reg()
-                    self.add_line(f"  MNI Memory.allocate {formatted_addr} 256")
+                    self.add_line(f"  MOV {formatted_addr} {self.scratch_ref(FORMAT_BUFFER)}")
                     self.add_line(f"  MNI StringOperations.format {formatted_addr} {fmt_addr}")
                     self.add_line(f"  MOV RAX 1")
                     self.add_line(f"  MOV RBX {formatted_addr}")
@@ -278,9 +460,9 @@ class UHighCompiler:
                         reg = self.compile_expression(arg)
                         arg_addrs.append(reg)
 
-                # Allocate memory for the formatted string
+                # Format into the static scratch buffer
                 formatted_addr = self.get_next_reg()
-                self.add_line(f"  MNI Memory.allocate {formatted_addr} 256")
+                self.add_line(f"  MOV {formatted_addr} {self.scratch_ref(FORMAT_BUFFER)}")
 
                 # Call MNI StringOperations.format
                 self.add_line(f"  MNI StringOperations.format {formatted_addr} {fmt_addr} {' '.join(arg_addrs)}")
@@ -290,32 +472,37 @@ class UHighCompiler:
                 self.add_line(f"  MOV RBX {formatted_addr}")
                 self.add_line(f"  CALL #printf")
         elif isinstance(statement, IfStatement):
-            unique_id = self.label_counter
+            unique_id = self.next_label_id()
             true_label = f"if_true_{unique_id}"
             false_label = f"if_false_{unique_id}"
             end_label = f"if_end_{unique_id}"
-            self.label_counter += 1
-
-            # Collect strings in both true and false blocks
-            self.collect_strings_in_block(statement.true_block)
-            if statement.false_block:
-                self.collect_strings_in_block(statement.false_block)
 
             condition_code = self.compile_condition(statement.condition, false_label)
             self.output.extend(condition_code)
             self.add_line(f"LBL {true_label}")
             self.increase_indent()
-            for stmt in statement.true_block:
-                self.compile_statement(stmt)
-            self.decrease_indent()
-            self.add_line(f"  JMP #{end_label}")
-            self.add_line(f"  LBL {false_label}")
-            if statement.false_block:
-                self.increase_indent()
-                for stmt in statement.false_block:
-                    self.compile_statement(stmt)
+            self.enter_block()
+
+            def close_true_block():
+                self.exit_block()
                 self.decrease_indent()
-            self.add_line(f"LBL {end_label}")
+                self.add_line(f"  JMP #{end_label}")
+                self.add_line(f"  LBL {false_label}")
+                if statement.false_block:
+                    self.increase_indent()
+                    self.enter_block()
+
+            def close_false_block():
+                if statement.false_block:
+                    self.exit_block()
+                    self.decrease_indent()
+                self.add_line(f"LBL {end_label}")
+
+            # The work stack is LIFO, so queue the pieces in reverse order
+            work.append(close_false_block)
+            work.extend(reversed(statement.false_block or []))
+            work.append(close_true_block)
+            work.extend(reversed(statement.true_block))
         elif isinstance(statement, WhileStatement):
             start_label = self.get_next_label()
             end_label = self.get_next_label()
@@ -326,11 +513,15 @@ class UHighCompiler:
                 # Parse condition string
                 parts = cond.split()
                 left, op, right = parts[0], parts[1], parts[2]
-                reg_left = left if left.startswith('R') else (f"R{self.variables[left]}" if left in self.variables else left)
-                reg_right = right if right.startswith('R') else (f"R{self.variables[right]}" if right in self.variables else right)
-                self.add_line(f"  MOV R1 {reg_left}")
-                self.add_line(f"  MOV R2 {reg_right}")
-                self.add_line(f"  CMP R1 R2")
+                # Compare in temporaries so the operands' variable registers are left intact
+                temp_left = self.get_next_reg()
+                temp_right = self.get_next_reg()
+                for temp, operand in ((temp_left, left), (temp_right, right)):
+                    if self.is_variable(operand):
+                        operand = self.load_variable(operand, temp)
+                    if operand != temp:
+                        self.add_line(f"  MOV {temp} {operand}")
+                self.add_line(f"  CMP {temp_left} {temp_right}")
                 if op == '<':
                     self.add_line(f"  JGE #{end_label}")
                 elif op == '>':
@@ -345,56 +536,51 @@ class UHighCompiler:
                     self.add_line(f"  JL #{end_label}")
             else:
                 # Fallback: treat as boolean variable
-                reg_cond = cond if cond.startswith('R') else (f"R{self.variables[cond]}" if cond in self.variables else cond)
+                reg_cond = self.load_variable(cond) if self.is_variable(cond) else cond
                 self.add_line(f"  CMP {reg_cond} 0")
                 self.add_line(f"  JE #{end_label}")
-            for stmt in statement.body:
-                self.compile_statement(stmt)
-            self.add_line(f"  JMP #{start_label}")
-            self.add_line(f"LBL {end_label}")
+
+            self.enter_block()
+
+            def close_loop():
+                self.exit_block()
+                self.add_line(f"  JMP #{start_label}")
+                self.add_line(f"LBL {end_label}")
+
+            work.append(close_loop)
+            work.extend(reversed(statement.body))
         elif isinstance(statement, FuncDecl):
             self.current_function = statement.name
             self.add_line(f"LBL {statement.name}")
 
-            # Stack-based argument handling
-            if hasattr(statement, 'parameters') and statement.parameters:
-                for i, param in enumerate(statement.parameters):
-                    reg = f"R{i}"
-                    self.add_line(f"  POP {reg}")
-                    self.variables[param] = i
-
-            # Collect strings in the function body first
-            self.collect_strings_in_block(statement.body)
-            # Output string definitions for this function
-            if self.current_function in self.function_strings:
-                for string, addr in self.function_strings[self.current_function].items():
-                    self.add_line(f'    ;; Length: {self.string_lengths[string]} bytes')
-                    self.add_line(f'    DB ${addr} "{string}"')
-                if self.function_strings[self.current_function]:
-                    self.add_line("")  # Empty line after string definitions
+            # Output string definitions for this function (recorded by the analysis pass)
+            self.emit_string_definitions(self.current_function)
+            self.emit_prologue(statement)
             # Compile function body
             self.increase_indent()
-            for stmt in statement.body:
-                self.compile_statement(stmt)
-            self.decrease_indent()
-            self.current_function = None  # Reset current function
+
+            def close_function():
+                self.emit_return()
+                self.decrease_indent()
+                self.current_function = None  # Reset current function
+
+            work.append(close_function)
+            work.extend(reversed(statement.body))
         elif isinstance(statement, FuncCall):
-            # Stack-based argument passing
-            if hasattr(statement, 'args') and statement.args:
-                for arg in reversed(statement.args):
-                    if isinstance(arg, int):
-                        reg = self.get_next_reg()
-                        self.add_line(f"  MOV {reg} {arg}")
-                        self.add_line(f"  PUSH {reg}")
-                    elif isinstance(arg, str) and arg in self.variables:
-                        reg = f"R{self.variables[arg]}"
-                        self.add_line(f"  PUSH {reg}")
-                    else:
-                        reg = self.compile_expression(arg)
-                        self.add_line(f"  PUSH {reg}")
-            self.add_line(f"  CALL #{statement.name}")
+            self.emit_call(statement)
+        elif isinstance(statement, Input):
+            self.add_line(f"  CALL #readint")
+            self.store_variable(statement.name, 'RAX')
+        elif isinstance(statement, Return):
+            if statement.value is not None:
+                if isinstance(statement.value, str) and statement.value.isdigit():
+                    self.add_line(f"  MOV RAX {statement.value}")
+                else:
+                    self.add_line(f"  MOV RAX {self.compile_expression(statement.value)}")
+            self.emit_return()
         elif isinstance(statement, InlineAsm):
             # Add inline assembly code directly to the output
+            self.inline_asm = True
             # Prefix with a comment indicating it's inline assembly
             self.add_line(f"    ; Inline μHigh assembly block")
             
@@ -435,9 +621,9 @@ class UHighCompiler:
                 raise ValueError(f"Invalid condition operator: {op}")
             
             # Check if both sides are strings or variables containing strings
-            if (left.startswith('"') and right.startswith('"')) or (left in self.variables and right.startswith('"')):
-                left_addr = self.get_string_address(left[1:-1]) if left.startswith('"') else f"R{self.variables[left]}"
-                right_addr = self.get_string_address(right[1:-1]) if right.startswith('"') else f"R{self.variables[right]}"
+            if (left.startswith('"') and right.startswith('"')) or (self.is_variable(left) and right.startswith('"')):
+                left_addr = self.get_string_address(left[1:-1]) if left.startswith('"') else self.load_variable(left)
+                right_addr = self.get_string_address(right[1:-1]) if right.startswith('"') else self.load_variable(right)
                 return [
                     f"    MNI StringOperations.cmp {left_addr} {right_addr}",
                     f"    {ops[op]} #{false_label}"
@@ -476,14 +662,13 @@ class UHighCompiler:
             self.add_line(f"MOV {reg} {expr}")
             return reg
             
-        if expr in self.variables:
+        if self.is_variable(expr):
             reg = self.get_next_reg()
-            self.add_line(f"MOV {reg} R{self.variables[expr]}")
+            operand = self.load_variable(expr, reg)
+            if operand != reg:
+                self.add_line(f"MOV {reg} {operand}")
             return reg
 
-        if expr in self.const_variables:
-            return f"R{self.variables[expr]}"
-
         # Basic arithmetic
         ops = {'+': 'ADD', '-': 'SUB', '*': 'MUL', '/': 'DIV'}
         for op in ops:
@@ -499,23 +684,122 @@ class UHighCompiler:
 
         raise ValueError(f"Invalid expression: {expr}")
 
-    def collect_strings_in_block(self, statements: List[ASTNode]):
-        for stmt in statements:
-            if isinstance(stmt, Print):
-                for val in stmt.values:
-                    if isinstance(val, str) and val.startswith('"'):
-                        self.get_string_address(val[1:-1])
-            elif hasattr(stmt, 'body') and isinstance(stmt.body, list):
-                self.collect_strings_in_block(stmt.body)
-            elif hasattr(stmt, 'true_block') and isinstance(stmt.true_block, list):
-                self.collect_strings_in_block(stmt.true_block)
-            elif hasattr(stmt, 'false_block') and isinstance(stmt.false_block, list):
-                self.collect_strings_in_block(stmt.false_block)
+class FlatStatements:
+    """A statement list flattened into a table of nodes so pickling does not recurse per nesting level."""
+
+    def __init__(self, statements: List[ASTNode]):
+        # Preorder walk; reversed, every node comes after all of its descendants
+        order = []
+        pending = list(reversed(statements))
+        while pending:
+            node = pending.pop()
+            order.append(node)
+            for value in node.__dict__.values():
+                if isinstance(value, list):
+                    pending.extend(item for item in reversed(value) if isinstance(item, ASTNode))
+                elif isinstance(value, ASTNode):
+                    pending.append(value)
+        order.reverse()
+        ids = {id(node): i for i, node in enumerate(order)}
+
+        def ref(value):
+            if isinstance(value, ASTNode):
+                return ('node', ids[id(value)])
+            if isinstance(value, list) and any(isinstance(item, ASTNode) for item in value):
+                return ('nodes', [ids[id(item)] for item in value])
+            return ('value', value)
+
+        self.nodes = [(node.__class__, {k: ref(v) for k, v in node.__dict__.items()}) for node in order]
+        self.roots = [ids[id(node)] for node in statements]
+
+    def restore(self) -> List[ASTNode]:
+        built = []
+        for cls, fields in self.nodes:
+            node = cls.__new__(cls)
+            for key, (kind, value) in fields.items():
+                if kind == 'node':
+                    value = built[value]
+                elif kind == 'nodes':
+                    value = [built[i] for i in value]
+                setattr(node, key, value)
+            built.append(node)
+        return [built[i] for i in self.roots]
+
+def compile_unit(job, stats: CompileStats = None) -> CodeUnit:
+    """Generate relocatable code for one unit; runs in a worker process when jobs > 1."""
+    name, statements, scope, program, passes = job
+    if isinstance(statements, FlatStatements):
+        statements = statements.restore()
+    compiler = UHighCompiler(stats=stats)
+    compiler.relocatable = True
+    compiler.globals = program.globals
+    compiler.const_variables = dict(program.const_variables)
+    compiler.functions = program.functions
+    compiler.current_function = name
+
+    # String addresses come from the analysis tables; codegen never rescans blocks
+    compiler.function_strings[name] = dict(scope.strings)
+    compiler.next_mem_addr = scope.data_size
+
+    if isinstance(statements[0], FuncDecl):
+        compiler.enter_function(statements[0], scope.frame_slots, scope.static_frame)
+    if name == 'main':
+        compiler.compile_main(statements[0])
+    elif isinstance(statements[0], FuncDecl):
+        compiler.compile_statement(statements[0])
+    else:
+        compiler.emit_string_definitions(name)
+        for statement in statements:
+            compiler.compile_statement(statement)
+
+    compiler.count('registers_allocated', compiler.registers_allocated + compiler.symbols.registers_used)
+
+    # Optimize the unit as basic blocks before laying it out as text again
+    compiler.count('codegen_chars', sum(len(line) for line in compiler.output))
+    function = build_function(name, compiler.output, compiler.label_counter)
+    if not compiler.inline_asm:
+        # Temporaries are allocated above the variable registers in use and never carry values out of a unit
+        function.temporaries = {f"R{i}" for i in range(compiler.symbols.registers_used, 15)}
+    if isinstance(statements[0], FuncDecl) and not compiler.inline_asm:
+        function.locals = {f"R{i}" for i in range(compiler.symbols.registers_used)}
+    function.calls = call_effects(function.globals, compiler.inline_asm)
+    passes.run('ir', function, stats)
+    lines = passes.run('masm', emit(function), stats)
+    frame_size = WORD * scope.frame_slots if scope.static_frame else 0
+    return CodeUnit(name, lines, function.label_count, compiler.next_mem_addr, compiler.scratch_size, frame_size,
+                    scope.initial_values)
+
+def write_stats_report(stats: CompileStats, fmt: str, path: str = None):
+    report = stats.report(fmt)
+    if path:
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+def add_pass_arguments(parser: ArgumentParser):
+    parser.add_argument("-O", dest="level", type=int, choices=LEVELS, help=f"Optimization level (default {DEFAULT_LEVEL}, or the config file's)")
+    parser.add_argument("--enable-pass", action="append", default=[], metavar="PASS", help="Run this pass whatever the level")
+    parser.add_argument("--disable-pass", action="append", default=[], metavar="PASS", help="Skip this pass whatever the level")
+    parser.add_argument("--config", help="Config file with an \"optimization\" section (default: config.json beside the sources, if any)")
+
+def pass_manager(args, directory: str) -> PassManager:
+    """The pipeline asked for on the command line, on top of the config file's."""
+    config = args.config or os.path.join(directory or '.', 'config.json')
+    if args.config or os.path.exists(config):
+        return PassManager.from_config(config, args.level, args.enable_pass, args.disable_pass)
+    return PassManager(DEFAULT_LEVEL if args.level is None else args.level, args.enable_pass, args.disable_pass)
 
 def main():
     parser = argparse.ArgumentParser(description="μHigh Compiler")
     parser.add_argument("source_file", help="Path to the source file")
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debugging mode")
+    parser.add_argument("-f", "--format", choices=["masm", "bytecode"], default="masm", help="Output format")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Worker processes for per-function code generation")
+    parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], help="Report per-phase peak memory and compiler counters (implies in-process code generation)")
+    parser.add_argument("--stats-output", help="Write the statistics report to this file instead of stdout")
+    parser.add_argument("--memory-map", action="store_true", help="Print where the static image puts each string, buffer and frame")
+    add_pass_arguments(parser)
     args = parser.parse_args()
 
     source_file = args.source_file
@@ -524,20 +808,40 @@ def main():
     with open(source_file, 'r') as f:
         source = f.read()
 
-    compiler = UHighCompiler()
+    stats = CompileStats() if args.stats else None
+    compiler = UHighCompiler(jobs=args.jobs, stats=stats, passes=pass_manager(args, base_dir))
     parser = Parser(Lexer(source).tokenize(), debug=args.debug)
     program = parser.parse()
 
-    output = compiler.compile(source, base_dir)
-
-    output_file = source_file.replace('.uh', '.masm')
-    with open(output_file, 'w', encoding="utf-8") as f:
-        try:
-            f.write(output)
-        except Exception as e:
-            print("Error writing output file:", e)
-            print("Output so far:")
-            print(output)
+    context = CompileContext(base_dir, os.path.basename(source_file))
+    try:
+        output = compiler.compile(source, base_dir, context)
+    except LinkError as e:
+        for problem in e.problems:
+            print(f"Link error: {problem}", file=sys.stderr)
+        sys.exit(1)
+
+    with compiler.phase('write'):
+        if args.format == "bytecode":
+            output_file = source_file.replace('.uh', '.mbc')
+            with open(output_file, 'wb') as f:
+                f.write(assemble(output, context.linked.image(), context.linked.layout.base))
+        else:
+            output_file = source_file.replace('.uh', '.masm')
+            with open(output_file, 'w', encoding="utf-8") as f:
+                try:
+                    f.write(output)
+                except Exception as e:
+                    print("Error writing output file:", e)
+                    print("Output so far:")
+                    print(output)
+
+    if stats:
+        stats.stop()
+        write_stats_report(stats, args.stats, args.stats_output)
+
+    if args.memory_map:
+        print(context.linked.layout.report())
 
     if args.debug:
         print("Debugging information:")
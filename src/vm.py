@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Reference MicroASM interpreter: a plain decode-and-dispatch loop.
+
+Registers hold Python ints, memory is a flat bytearray and the stack grows down
+from the top of memory in 8-byte words. CALL targets that are not labels in the
+program are treated as the stdio externals the compiler relies on:
+#printf (string at RBX), #printint (integer in RBX) and #readint (into RAX).
+"""
+import sys
+import argparse
+from typing import List, Iterable, Union
+from masm import REGISTERS, parse_masm, parse_int, MasmProgram
+
+WORD = 8
+CONDITIONS = {
+    'JE': lambda flag: flag == 0,
+    'JNE': lambda flag: flag != 0,
+    'JL': lambda flag: flag < 0,
+    'JG': lambda flag: flag > 0,
+    'JLE': lambda flag: flag <= 0,
+    'JGE': lambda flag: flag >= 0,
+}
+
+class VirtualMachine:
+    def __init__(self, program: Union[str, MasmProgram], inputs: Iterable[int] = (),
+                 max_steps: int = 10_000_000, memory_size: int = 1 << 20):
+        self.program = parse_masm(program) if isinstance(program, str) else program
+        self.inputs = list(inputs)
+        self.max_steps = max_steps
+        self.memory = bytearray(memory_size)
+        self.registers = {name: 0 for name in REGISTERS}
+        self.registers['RSP'] = memory_size
+        self.registers['RBP'] = memory_size
+        self.heap = memory_size // 2  # Memory.allocate hands out blocks from here
+        self.flag = 0
+        self.output: List[str] = []
+        self.steps = 0
+        self.halted = False
+        self.exit_code = 0
+        for addr, text in self.program.data:
+            self.store_string(addr, text)
+
+    # Memory helpers
+    def store_string(self, addr: int, text: str):
+        raw = text.encode('utf-8') + b'\0'
+        self.memory[addr:addr + len(raw)] = raw
+
+    def load_string(self, addr: int) -> str:
+        end = self.memory.index(0, addr)
+        return self.memory[addr:end].decode('utf-8', errors='replace')
+
+    def load_word(self, addr: int) -> int:
+        return int.from_bytes(self.memory[addr:addr + WORD], 'little', signed=True)
+
+    def store_word(self, addr: int, value: int):
+        value = ((value + (1 << 63)) % (1 << 64)) - (1 << 63)  # Wrap to a signed 64-bit word
+        self.memory[addr:addr + WORD] = value.to_bytes(WORD, 'little', signed=True)
+
+    def push(self, value: int):
+        self.registers['RSP'] -= WORD
+        self.store_word(self.registers['RSP'], value)
+
+    def pop(self) -> int:
+        value = self.load_word(self.registers['RSP'])
+        self.registers['RSP'] += WORD
+        return value
+
+    # Operand decoding, repeated on every execution
+    def value(self, arg: str) -> int:
+        if arg in self.registers:
+            return self.registers[arg]
+        if arg.startswith('$'):
+            arg = arg[1:]
+            if arg in self.registers:
+                return self.registers[arg]
+        number = parse_int(arg)
+        if number is None:
+            raise RuntimeError(f"Cannot read operand '{arg}'")
+        return number
+
+    def set(self, arg: str, value: int):
+        if arg not in self.registers:
+            raise RuntimeError(f"Cannot write to operand '{arg}'")
+        self.registers[arg] = value
+
+    def target(self, arg: str) -> int:
+        name = arg[1:] if arg.startswith('#') else arg
+        if name not in self.program.labels:
+            raise RuntimeError(f"Unknown label '{name}'")
+        return self.program.labels[name]
+
+    def write(self, text: str):
+        self.output.append(text)
+
+    # Externals provided by the stdio include
+    def external(self, name: str):
+        if name == 'printf':
+            self.write(self.load_string(self.registers['RBX']) + '\n')
+        elif name == 'printint':
+            self.write(f"{self.registers['RBX']}\n")
+        elif name == 'readint':
+            if not self.inputs:
+                raise RuntimeError("readint: no input left")
+            self.registers['RAX'] = self.inputs.pop(0)
+        else:
+            raise RuntimeError(f"Unknown external '{name}'")
+
+    def mni(self, args: List[str]):
+        name = args[0]
+        if name == 'Memory.allocate':
+            size = self.value(args[2])
+            self.set(args[1], self.heap)
+            self.heap += size
+        elif name == 'StringOperations.format':
+            text = self.load_string(self.value(args[2]))
+            for arg in args[3:]:
+                value = self.load_string(self.value(arg)) if arg.startswith('$') else str(self.value(arg))
+                for spec in ('%d', '%s', '{}'):
+                    if spec in text:
+                        text = text.replace(spec, value, 1)
+                        break
+            self.store_string(self.value(args[1]), text)
+        else:
+            raise RuntimeError(f"Unsupported MNI function '{name}'")
+
+    def run(self) -> 'VirtualMachine':
+        instructions = self.program.instructions
+        pc = self.program.labels.get('main', 0)
+        regs = self.registers
+        while not self.halted and pc < len(instructions):
+            if self.steps >= self.max_steps:
+                raise RuntimeError(f"Step budget of {self.max_steps} exceeded")
+            self.steps += 1
+            instr = instructions[pc]
+            op, args = instr.op, instr.args
+            pc += 1
+            if op == 'MOV':
+                self.set(args[0], self.value(args[1]))
+            elif op == 'ADD':
+                self.set(args[0], self.value(args[0]) + self.value(args[1]))
+            elif op == 'SUB':
+                self.set(args[0], self.value(args[0]) - self.value(args[1]))
+            elif op == 'MUL':
+                self.set(args[0], self.value(args[0]) * self.value(args[1]))
+            elif op == 'DIV':
+                divisor = self.value(args[1])
+                if divisor == 0:
+                    raise RuntimeError(f"Division by zero on line {instr.line}")
+                self.set(args[0], int(self.value(args[0]) / divisor))
+            elif op == 'INC':
+                self.set(args[0], self.value(args[0]) + 1)
+            elif op == 'DEC':
+                self.set(args[0], self.value(args[0]) - 1)
+            elif op == 'AND':
+                self.set(args[0], self.value(args[0]) & self.value(args[1]))
+            elif op == 'OR':
+                self.set(args[0], self.value(args[0]) | self.value(args[1]))
+            elif op == 'XOR':
+                self.set(args[0], self.value(args[0]) ^ self.value(args[1]))
+            elif op == 'NOT':
+                self.set(args[0], ~self.value(args[0]))
+            elif op == 'SHL':
+                self.set(args[0], self.value(args[0]) << self.value(args[1]))
+            elif op == 'SHR':
+                self.set(args[0], self.value(args[0]) >> self.value(args[1]))
+            elif op == 'CMP':
+                left, right = self.value(args[0]), self.value(args[1])
+                self.flag = (left > right) - (left < right)
+            elif op == 'JMP':
+                pc = self.target(args[0])
+            elif op in CONDITIONS:
+                if CONDITIONS[op](self.flag):
+                    pc = self.target(args[0])
+                elif len(args) > 1:
+                    pc = self.target(args[1])
+            elif op == 'CALL':
+                name = args[0].lstrip('#$')
+                if name in self.program.labels:
+                    self.push(pc)
+                    pc = self.program.labels[name]
+                else:
+                    self.external(name)
+            elif op == 'RET':
+                if regs['RSP'] >= len(self.memory):
+                    self.halted = True
+                else:
+                    pc = self.pop()
+            elif op == 'PUSH':
+                self.push(self.value(args[0]))
+            elif op == 'POP':
+                self.set(args[0], self.pop())
+            elif op == 'ENTER':
+                self.push(regs['RBP'])
+                regs['RBP'] = regs['RSP']
+                regs['RSP'] -= self.value(args[0])
+            elif op == 'LEAVE':
+                regs['RSP'] = regs['RBP']
+                regs['RBP'] = self.pop()
+            elif op == 'MOVADDR':
+                self.set(args[0], self.load_word(self.value(args[1]) + self.value(args[2])))
+            elif op == 'MOVTO':
+                self.store_word(self.value(args[0]) + self.value(args[1]), self.value(args[2]))
+            elif op == 'OUT':
+                text = self.load_string(self.value(args[1])) if args[1].startswith('$') else str(self.value(args[1]))
+                self.write(text + '\n')
+            elif op == 'COUT':
+                self.write(chr(self.value(args[1])))
+            elif op == 'MNI':
+                self.mni(args)
+            elif op == 'HLT':
+                self.halted = True
+            elif op == 'EXIT':
+                self.exit_code = self.value(args[0])
+                self.halted = True
+            else:
+                raise RuntimeError(f"Unsupported instruction '{op}' on line {instr.line}")
+        return self
+
+    @property
+    def stdout(self) -> str:
+        return ''.join(self.output)
+
+def run_masm(source: str, inputs: Iterable[int] = (), max_steps: int = 10_000_000) -> VirtualMachine:
+    return VirtualMachine(source, inputs, max_steps).run()
+
+def main():
+    parser = argparse.ArgumentParser(description="MicroASM reference interpreter")
+    parser.add_argument("source_file", help="Path to the .masm file")
+    parser.add_argument("inputs", nargs="*", type=int, help="Integers returned by #readint, in order")
+    parser.add_argument("--max-steps", type=int, default=10_000_000, help="Abort after this many instructions")
+    parser.add_argument("--count", action="store_true", help="Report the number of executed instructions")
+    args = parser.parse_args()
+
+    with open(args.source_file, 'r', encoding='utf-8') as f:
+        source = f.read()
+    try:
+        vm = run_masm(source, args.inputs, args.max_steps)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(vm.stdout)
+    if args.count:
+        print(f"Executed {vm.steps} instructions", file=sys.stderr)
+    sys.exit(vm.exit_code)
+
+if __name__ == "__main__":
+    main()
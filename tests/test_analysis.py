@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.lexer import Lexer
+from src.uhigh import UHighCompiler
+from analysis import analyze
+from parser import Parser
+
+def units_for(code):
+    compiler = UHighCompiler()
+    units = []
+    compiler.split_units(Parser(Lexer(code).tokenize()).parse(), units)
+    return units
+
+class TestAnalysis(unittest.TestCase):
+    def test_records_strings_per_unit_in_source_order(self):
+        info = analyze(units_for('func f(a, b) { var c = 1 if c == "k" { print("x") } else { print("y") } print("x") } '
+                                 'var g = "top" func main() { const N = 3 print("m") }'))
+        self.assertEqual([scope.name for scope in info.scopes], ['f', 'global', 'main'])
+        f, top, main = info.scopes
+        self.assertEqual(f.strings, {'k': 0, 'x': 2, 'y': 4})
+        self.assertEqual(f.data_size, 6)
+        self.assertEqual(f.variables, ['a', 'b', 'c'])
+        self.assertEqual(top.strings, {'top': 0})
+        self.assertEqual(main.constants, ['N'])
+        self.assertEqual(info.program.functions, {'f': ['a', 'b'], 'main': []})
+        self.assertEqual(info.program.globals, {'g': 0})
+
+    def test_call_arity_is_checked_against_signature(self):
+        with self.assertRaises(ValueError):
+            UHighCompiler().compile('func f(a) { print("x") } func main() { f() }')
+
+    def test_nested_ifs_compile(self):
+        depth = 3000
+        body = 'if x == 1 { print("a") ' * depth + ' }' * depth
+        output = UHighCompiler().compile('func main() { var x = 1 ' + body + ' }')
+        self.assertEqual(output.count('DB $'), 1)
+        # Every false branch is threaded straight to the outermost end, so no jumps over empty else blocks remain
+        self.assertEqual(output.count('JNE #'), depth)
+        self.assertEqual(output.count('JMP #'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
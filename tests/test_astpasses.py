@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+from src.astpasses import coalesce_prints
+
+class TestCoalescePrints(unittest.TestCase):
+    def test_output_is_preserved(self):
+        code = '''func main() {
+    var x = 3
+    print("a")
+    print(42)
+    print("")
+    print("b\\tc")
+    print(x)
+    print("d")
+    print("e")
+    if x > 1 {
+        print("f")
+        print(7)
+    }
+}'''
+        output = UHighCompiler().compile(code)
+        self.assertEqual(run_masm(output).stdout, 'a\n42\n\nb\tc\n3\nd\ne\nf\n7\n')
+        self.assertEqual(output.count('CALL #printf'), 3)
+        self.assertEqual(output.count('CALL #printint'), 1)
+
+    def test_unsafe_strings_are_kept_apart(self):
+        code = '''func main() {
+    print("a\\0b")
+    print("c")
+}'''
+        output = UHighCompiler().compile(code)
+        self.assertEqual(run_masm(output).stdout, 'a\nc\n')
+        self.assertEqual(output.count('CALL #printf'), 2)
+
+    def test_parsed_program_is_not_modified(self):
+        program = UHighCompiler().parse_source('func main() {\n    print("a")\n    print("b")\n}')
+        body = program.statements[0].body
+        rewritten = coalesce_prints(program.statements)
+        self.assertEqual(len(body), 2)
+        self.assertIsNot(rewritten[0], program.statements[0])
+        self.assertEqual(rewritten[0].body[0].values, ['"a\\nb"'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+from src.masm import REGISTER_INDEX
+from src.batch import np, run_batch
+
+@unittest.skipUnless(np is not None, "NumPy is not installed")
+class TestBatchMachine(unittest.TestCase):
+    def test_lanes_match_reference(self):
+        code = '''func main() {
+    var n = 0
+    var total = 0
+    input n
+    while n > 0 {
+        if n > 3 { total = total + n } else { total = total - 1 }
+        n = n - 1
+    }
+    print("total:")
+    print(total)
+}'''
+        source = UHighCompiler().compile(code)
+        lanes = [[n] for n in (0, 1, 5, 12, 3, 40)]
+        vm = run_batch(source, lanes)
+        for lane, inputs in enumerate(lanes):
+            expected = run_masm(source, inputs)
+            self.assertEqual(vm.stdouts[lane], expected.stdout)
+            self.assertEqual(vm.steps[lane], expected.steps)
+        self.assertLess(vm.issued, sum(vm.steps))  # Converged lanes share instructions
+
+    def test_compares_near_the_int64_limits_match_reference(self):
+        source = 'LBL main\nCALL #readint\nMOV R0 RAX\nCALL #readint\nCMP R0 RAX\nJL #less\nJG #greater\n' \
+                 'MOV RBX 0\nJMP #done\nLBL less\nMOV RBX -1\nJMP #done\nLBL greater\nMOV RBX 1\n' \
+                 'LBL done\nCALL #printint\nHLT'
+        big = 2 ** 62
+        lanes = [[big, -big], [-big, big], [2 ** 63 - 1, -2 ** 63], [-2 ** 63, 2 ** 63 - 1], [big, big], [-1, 0]]
+        vm = run_batch(source, lanes)
+        for lane, inputs in enumerate(lanes):
+            self.assertEqual(vm.stdouts[lane], run_masm(source, inputs).stdout)
+
+    def test_lane_errors_are_isolated(self):
+        source = 'LBL main\nCALL #readint\nMOV R0 10\nDIV R0 RAX\nMOV RBX R0\nCALL #printint\nHLT'
+        vm = run_batch(source, [[3], [0], [], [-4]])
+        self.assertEqual(vm.stdouts, ['3\n', '', '', '-2\n'])
+        self.assertIsNone(vm.errors[0])
+        self.assertIn('Division by zero', vm.errors[1])
+        self.assertIn('no input left', vm.errors[2])
+
+    def test_calls_frames_and_step_budget(self):
+        source = '''
+LBL square
+    ENTER 8
+    MOVTO RBP -8 RAX
+    MOVADDR RBX RBP -8
+    MUL RBX RBX
+    LEAVE
+    RET
+LBL main
+    CALL #readint
+    CMP RAX 0
+    JL #spin
+    CALL #square
+    CALL #printint
+    HLT
+LBL spin
+    JMP #spin
+'''
+        vm = run_batch(source, [[7], [-1], [3]], max_steps=1000)
+        self.assertEqual(vm.stdouts, ['49\n', '', '9\n'])
+        self.assertIn('Step budget', vm.errors[1])
+        self.assertEqual(vm.registers[REGISTER_INDEX['RSP'], 0], 1 << 16)  # RSP restored
+
+if __name__ == '__main__':
+    unittest.main()
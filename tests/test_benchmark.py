@@ -0,0 +1,25 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.benchmark import compare, measure, ROOT
+
+METRICS = {'static_instructions': 100, 'data_bytes': 20, 'executed_instructions': 1000, 'output_sha1': 'abc'}
+
+class TestBenchmark(unittest.TestCase):
+    def test_compare_flags_regressions_past_threshold(self):
+        baseline = {'a.uh': METRICS, 'b.uh': METRICS}
+        current = {'a.uh': dict(METRICS, static_instructions=104, executed_instructions=1200)}
+        regressions = compare(baseline, current, 0.05)
+        self.assertEqual(regressions, ['a.uh: executed_instructions 1000 -> 1200', 'b.uh: no longer compiles or runs'])
+        self.assertEqual(compare(baseline, {'a.uh': METRICS, 'b.uh': dict(METRICS, output_sha1='x')}, 0.05),
+                         ['b.uh: program output changed'])
+
+    def test_measure_counts_executed_instructions_over_inputs(self):
+        metrics = measure(os.path.join(ROOT, 'benchmarks', 'stats.uh'))
+        self.assertGreater(metrics['static_instructions'], 0)
+        self.assertGreater(metrics['executed_instructions'], metrics['static_instructions'])
+        self.assertGreater(metrics['data_bytes'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
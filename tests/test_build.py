@@ -1,12 +1,69 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
 import unittest
 from src import build
+from src.build import build_project
+from src.linker import LinkError, read_object
+from src.passes import PassManager
+from src.vm import run_masm
 
 class TestBuild(unittest.TestCase):
     def test_build_project_exists(self):
         self.assertTrue(hasattr(build, 'build_project'))
 
+    def write(self, directory, name, source):
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(source)
+
+    def test_objects_are_linked_and_reused(self):
+        with tempfile.TemporaryDirectory() as project:
+            self.write(project, 'lib.uh', 'func greet() { print("hi") if 1 == 1 { print("yes") } }')
+            self.write(project, 'main.uh', 'func main() { print("start") greet() }')
+            output_file = build_project(project)
+            obj = read_object(os.path.join(project, 'build', 'main.uo'))
+            self.assertEqual(obj.exports, ['main'])
+            self.assertEqual(obj.imports, ['greet'])
+            with open(output_file) as f:
+                output = f.read()
+            self.assertEqual(run_masm(output).stdout, 'start\nhi\nyes\n')
+
+            lib_object = os.path.join(project, 'build', 'lib.uo')
+            before = os.path.getmtime(lib_object)
+            self.write(project, 'main.uh', 'func main() { greet() print("end") }')
+            os.utime(lib_object, (before - 10, before - 10))
+            build_project(project)
+            self.assertEqual(os.path.getmtime(lib_object), before - 10)  # lib.uh did not change
+            with open(output_file) as f:
+                self.assertEqual(run_masm(f.read()).stdout, 'hi\nyes\nend\n')
+
+            build_project(project, passes=PassManager(0))
+            self.assertNotEqual(os.path.getmtime(lib_object), before - 10)  # Other passes: rebuilt
+            self.assertEqual(read_object(lib_object).pipeline, 'save-live-registers')
+
+    def test_files_keep_their_own_globals(self):
+        with tempfile.TemporaryDirectory() as project:
+            self.write(project, 'lib.uh', 'var count = 0 func tick() { count = count + 1 print(count) }')
+            self.write(project, 'main.uh', 'var total = 0 func main() { total = 7 tick() tick() print(total) }')
+            with open(build_project(project)) as f:
+                self.assertEqual(run_masm(f.read()).stdout, '1\n2\n7\n')
+
+    def test_global_initializers_run_before_main(self):
+        with tempfile.TemporaryDirectory() as project:
+            self.write(project, 'a.uh', 'var ga = 5 func twice() { ga = ga + ga print(ga) } func half() { var h = ga / 2 print(h) }')
+            self.write(project, 'b.uh', 'var gb = 7 func main() { twice() gb = gb + 30 print(gb) half() }')
+            with open(build_project(project)) as f:
+                self.assertEqual(run_masm(f.read()).stdout, '10\n37\n5\n')
+
+    def test_link_reports_duplicate_and_missing_symbols(self):
+        with tempfile.TemporaryDirectory() as project:
+            self.write(project, 'a.uh', 'func main() { helper() }')
+            self.write(project, 'b.uh', 'func main() { print("b") }')
+            with self.assertRaises(LinkError) as raised:
+                build_project(project)
+            self.assertEqual(raised.exception.problems, ["duplicate symbol 'main' in a.uh and b.uh",
+                                                         "undefined symbol 'helper' referenced in a.uh"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import unittest
+from src.bytecode import assemble, load_bytecode, BytecodeImage, OPCODES, LABEL, EXTERN, REG_ADDR
+from src.uhigh import UHighCompiler, CompileContext
+
+SOURCE = '''#include "stdio.print"
+LBL main
+    DB $100 "hi\\n"
+    MOV RAX 1
+    MOV RBX 100
+    CALL #printf
+    JMP #end
+    OUT RAX $RBX
+LBL end
+    HLT
+'''
+
+class TestBytecode(unittest.TestCase):
+    def test_labels_resolve_to_code_offsets(self):
+        image = BytecodeImage(assemble(SOURCE))
+        instrs = list(image.instructions())
+        self.assertEqual(image.labels['main'], 0)
+        jmp = [ops for _, opcode, ops in instrs if OPCODES[opcode] == 'JMP'][0]
+        self.assertEqual(jmp[0], (LABEL, image.labels['end']))
+        hlt_offset = [offset for offset, opcode, _ in instrs if OPCODES[opcode] == 'HLT'][0]
+        self.assertEqual(image.labels['end'], hlt_offset)
+        call = [ops for _, opcode, ops in instrs if OPCODES[opcode] == 'CALL'][0]
+        self.assertEqual(call[0][0], EXTERN)
+        self.assertEqual(image.string(call[0][1]), 'printf')
+        out = [ops for _, opcode, ops in instrs if OPCODES[opcode] == 'OUT'][0]
+        self.assertEqual(out[1][0], REG_ADDR)
+
+    def test_data_segment_and_includes(self):
+        image = BytecodeImage(assemble(SOURCE))
+        segments = [(addr, bytes(raw)) for addr, raw in image.data_segments()]
+        self.assertEqual(segments, [(100, b'hi\n')])
+        self.assertEqual((image.image_base, bytes(image.static_image)), (100, b'hi\n\0'))
+        self.assertEqual(image.includes, ['stdio.print'])
+
+    def test_load_memory_mapped_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'prog.mbc')
+            with open(path, 'wb') as f:
+                f.write(assemble(SOURCE))
+            with load_bytecode(path) as image:
+                text = image.disassemble()
+        self.assertEqual(assemble(text), assemble(SOURCE))
+
+    def test_compiled_image_is_the_mapped_data_segment(self):
+        context = CompileContext()
+        output = UHighCompiler().compile('var g = 42\nfunc main() { print("hi") print(g) }', '.', context)
+        layout = context.linked.layout
+        globals_area = next(region for region in layout.regions if region.kind == 'globals')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'prog.mbc')
+            with open(path, 'wb') as f:
+                f.write(assemble(output, context.linked.image(), layout.base))
+            with load_bytecode(path) as image:
+                self.assertEqual(image.image_base, layout.base)
+                self.assertEqual(bytes(image.static_image), context.linked.image())
+                cell = layout.address(globals_area) - layout.base
+                self.assertEqual(int.from_bytes(image.static_image[cell:cell + 8], 'little'), 42)
+                self.assertEqual([bytes(raw) for _, raw in image.data_segments()], [b'hi'])
+
+    def test_db_outside_the_image_is_rejected(self):
+        with self.assertRaises(ValueError):
+            assemble(SOURCE, b'hello\0', 100)
+
+    def test_unknown_instruction(self):
+        with self.assertRaises(ValueError):
+            assemble('FROB R1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+from src.passes import PassManager
+from evaluator import evaluate_functions
+from parser import FuncDecl, Print, Return
+
+def compile_at(code, level):
+    return UHighCompiler(passes=PassManager(level)).compile(code)
+
+def units_for(code):
+    compiler = UHighCompiler()
+    units = []
+    compiler.split_units(compiler.parse_source(code), units)
+    return units
+
+class TestEvaluator(unittest.TestCase):
+    def test_input_free_program_becomes_one_print(self):
+        code = '''func fib(n) {
+    if n < 2 {
+        return n
+    }
+    var m = n - 1
+    var a = fib(m)
+    m = n - 2
+    var b = fib(m)
+    a = a + b
+    return a
+}
+func main() {
+    var i = 1
+    print("Fibonacci:")
+    while i <= 10 {
+        var f = fib(i)
+        print(f)
+        i = i + 1
+    }
+}'''
+        expected = run_masm(compile_at(code, 2)).stdout
+        output = compile_at(code, 3)
+        self.assertEqual(run_masm(output).stdout, expected)
+        main = output.split('LBL main')[1]
+        self.assertEqual(main.count('CALL'), 1)
+        self.assertIn('CALL #printf', main)
+
+    def test_helper_result_is_precomputed(self):
+        code = '''func seven() {
+    var a = 3
+    a = a + 4
+    return a
+}
+func main() {
+    var x = 0
+    input x
+    var s = seven()
+    s = s + x
+    print(s)
+}'''
+        output = compile_at(code, 3)
+        self.assertIn('MOV RAX 7', output.split('LBL seven')[1].split('LBL main')[0])
+        self.assertIn('CALL #readint', output)  # main reads input, so it is compiled normally
+        self.assertEqual(run_masm(output, [5]).stdout, '12\n')
+
+    def test_effects_and_budget_fall_back_to_codegen(self):
+        units = units_for('''var total = 0
+func bump() {
+    total = total + 1
+}
+func spin() {
+    var i = 0
+    while i < 100 {
+        i = i + 1
+    }
+    print(i)
+}
+func main() {
+    spin()
+}''')
+        evaluated = dict(evaluate_functions(units, budget=50))
+        self.assertIs(evaluated['bump'], dict(units)['bump'])  # Writes a global
+        self.assertIs(evaluated['spin'], dict(units)['spin'])  # Needs more than 50 steps
+        evaluated = dict(evaluate_functions(units))
+        [spin] = evaluated['spin']
+        self.assertIsInstance(spin, FuncDecl)
+        self.assertEqual([type(node) for node in spin.body], [Print])
+        self.assertEqual(spin.body[0].values, ['"100"'])
+        [main] = evaluated['main']
+        self.assertEqual(main.body[0].values, ['"100"'])
+
+    def test_negative_results(self):
+        output = compile_at('func low() { var a = 2 a = a - 9 return a } func main() { var b = low() print(b) }', 3)
+        self.assertEqual(run_masm(output).stdout, '-7\n')
+        units = dict(evaluate_functions(units_for('func low() { var a = 2 a = a - 9 return a }')))
+        self.assertIsInstance(units['low'][0].body[0], Return)
+
+if __name__ == '__main__':
+    unittest.main()
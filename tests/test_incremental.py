@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.lexer import Lexer
+from src.parser import Parser
+from src.incremental import IncrementalParser, TextEdit
+
+SOURCE = '''var x = 1
+func a() {
+    print("a")
+}
+func b() {
+    if x == 1 {
+        print("b")
+    }
+    asm {
+        MOV RAX 1
+    }
+}
+func c() {
+    print("c")
+}
+'''
+
+def shape(program):
+    return [(s.__class__.__name__, getattr(s, 'name', None)) for s in program.statements]
+
+class TestIncrementalParser(unittest.TestCase):
+    def assert_matches_full_parse(self, document):
+        full = Parser(Lexer(document.source).tokenize()).parse()
+        self.assertEqual(shape(document.program), shape(full))
+
+    def test_edit_inside_function_reuses_other_subtrees(self):
+        document = IncrementalParser(SOURCE)
+        a, c = document.program.statements[1], document.program.statements[3]
+        start = SOURCE.index('"b"')
+        result = document.apply_edits([TextEdit(start, start + 3, '"bee"')])
+        self.assertEqual(result.changed_functions, ['b'])
+        self.assertEqual(result.removed_functions, [])
+        self.assertIs(result.program.statements[1], a)
+        self.assertIs(result.program.statements[3], c)
+        self.assertEqual(result.relexed[1], document.source.index('func c'))
+        self.assertEqual(result.program.statements[2].body[0].true_block[0].values, ['"bee"'])
+        self.assert_matches_full_parse(document)
+
+    def test_edit_inside_asm_block(self):
+        document = IncrementalParser(SOURCE)
+        result = document.apply_edits([TextEdit.from_range(SOURCE, (9, 16), (9, 17), '2\n        MOV RBX 3')])
+        self.assertEqual(result.changed_functions, ['b'])
+        self.assertEqual(document.program.statements[2].body[1].code.split(), ['MOV', 'RAX', '2', 'MOV', 'RBX', '3'])
+
+    def test_edits_applied_together_may_pass_through_invalid_text(self):
+        document = IncrementalParser(SOURCE)
+        close_a = SOURCE.index('}')
+        result = document.apply_edits([TextEdit(close_a, close_a + 1, ''), TextEdit(len(SOURCE) - 1, len(SOURCE) - 1, '}')])
+        self.assertEqual(result.changed_functions, ['a'])
+        self.assertEqual(result.removed_functions, ['b', 'c'])
+        self.assertEqual(len(document.program.statements[1].body), 3)
+        self.assert_matches_full_parse(document)
+
+    def test_comment_swallowing_later_statements_extends_region(self):
+        source = 'var x = 1 x = 2 x = 3 func f() { print(x) }'
+        document = IncrementalParser(source)
+        result = document.apply_edits([TextEdit(10, 10, '// ')])
+        self.assertEqual(shape(result.program), [('VarDecl', 'x')])
+        self.assertEqual(result.removed_functions, ['f'])
+        self.assertEqual(result.relexed, (0, len(document.source)))
+
+    def test_rename_and_remove_functions(self):
+        document = IncrementalParser(SOURCE)
+        start = SOURCE.index('func c')
+        result = document.apply_edits([TextEdit(start, len(SOURCE), ''), TextEdit(start - 1, start - 1, '\nfunc d() { }')])
+        self.assertEqual(result.changed_functions, ['d'])
+        self.assertEqual(result.removed_functions, ['c'])
+        self.assert_matches_full_parse(document)
+
+    def test_removed_declaration_is_reported(self):
+        document = IncrementalParser(SOURCE)
+        with self.assertRaises(RuntimeError):
+            document.apply_edits([TextEdit(0, len('var x = 1'), '')])
+        document.apply_edits([TextEdit(0, 0, 'var x = 2')])
+        self.assertEqual(document.program.statements[0].initial_value, '2')
+        self.assert_matches_full_parse(document)
+
+if __name__ == '__main__':
+    unittest.main()
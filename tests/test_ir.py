@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.passes import PassManager
+from src.ir import Instr, build_function, emit, lower, number_values, eliminate_dead_code
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+
+IF_WITHOUT_ELSE = '''LBL main
+    CMP R0 1
+    JNE #if_false_{{L0}}
+    LBL if_true_{{L0}}
+    MOV R1 2
+    JMP #if_end_{{L0}}
+    LBL if_false_{{L0}}
+    LBL if_end_{{L0}}
+    HLT
+    MOV R2 3
+'''
+
+def optimize(fn):
+    return PassManager().run('ir', fn)
+
+class TestIR(unittest.TestCase):
+    def test_build_splits_blocks_and_uses_three_address_arithmetic(self):
+        fn = build_function('f', ['LBL f', 'MOV R5 R1', 'ADD R5 R2', 'CMP R5 0', 'JE #L{{L0}}', 'SUB R5 R5', 'LBL L{{L0}}', 'RET'], 1)
+        self.assertEqual([block.label for block in fn.blocks], ['f', None, 'L{{L0}}'])
+        self.assertEqual(fn.blocks[0].instrs[0].args, ['R5', 'R1', 'R2'])
+        self.assertIs(fn.blocks[0].next, fn.blocks[1])
+        self.assertIs(fn.blocks[1].next, fn.blocks[2])
+        self.assertEqual([b.label for b in fn.successors(fn.blocks[0])], ['L{{L0}}', None])
+
+    def test_empty_else_and_dead_code_are_removed(self):
+        lines = emit(optimize(build_function('main', IF_WITHOUT_ELSE.split('\n'), 1)))
+        self.assertEqual([line.strip() for line in lines],
+                         ['LBL main', 'CMP R0 1', 'JNE #if_end_{{L0}}', 'MOV R1 2', 'LBL if_end_{{L0}}', 'HLT'])
+
+    def test_layout_follows_jumps_and_keeps_fall_off_block_last(self):
+        fn = build_function('main', ['LBL main', 'JMP #L{{L0}}', 'LBL L{{L1}}', 'RET'], 2)
+        fn.blocks[1:1] = build_function('main', ['LBL L{{L0}}', 'MOV R0 1', 'JMP #L{{L1}}'], 2).blocks
+        self.assertEqual([line.strip() for line in emit(optimize(fn))], ['LBL main', 'MOV R0 1', 'RET'])
+
+        lines = ['JMP #L{{L1}}', 'LBL L{{L0}}', 'RET', 'LBL L{{L1}}', 'MOV R0 1', 'JE #L{{L0}}', 'MOV R2 1']
+        fn = optimize(build_function('global', lines, 2))
+        self.assertEqual([line.strip() for line in emit(fn)], ['MOV R0 1', 'JNE #L{{L2}}', 'RET', 'LBL L{{L2}}', 'MOV R2 1'])
+        self.assertEqual(fn.label_count, 3)
+
+    def test_lower_binary_ops(self):
+        self.assertEqual(lower(Instr('ADD', ['R1', 'R1', 'R2'])), ['ADD R1 R2'])
+        self.assertEqual(lower(Instr('ADD', ['R1', 'R2', 'R1'])), ['ADD R1 R2'])
+        self.assertEqual(lower(Instr('SUB', ['R1', 'R2', 'R1'])), ['MOV R15 R2', 'SUB R15 R1', 'MOV R1 R15'])
+        self.assertEqual(lower(Instr('MUL', ['R3', 'R1', 'R2'])), ['MOV R3 R1', 'MUL R3 R2'])
+
+    def test_value_numbering_reuses_dominating_expressions(self):
+        lines = ['LBL main', 'MOV R7 R0', 'MOV R8 R1', 'MOV R9 R7', 'ADD R9 R8', 'CMP R9 10', 'JLE #L{{L0}}',
+                 'MOV R10 R0', 'MOV R11 R1', 'MOV R12 R10', 'ADD R12 R11', 'MOV R2 R12', 'LBL L{{L0}}',
+                 'MOV RAX 1', 'MOV RBX R2', 'CALL #printint', 'MOV RAX 1', 'MOV R13 2', 'MOV R14 3', 'MUL R13 R14', 'MOV RBX R13', 'CALL #printint', 'HLT']
+        fn = build_function('main', lines, 1)
+        fn.temporaries = {f"R{i}" for i in range(3, 15)}
+        number_values(fn)
+        eliminate_dead_code(fn)
+        self.assertEqual([line.strip() for line in emit(fn)],
+                         ['LBL main', 'MOV R9 R0', 'ADD R9 R1', 'CMP R9 10', 'JLE #L{{L0}}', 'MOV R2 R9', 'LBL L{{L0}}',
+                          'MOV RAX 1', 'MOV RBX R2', 'CALL #printint', 'MOV RBX 6', 'CALL #printint', 'HLT'])
+
+    def test_optimized_loops_keep_their_results(self):
+        code = ('func main() { var x = 1 var y = 2 var i = 0 var s = 0 '
+                'while i < 5 { s = x + y if s > 4 { s = x + y x = x - 1 } else { x = x + y } i = i + 1 } print(s) print(x) }')
+        output = UHighCompiler().compile(code)
+        self.assertEqual(run_masm(output).stdout, '5\n2\n')
+        self.assertEqual(output.count('ADD R'), 2)  # x + y once per iteration, i + 1
+
+if __name__ == '__main__':
+    unittest.main()
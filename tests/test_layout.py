@@ -0,0 +1,34 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.layout import Region, plan_layout, reachable
+
+class TestLayout(unittest.TestCase):
+    def test_permanent_regions_pack_in_order_with_alignment(self):
+        regions = [Region('a', 'strings', 3), Region('globals', 'globals', 16, 8), Region('b', 'strings', 2)]
+        layout = plan_layout(regions, 100)
+        self.assertEqual([layout.address(r) for r in regions], [100, 104, 120])
+        self.assertEqual((layout.size, layout.end), (22, 122))
+
+    def test_overlaid_regions_share_bytes_unless_they_conflict(self):
+        regions = [
+            Region('data', 'strings', 5),
+            Region('f', 'frame', 16, 8, {'h'}),
+            Region('g', 'frame', 24, 8, set()),
+            Region('h', 'frame', 8, 8, {'f'}),
+        ]
+        layout = plan_layout(regions, 0)
+        self.assertEqual([r.offset for r in regions], [0, 8, 8, 24])
+        self.assertEqual(layout.size, 32)
+        self.assertEqual(layout.requested(), 53)
+        self.assertIn('21 bytes shared', layout.report())
+
+    def test_reachable_follows_calls_transitively(self):
+        calls = {'main': {'a'}, 'a': {'b'}, 'b': {'a'}, 'c': set()}
+        self.assertEqual(reachable(calls, 'main'), {'a', 'b'})
+        self.assertIn('a', reachable(calls, 'a'))
+        self.assertEqual(reachable(calls, 'c'), set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.linker import CodeUnit, link, link_objects, label_marker, data_marker, global_marker, scratch_marker, frame_marker, INIT_LABEL
+
+class TestLinker(unittest.TestCase):
+    def test_link_renumbers_labels_and_data(self):
+        first = CodeUnit('a', [f"LBL L{label_marker(0)}", f"DB ${data_marker(0)} \"ab\""], 1, 3)
+        second = CodeUnit('b', [f"JMP #L{label_marker(0)}", f"MOV RBX {data_marker(1)}"], 1, 2)
+        result = link([first, second], label_base=5, data_base=100)
+        self.assertEqual(result.lines, [';; Static data: 5 bytes at 100..105', 'DB $100 "ab"', '',
+                                        'LBL L5', 'JMP #L6', 'MOV RBX 104'])
+        self.assertEqual(result.label_end, 7)
+        self.assertEqual(result.data_end, 105)
+        self.assertEqual(result.image(), b'ab\0\0\0')
+
+    def test_globals_area_follows_the_data_and_main_runs_the_initializers(self):
+        first = CodeUnit('global', [f"MOVTO 0 {global_marker(8)} 1"], 0, 3)
+        second = CodeUnit('main', ["LBL main", f"MOVADDR R0 0 {global_marker(0)}", f"MOV RBX {data_marker(0)}", "HLT"], 0, 2)
+        result = link([first, second], data_base=100)
+        self.assertEqual(result.lines[1:], ['LBL main', f'    CALL #{INIT_LABEL}', 'MOVADDR R0 0 112', 'MOV RBX 103', 'HLT',
+                                            f'LBL {INIT_LABEL}', 'MOVTO 0 120 1', '    RET'])
+        self.assertEqual(result.data_end, 128)
+
+    def test_image_holds_constant_global_initializers(self):
+        compiler = UHighCompiler()
+        first = compiler.compile_object('var a = 5\nconst b = 300\nvar c = 1\nc = 2\nvar d = c + 1\n'
+                                        'func main() { print("hi") }', name='a.uh')
+        second = compiler.compile_object('var e = 7 func f() { e = e + 1 }', name='b.uh')
+        image = link_objects([first, second], data_base=100).image()
+        self.assertEqual(image[:3], b'hi\0')
+        cell = lambda addr: int.from_bytes(image[addr - 100:addr - 92], 'little', signed=True)
+        self.assertEqual([cell(addr) for addr in range(104, 144, 8)], [5, 300, 0, 0, 7])  # b.uh's cell follows a.uh's
+
+    def test_scratch_is_shared_and_frames_overlay_when_disjoint(self):
+        units = [
+            CodeUnit('main', ["CALL #f", "CALL #g", f"MOV R0 {scratch_marker(0)}"], 0, 0, 256),
+            CodeUnit('f', [f"MOVTO 0 {frame_marker(8)} 1", "CALL #h", f"MOV R1 {scratch_marker(0)}", "RET"], 0, 0, 256, 16),
+            CodeUnit('g', [f"MOVTO 0 {frame_marker(0)} 2", "RET"], 0, 0, 0, 16),
+            CodeUnit('h', [f"MOVTO 0 {frame_marker(0)} 3", "RET"], 0, 0, 0, 8),
+        ]
+        result = link(units, data_base=100)
+        self.assertIn('MOV R0 104', result.lines)
+        self.assertIn('MOV R1 104', result.lines)
+        frames = {region.name: result.layout.address(region) for region in result.layout.regions if region.kind == 'frame'}
+        self.assertEqual(frames, {'f': 360, 'g': 360, 'h': 376})  # h runs inside f; g never does
+        self.assertIn('MOVTO 0 368 1', result.lines)
+        self.assertEqual(result.data_end, 384)
+        self.assertEqual(result.layout.requested('frame'), 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,5 +13,29 @@ class TestParser(unittest.TestCase):
         program = parser.parse()
         self.assertIsNotNone(program)
 
+    def test_parse_deep_nesting_without_recursion(self):
+        depth = 10000
+        opening = ''.join('if x == 1 { ' if i % 2 else 'while x < 1 { ' for i in range(depth))
+        code = 'func main() { var x = 1 ' + opening + 'print("deep")' + ' }' * depth + ' }'
+        program = Parser(Lexer(code).tokenize()).parse()
+        node = program.statements[0].body[1]
+        for _ in range(depth - 1):
+            node = (node.body if hasattr(node, 'body') else node.true_block)[0]
+        self.assertEqual(node.__class__.__name__, 'IfStatement')
+        self.assertEqual(node.true_block[0].values, ['"deep"'])
+
+    def test_parse_if_else(self):
+        code = 'var x = 1 if x == 1 { x = 2 } else { x = 3 } x = 4'
+        program = Parser(Lexer(code).tokenize()).parse()
+        self.assertEqual([s.__class__.__name__ for s in program.statements], ['VarDecl', 'IfStatement', 'Assignment'])
+        self.assertEqual(program.statements[1].false_block[0].value, '3')
+
+    def test_parameters_are_declared_and_calls_assign(self):
+        code = 'func add(a, b) { var c = a + b return c } func main() { var x = add(1, 2) x = add(x, 3) }'
+        program = Parser(Lexer(code).tokenize()).parse()
+        main = program.statements[1]
+        self.assertEqual(main.body[0].initial_value.__class__.__name__, 'FuncCall')
+        self.assertEqual(main.body[1].value.args, ['x', '3'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import tempfile
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+from src.stats import CompileStats
+from src.passes import PassManager
+
+CODE = '''func twice(n) {
+    var m = n * 2
+    print(m)
+}
+func outer(n) {
+    print("outer")
+    twice(n)
+}
+func main() {
+    var x = 5
+    outer(x)
+    print("a")
+    print("b")
+    print(x)
+}'''
+
+class TestPassManager(unittest.TestCase):
+    def test_levels_select_passes(self):
+        self.assertEqual([p.name for p in PassManager(0).pipeline()], ['save-live-registers'])
+        self.assertEqual([p.name for p in PassManager(1, disable=['order-blocks']).pipeline('ir')],
+                         ['thread-jumps', 'remove-unreachable', 'save-live-registers'])
+        self.assertIn('tail-calls', PassManager(0, enable=['tail-calls']).signature())
+        with self.assertRaises(ValueError):
+            PassManager(2, disable=['save-live-registers'])
+        with self.assertRaises(ValueError):
+            PassManager(2, enable=['no-such-pass'])
+
+    def test_config_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'config.json')
+            with open(path, 'w') as f:
+                json.dump({'optimization': {'level': 1, 'enable': ['tail-calls']}}, f)
+            passes = PassManager.from_config(path)
+            self.assertEqual(passes.level, 1)
+            self.assertIn('tail-calls', passes.signature())
+            self.assertEqual(PassManager.from_config(path, level=3, disable=['tail-calls']).enable, set())
+
+    def test_every_level_gives_the_same_output(self):
+        outputs = [UHighCompiler(passes=PassManager(level)).compile(CODE) for level in range(4)]
+        for output in outputs:
+            self.assertEqual(run_masm(output).stdout, 'outer\n10\na\nb\n5\n')
+        self.assertIn('JMP #twice', outputs[2])  # outer's last call returns straight to main
+        self.assertIn('CALL #twice', outputs[0])
+        self.assertLess(len(outputs[2].splitlines()), len(outputs[0].splitlines()))
+
+    def test_stats_report_each_pass(self):
+        stats = CompileStats()
+        UHighCompiler(stats=stats).compile(CODE)
+        stats.stop()
+        passes = stats.to_dict()['passes']
+        self.assertEqual(passes['coalesce-prints']['after'] - passes['coalesce-prints']['before'], -1)
+        self.assertEqual(passes['tail-calls']['calls'], 3)  # Once per function
+        self.assertEqual(passes['tail-calls']['after'] - passes['tail-calls']['before'], -1)
+        self.assertIn('eliminate-dead-code', stats.format_text())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import unittest
+from src.stats import CompileStats
+from src.uhigh import UHighCompiler
+
+class TestStats(unittest.TestCase):
+    def test_compile_records_phases_and_counters(self):
+        stats = CompileStats()
+        compiler = UHighCompiler(jobs=2, stats=stats)
+        compiler.compile('func f() { print("a") } func main() { var x = 1 if x == 1 { print("b") } f() }')
+        stats.stop()
+        report = json.loads(stats.report('json'))
+        for phase in ('lex', 'parse', 'analysis', 'codegen'):
+            self.assertIn(phase, report['phases'])
+            self.assertGreater(report['phases'][phase]['peak_bytes'], 0)
+        self.assertGreater(report['counters']['tokens'], 0)
+        self.assertEqual(report['counters']['labels'], 1)
+        self.assertEqual(report['counters']['data_bytes'], 4)
+        self.assertEqual(report['ast_nodes']['FuncDecl'], 2)
+        self.assertIn('codegen', stats.report('text'))
+
+    def test_nested_phase_counts_toward_outer_peak(self):
+        stats = CompileStats()
+        with stats.phase('codegen'):
+            with stats.phase('strings'):
+                buffer = bytearray(200000)
+            del buffer
+        stats.stop()
+        self.assertGreaterEqual(stats.phases['codegen'].peak_bytes, stats.phases['strings'].peak_bytes)
+        self.assertGreater(stats.phases['strings'].peak_bytes, 200000)
+
+if __name__ == '__main__':
+    unittest.main()
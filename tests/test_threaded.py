@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+from src.threaded import ThreadedMachine, run_threaded
+
+class TestThreadedMachine(unittest.TestCase):
+    def assertSameAsReference(self, source, inputs=()):
+        expected = run_masm(source, inputs)
+        actual = run_threaded(source, inputs)
+        self.assertEqual(actual.stdout, expected.stdout)
+        self.assertEqual(actual.steps, expected.steps)
+        self.assertEqual(actual.registers, expected.registers)
+        return actual
+
+    def test_compiled_program(self):
+        code = '''func main() {
+    var n = 0
+    var total = 0
+    input n
+    while n > 0 { total = total + n n = n - 1 }
+    print("total:")
+    print(total)
+}'''
+        vm = self.assertSameAsReference(UHighCompiler().compile(code), [10])
+        self.assertEqual(vm.stdout, 'total:\n55\n')
+        self.assertGreaterEqual(vm.fused, 3)  # printf, printint and the loop compare
+
+    def test_flag_read_by_later_block(self):
+        source = 'LBL main\nMOV R0 5\nCMP R0 3\nJE #eq\nJL #lt\nMOV R1 1\nHLT\nLBL eq\nHLT\nLBL lt\nMOV R1 2\nHLT'
+        vm = self.assertSameAsReference(source)
+        self.assertEqual(vm.registers['R1'], 1)
+
+    def test_calls_and_computed_return(self):
+        source = '''
+LBL twice
+    ADD R0 R0
+    RET
+LBL main
+    MOV R0 3
+    CALL #twice
+    CALL #twice
+    PUSH 8
+    RET
+    MOV R0 0
+    MOV R1 7
+    HLT
+'''
+        # The pushed 8 is a return address in the middle of a block
+        vm = self.assertSameAsReference(source)
+        self.assertEqual((vm.registers['R0'], vm.registers['R1']), (12, 7))
+
+    def test_translation_is_shared(self):
+        program = ThreadedMachine('LBL main\nMOV R0 1\nHLT').program
+        first, second = ThreadedMachine(program).run(), ThreadedMachine(program).run()
+        self.assertIsNot(first.blocks[0], second.blocks[0])
+        self.assertEqual(second.registers['R0'], 1)
+
+    def test_errors_raised_when_executed(self):
+        vm = run_threaded('LBL main\nJMP #end\nBOGUS R0\nLBL end\nHLT')
+        self.assertTrue(vm.halted)
+        with self.assertRaises(RuntimeError):
+            run_threaded('LBL main\nMOV R0 0\nDIV R1 R0\nHLT')
+        with self.assertRaises(RuntimeError):
+            run_threaded('LBL main\nJMP #main', max_steps=100)
+
+if __name__ == '__main__':
+    unittest.main()
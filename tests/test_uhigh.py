@@ -1,8 +1,12 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
 import unittest
-from src.uhigh import UHighCompiler
+from src.uhigh import UHighCompiler, CompileContext, LinkError
+from src.vm import run_masm
+from src.passes import PassManager, LEVELS
+from src.stats import CompileStats
 
 class TestUHighCompiler(unittest.TestCase):
     def test_compile_simple(self):
@@ -11,5 +15,181 @@ class TestUHighCompiler(unittest.TestCase):
         output = compiler.compile(code)
         self.assertIn('main', output)
 
+    def test_parallel_codegen_matches_serial(self):
+        funcs = ''.join(
+            f'func f{i}() {{ var a = {i} if a == {i} {{ print("in f{i}") }} while a < 3 {{ a = a + 1 }} }} '
+            for i in range(6))
+        code = funcs + 'func main() { f0() print("done") }'
+        serial = UHighCompiler().compile(code)
+        parallel = UHighCompiler(jobs=3).compile(code)
+        self.assertEqual(serial, parallel)
+        labels = [line.split()[1] for line in serial.split('\n') if line.strip().startswith('LBL')]
+        self.assertEqual(len(labels), len(set(labels)))
+        addrs = [line.split()[1] for line in serial.split('\n') if line.strip().startswith('DB')]
+        self.assertEqual(len(addrs), len(set(addrs)))
+
+    def test_compile_many_is_deterministic(self):
+        sources = [f'func f(n) {{ var m = n * {i} print(m) }} func main() {{ print("p{i}") f({i}) }}' for i in range(12)]
+        compiler = UHighCompiler()
+        serial = [compiler.compile(source) for source in sources]
+        self.assertEqual(compiler.compile(sources[0]), serial[0])  # Nothing carries over between calls
+        for threads in (1, 4, 12):
+            self.assertEqual(compiler.compile_many(sources, threads=threads), serial)
+        self.assertEqual(run_masm(serial[3]).stdout, 'p3\n9\n')
+
+    def test_compile_deep_nesting_without_recursion(self):
+        def nested(depth):
+            body = 'while x < 1 { ' * depth + 'print("deep")' + ' }' * depth
+            return 'func f() { var x = 1 ' + body + ' } func main() { f() }'
+
+        def generated_chars(code):
+            stats = CompileStats()
+            try:
+                UHighCompiler(stats=stats).compile(code)
+            finally:
+                stats.stop()
+            return stats.counters['codegen_chars']
+
+        # The text the IR parses grows about 4x for 4x the depth; indenting per level would make it 16x
+        self.assertLess(generated_chars(nested(400)), 5 * generated_chars(nested(100)))
+        depth = 10000
+        code = nested(depth)
+        serial = UHighCompiler().compile(code)
+        # Each loop exit is threaded to the enclosing loop's header, leaving one back edge
+        self.assertEqual(serial.count('JGE #L'), depth)
+        self.assertEqual(serial.count('JMP #L'), 1)
+        self.assertEqual(UHighCompiler(jobs=2).compile(code), serial)
+
+    def test_recursive_calls_keep_live_registers(self):
+        code = '''
+func fib(n) {
+    if n < 2 {
+        return n
+    }
+    var m = n - 1
+    var a = fib(m)
+    m = n - 2
+    var b = fib(m)
+    a = a + b
+    return a
+}
+func main() {
+    var x = fib(10)
+    print(x)
+}'''
+        output = UHighCompiler().compile(code)
+        self.assertNotIn('POP R', output.split('LBL fib')[1].split('CALL')[0])  # Parameters arrive in registers
+        self.assertEqual(run_masm(output).stdout, '55\n')
+
+    def test_stack_arguments_and_spilled_locals(self):
+        params = ', '.join(f"p{i}" for i in range(6))
+        locals_ = ' '.join(f"var v{i} = {i}" for i in range(12))
+        code = f'''
+func weigh({params}) {{
+    {locals_}
+    v11 = p0 - p5
+    v10 = v11 * p4
+    return v10
+}}
+func main() {{
+    var keep = 7
+    var r = weigh(9, 8, 7, 6, 5, 4)
+    print(r)
+    print(keep)
+}}'''
+        output = UHighCompiler().compile(code)
+        self.assertNotIn('ENTER', output)  # weigh is never re-entered, so its spilled locals have fixed addresses
+        self.assertIn(';; Static data: 60 bytes', output)
+        self.assertIn('ADD RSP 16', output)
+        self.assertNotRegex(output, r'R1[6-9]')
+        vm = run_masm(output)
+        self.assertEqual(vm.stdout, '25\n7\n')
+        self.assertEqual(vm.registers['RSP'], len(vm.memory))
+
+    def test_block_scopes_reuse_registers_and_slots(self):
+        blocks = '\n'.join('if 1 == 1 {\n' + '\n'.join(f"var b{j}_{i} = {i}" for i in range(14)) + f"\nprint(b{j}_13)\n}}"
+                           for j in range(3))
+        output = UHighCompiler().compile('func main() {\n' + blocks + '\n}')
+        self.assertIn(';; Static data: 28 bytes', output)  # Three spilled locals per block, sharing the same slots
+        self.assertNotRegex(output, r'R1[6-9]')
+        self.assertEqual(run_masm(output).stdout, '13\n13\n13\n')
+        with self.assertRaises(ValueError):
+            UHighCompiler().compile('func main() {\n if 1 == 1 {\n var t = 2\n }\n t = 3\n}')
+
+    def test_recursive_functions_keep_stack_frames(self):
+        locals_ = ' '.join(f"var v{i} = n" for i in range(12))
+        code = f'''
+func down(n) {{
+    {locals_}
+    if n > 0 {{
+        var m = n - 1
+        down(m)
+    }}
+    print(v11)
+}}
+func spill(n) {{
+    {locals_}
+    v11 = v11 * 2
+    print(v11)
+}}
+func also(n) {{
+    {locals_}
+    print(v11)
+}}
+func main() {{
+    down(2)
+    spill(5)
+    also(3)
+}}'''
+        output = UHighCompiler().compile(code)
+        self.assertEqual(output.count('ENTER'), 1)
+        self.assertIn(';; Static data: 20 bytes', output)  # spill and also are never active together
+        self.assertEqual(run_masm(output).stdout, '0\n1\n2\n10\n3\n')
+
+    def test_formatted_prints_share_a_static_buffer(self):
+        output = UHighCompiler().compile('func main() { var i = 0 while i < 3 { print("n=%d", i) i = i + 1 } print("%d!", i) }')
+        self.assertNotIn('Memory.allocate', output)
+        self.assertIn(';; Static data: 268 bytes', output)  # 9 bytes of strings, padding to a word, one 256-byte buffer
+        self.assertEqual(run_masm(output).stdout, 'n=0\nn=1\nn=2\n3!\n')
+
+    def test_globals_live_in_static_cells(self):
+        globals_ = '\n'.join(f"var g{i} = 0" for i in range(20))
+        code = globals_ + '''
+func bump(n) {
+    g19 = g19 + n
+}
+func main() {
+    g0 = 5
+    bump(4)
+    bump(6)
+    print(g19)
+    print(g0)
+}'''
+        output = UHighCompiler().compile(code)
+        self.assertNotRegex(output, r'R1[6-9]')
+        self.assertEqual(run_masm(output).stdout, '10\n5\n')
+
+    def test_main_sees_global_initializers(self):
+        code = 'var g = 5\nvar h = g * 3\nfunc show() { print(h) }\nfunc main() { print(g) show() }'
+        for level in LEVELS:
+            output = UHighCompiler(passes=PassManager(level)).compile(code)
+            self.assertEqual(run_masm(output).stdout, '5\n15\n')
+
+    def test_string_arguments_point_at_their_data(self):
+        code = 'func g(s) { print(s) }\nfunc main() { print("x") g("hello") var t = g("hi") t = g("yo") }'
+        vm = run_masm(UHighCompiler().compile(code))
+        lines = vm.stdout.split('\n')
+        self.assertEqual(lines[0], 'x')
+        self.assertEqual([vm.load_string(int(addr)) for addr in lines[1:4]], ['hello', 'hi', 'yo'])
+
+    def test_duplicate_functions_across_includes_are_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'other.uh'), 'w') as f:
+                f.write('func main() { print("other") }')
+            context = CompileContext(directory, 'main.uh')
+            with self.assertRaises(LinkError) as raised:
+                UHighCompiler().compile('include "other.uh"\nfunc main() { print("main") }', directory, context)
+            self.assertEqual(raised.exception.problems, ["duplicate symbol 'main' in other.uh and main.uh"])
+
 if __name__ == '__main__':
     unittest.main()
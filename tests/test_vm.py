@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from src.uhigh import UHighCompiler
+from src.vm import run_masm
+
+class TestVirtualMachine(unittest.TestCase):
+    def test_loop_and_externals(self):
+        source = '''
+LBL main
+    DB $100 "sum"
+    MOV R0 0
+    MOV R1 0
+LBL loop
+    CALL #readint
+    CMP RAX 0
+    JE #done
+    ADD R0 RAX
+    INC R1
+    JMP #loop
+LBL done
+    MOV RAX 1
+    MOV RBX 100
+    CALL #printf
+    MOV RBX R0
+    CALL #printint
+    HLT
+'''
+        vm = run_masm(source, [4, 5, 0])
+        self.assertEqual(vm.stdout, 'sum\n9\n')
+        self.assertEqual(vm.registers['R1'], 2)
+        self.assertEqual(vm.steps, 23)
+
+    def test_call_ret_and_frames(self):
+        source = 'LBL f\nENTER 16\nMOVTO RBP -8 R0\nMOVADDR R1 RBP -8\nLEAVE\nRET\nLBL main\nMOV R0 7\nCALL #f\nHLT'
+        vm = run_masm(source)
+        self.assertEqual(vm.registers['R1'], 7)
+        self.assertEqual(vm.registers['RSP'], len(vm.memory))
+
+    def test_step_budget(self):
+        with self.assertRaises(RuntimeError):
+            run_masm('LBL main\nJMP #main', max_steps=100)
+
+    def test_compiled_program_with_input(self):
+        code = 'func main() { var n = 0 var total = 0 input n while n > 0 { total = total + n n = n - 1 } print(total) }'
+        self.assertEqual(run_masm(UHighCompiler().compile(code), [10]).stdout, '55\n')
+
+if __name__ == '__main__':
+    unittest.main()